@@ -1,9 +1,15 @@
 import streamlit as st
-import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
-from sklearn.preprocessing import StandardScaler
-from sklearn.cluster import KMeans
+from src.data_cleaning import PERSONALITY_TRAITS, CLEANED_DRUG_COLS
+from src.artifact_cache import ArtifactCache
+from src.cube import AggregateCube
+from src.clustering import ClusteringService
+from src.bitmap_index import BitmapIndex
+from src.dashboard_service import DashboardService
+from src.tracing import tracing_from_env
+from src.lazy_import import enable_headless
+
+# Figures are rendered server-side and sent as images, so matplotlib never needs an interactive backend
+enable_headless()
 
 
 
@@ -21,12 +27,57 @@ Explore how **personality traits** and **demographics** influence **drug use pat
 """)
 
 # --- LOAD DATA ---
+FILEPATH_RAW = 'data/raw/Drug_Consumption.csv'
+
+# Set DRUG_CONSUMPTION_TRACE=<file>.json to write a Chrome trace of the cleaning stages and dashboard sections on every rerun
+tracer, trace_path = tracing_from_env()
+
+# Only the columns the dashboard filters on or plots are read
+DASHBOARD_COLS = ['id', 'age', 'gender', 'education'] + PERSONALITY_TRAITS + CLEANED_DRUG_COLS + ['drug_intensity_position']
+
+# One artifact cache for every loader, so its entry key is computed once per raw file version
+@st.cache_resource
+def load_artifact_cache():
+    return ArtifactCache()
+
+# Cleaned once per raw file and cleaning version; later starts only look the cleaned Parquet up in the artifact cache
 @st.cache_data
 def load_data():
-    df = pd.read_csv('cleaned_drug_consumption.csv') 
-    return df
+    return load_artifact_cache().load(FILEPATH_RAW, columns=DASHBOARD_COLS)
+
+# Built once per data load; filter changes only merge precomputed cells
+@st.cache_resource
+def load_cube():
+    return AggregateCube(load_data())
+
+# Keeps fitted cluster models across reruns and sessions; features are scaled with the saved dataset-wide statistics
+@st.cache_resource
+def load_clustering_service():
+    return ClusteringService(n_clusters=3, random_state=42, scaler=load_artifact_cache().load_feature_scaler(FILEPATH_RAW))
+
+# Packed bitsets per demographic value, so filtering never scans the string columns
+@st.cache_resource
+def load_bitmap_index():
+    return BitmapIndex(load_data())
+
+# Per-drug level counts and trait sums stored with the cleaned data; the barplot is drawn from these totals
+@st.cache_resource
+def load_usage_histogram():
+    return load_artifact_cache().load_usage_histogram(FILEPATH_RAW)
+
+# Bootstrap confidence intervals of the barplot means, computed once and stored with the cleaned data
+@st.cache_resource
+def load_bootstrap_intervals():
+    return load_artifact_cache().load_bootstrap_intervals(FILEPATH_RAW)
+
+# Shared by all sessions; starts computing the default (unfiltered) view as soon as the app starts
+@st.cache_resource
+def load_dashboard_service():
+    return DashboardService(load_data(), load_cube(), load_bitmap_index(), load_clustering_service(),
+                            histogram=load_usage_histogram(), intervals=load_bootstrap_intervals())
 
 df = load_data()
+load_dashboard_service()
 
 # --- SIDEBAR FILTERS ---
 st.sidebar.header("🎚️ Filter Options")
@@ -53,29 +104,30 @@ selected_education = st.sidebar.multiselect(
 
 # Apply filters
 
-filtered_df = df[
-    (df["gender"].isin(selected_gender)) &
-    (df["age"].isin(selected_age)) &
-    (df["education"].isin(selected_education))
-]
-
-st.markdown("### 📊 Data Overview")
-st.write(f"Showing **{filtered_df.shape[0]}** participants after filters applied.")
-st.dataframe(filtered_df.head())
+selection = {"gender": selected_gender, "age": selected_age, "education": selected_education}
 
 selected_drug = st.sidebar.selectbox("Select Drug:", ['alcohol', 'amphetamine', 'amyl_nitrate', 'benzodiazepines', 'caffeine', 'cannabis', 'chocolate', 'cocaine', 'crack_cocaine', 'ecstasy', 'heroin', 'ketamine', 'legal_highs', 'lsd', 'methamphetamine', 'magic_mushrooms', 'nicotine', 'semer', 'volatile_solvent_abuse'])
 
+# Every section is computed concurrently by the service. The new request is submitted before the previous one is
+# withdrawn, so sections both need keep running and only work nothing waits for any more is cancelled
+service = load_dashboard_service()
+previous_request = st.session_state.get("section_request")
+section_request = service.submit({"selection": selection, "trait": selected_trait, "drug": selected_drug})
+if previous_request is not None:
+    previous_request.cancel()
+st.session_state["section_request"] = section_request
+
+# The page layout is written first with a placeholder per section, then each placeholder is filled as its section finishes
+st.markdown("### 📊 Data Overview")
+sections = {"overview": st.empty()}
+
 # --- MAIN DASHBOARD ---
 st.subheader(f"{selected_trait} vs {selected_drug} Usage")
-
-fig, ax = plt.subplots(figsize=(8, 5))
-sns.barplot(x=selected_drug, y=selected_trait, data=df, errorbar=None, palette="coolwarm")
-plt.title(f"{selected_trait} vs {selected_drug} Usage", fontsize=14, fontweight="bold")
-st.pyplot(fig)
+sections["barplot"] = st.empty()
 
 # --- ADD SUMMARY STATS ---
 st.subheader("📊 Summary Statistics")
-st.write(df.describe())
+sections["summary"] = st.empty()
 
 # --- ADD INSIGHT ---
 st.markdown("""
@@ -85,23 +137,7 @@ Higher impulsivity and sensation seeking scores are often linked to higher usage
 
 # ---------------- CORRELATION HEATMAPS ----------------
 st.markdown("## 📈 Correlation Heatmaps: Personality Traits vs Drug Use")
-
-trait_cols = [
-        'neuroticism_nscore', 'extraversion_escore', 'openness_oscore',
-        'agreeableness_ascore', 'conscientiousness_cscore',
-        'impulsivity_impulsive', 'sensation_seeking_ss'
-    ]
-
-drug_cols = [
-    'alcohol', 'amphetamine', 'amyl_nitrate', 'benzodiazepines', 'caffeine', 'cannabis', 'chocolate', 'cocaine', 'crack_cocaine', 'ecstasy', 'heroin', 'ketamine', 'legal_highs', 'lsd', 'methamphetamine', 'magic_mushrooms', 'nicotine', 'semer', 'volatile_solvent_abuse'
-    ]
-
-corr = filtered_df[trait_cols + drug_cols].corr()
-
-fig, ax = plt.subplots(figsize=(12, 8))
-sns.heatmap(corr, cmap="coolwarm", annot=False)
-plt.title("Correlation Between Personality Traits and Drug Use", fontsize=14, fontweight="bold")
-st.pyplot(fig)
+sections["heatmap"] = st.empty()
 
 st.markdown("""
 **Interpretation:**  
@@ -111,29 +147,7 @@ st.markdown("""
 
 # ---------------- CLUSTER VISUALIZATION ----------------
 st.markdown("## 🧠 Cluster Visualization: Grouping Users by Drug Use Intensity")
-
-# Select columns for clustering
-cluster_features = filtered_df[trait_cols + drug_cols].dropna()
-
-# Scale data
-scaler = StandardScaler()
-scaled_data = scaler.fit_transform(cluster_features)
-
-# Apply KMeans clustering
-kmeans = KMeans(n_clusters=3, random_state=42)
-filtered_df['Cluster'] = kmeans.fit_predict(scaled_data)
-
-# Visualize clusters (using impulsivity and sensation seeking)
-fig, ax = plt.subplots(figsize=(8, 6))
-sns.scatterplot(
-    data=filtered_df,
-    x='impulsivity_impulsive',
-    y='sensation_seeking_ss',
-    hue='Cluster',
-    palette='Set2'
-)
-plt.title("Clusters Based on Personality and Drug Use", fontsize=14, fontweight='bold')
-st.pyplot(fig)
+sections["clusters"] = st.empty()
 
 st.markdown("""
 **Interpretation:**  
@@ -144,20 +158,7 @@ st.markdown("""
 
 # ---------------- DEMOGRAPHIC INSIGHTS ----------------
 st.markdown("## 🎚️ Demographic Influence on Drug Use Intensity")
-
-fig, ax = plt.subplots(1, 3, figsize=(18, 6))
-
-sns.boxplot(x="age", y="drug_intensity_position", data=filtered_df, ax=ax[0], hue="age", legend=False, palette="Blues")
-ax[0].set_title("Drug Use Intensity by Age Group")
-
-sns.boxplot(x="gender", y="drug_intensity_position", data=filtered_df, ax=ax[1], hue="gender", legend=False, palette="Set2")
-ax[1].set_title("Drug Use Intensity by Gender")
-
-sns.boxplot(x="education", y="drug_intensity_position", data=filtered_df, ax=ax[2], hue="education", legend=False, palette="viridis")
-ax[2].set_title("Drug Use Intensity by Education")
-
-plt.tight_layout()
-st.pyplot(fig)
+sections["boxplots"] = st.empty()
 
 st.markdown("""
 **Key Takeaways:**  
@@ -166,6 +167,23 @@ st.markdown("""
 - Higher education levels are linked with lower overall drug consumption.
 """)
 
+for placeholder in sections.values():
+    placeholder.caption("Loading…")
+
+for name, future in section_request.as_completed():
+    payload = future.result()
+    with sections[name].container():
+        if name == "overview":
+            st.write(f"Showing **{payload['count']}** participants after filters applied.")
+            st.dataframe(payload["head"])
+        elif name == "summary":
+            st.write(payload)
+        else:
+            st.image(payload, width="stretch")
+
+if tracer is not None:
+    tracer.save(trace_path)
+
 # ---------------- PROJECT INSIGHTS ----------------
 st.markdown("## 🧩 Key Findings & Insights")
 
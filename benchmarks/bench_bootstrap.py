@@ -0,0 +1,49 @@
+"""
+Benchmarks bootstrap_trait_means (src/bootstrap.py), the bootstrap confidence intervals of every trait mean per drug
+level, on synthetic cleaned data for several worker counts and checks that every run gives the same intervals.
+
+Run from the repository root:
+    python benchmarks/bench_bootstrap.py --rows 10k --replicates 1000 --workers 1,2,4,8
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from synthetic import parse_rows, write_raw_csv
+from src.bootstrap import bootstrap_trait_means
+from src.pipeline import build_default_pipeline
+
+
+def run_benchmark(n_rows: int, replicates: int, worker_counts: list, seed: int = 0) -> pd.DataFrame:
+    with tempfile.TemporaryDirectory() as work_dir:
+        raw_path, cleaned_path = os.path.join(work_dir, 'raw.csv'), os.path.join(work_dir, 'cleaned.csv')
+        write_raw_csv(raw_path, n_rows, seed)
+        build_default_pipeline().run(raw_path, cleaned_path)
+        cleaned = pd.read_csv(cleaned_path)
+
+    rows, reference = [], None
+    for workers in worker_counts:
+        start = time.perf_counter()
+        intervals = bootstrap_trait_means(cleaned, replicates=replicates, workers=workers)
+        seconds = time.perf_counter() - start
+        reference = intervals if reference is None else reference
+        rows.append({'workers': workers, 'seconds': round(seconds, 3), 'groups': len(intervals),
+                     'identical': intervals.equals(reference)})
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the bootstrap confidence intervals of the trait x drug level grid.')
+    parser.add_argument('--rows', default='10k', help='synthetic rows, e.g. 10k or 100k')
+    parser.add_argument('--replicates', type=int, default=1000)
+    parser.add_argument('--workers', default=str(os.cpu_count()), help='comma separated worker counts')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    worker_counts = [int(workers) for workers in args.workers.split(',')]
+    print(run_benchmark(parse_rows(args.rows), args.replicates, worker_counts, args.seed).to_string(index=False))
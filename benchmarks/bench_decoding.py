@@ -0,0 +1,81 @@
+"""
+Benchmarks the vectorized decoding engine (src/decoding.py) against the original dict .replace() functions.
+
+Run from the repository root:
+    python benchmarks/bench_decoding.py --repeat 100
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src.data_cleaning import RAW_DRUG_COLS, AGE_COLS, convert_drug_use_ratings, convert_to_midpoint, convert_usage_frequency_to_labels
+
+FILEPATH_RAW = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'raw', 'Drug_Consumption.csv')
+
+
+# Original implementations, kept here only as the baseline to compare against
+
+def replace_drug_use_ratings(df: pd.DataFrame, drug_cols: list) -> pd.DataFrame:
+    category_dict = {'CL0': 0, 'CL1': 1, 'CL2': 2, 'CL3': 3, 'CL4': 4, 'CL5': 5, 'CL6': 6}
+    df[drug_cols] = df[drug_cols].replace(category_dict)
+    return df
+
+
+def replace_to_midpoint(df: pd.DataFrame, age_col: list) -> pd.DataFrame:
+    midpoint_dict = {'18-24': 21, '25-34': 29.5, '35-44': 39.5, '45-54': 49.5, '55-64': 59.5, '65+': 70}
+    df[age_col] = df[age_col].replace(midpoint_dict)
+    return df
+
+
+def replace_usage_frequency_labels(df: pd.DataFrame) -> pd.DataFrame:
+    frequency_labels_dict = {0: 'Never Used', 1: 'Used Over a Decade Ago', 2: 'Used in Last Decade', 3: 'Used in Last Year',
+                             3.6: 'Used in Last Year', 4: 'Monthly User', 5: 'Weekly User', 6: 'Daily User'}
+    df['usage_frequency_label'] = df['usage_frequency'].replace(frequency_labels_dict)
+    return df
+
+
+# Times func on a fresh copy of df and returns the best wall time in seconds
+def time_function(func, df: pd.DataFrame, *args, runs: int = 3) -> float:
+    best = float('inf')
+    for _ in range(runs):
+        df_copy = df.copy()
+        start = time.perf_counter()
+        func(df_copy, *args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_benchmark(repeat: int, runs: int = 3) -> pd.DataFrame:
+    raw = pd.read_csv(FILEPATH_RAW)
+    df = pd.concat([raw] * repeat, ignore_index=True)
+    frequency = pd.DataFrame({'usage_frequency': [0, 1, 2, 3, 3.6, 4, 5, 6] * (len(df) // 8 + 1)}).iloc[:len(df)]
+
+    cases = [
+        ('drug ratings', replace_drug_use_ratings, convert_drug_use_ratings, df, (RAW_DRUG_COLS,)),
+        ('age midpoints', replace_to_midpoint, convert_to_midpoint, df, (AGE_COLS,)),
+        ('frequency labels', replace_usage_frequency_labels, convert_usage_frequency_to_labels, frequency, ()),
+    ]
+
+    rows = []
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', FutureWarning)
+        for name, baseline, engine, data, args in cases:
+            baseline_time = time_function(baseline, data, *args, runs=runs)
+            engine_time = time_function(engine, data, *args, runs=runs)
+            rows.append({'step': name, 'rows': len(data), 'replace_s': round(baseline_time, 4),
+                         'engine_s': round(engine_time, 4), 'speedup': round(baseline_time / engine_time, 1)})
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark CL-code, age band and label decoding.')
+    parser.add_argument('--repeat', type=int, default=100, help='times the 1,885-row raw dataset is tiled')
+    parser.add_argument('--runs', type=int, default=3, help='runs per function, the best one is reported')
+    args = parser.parse_args()
+    print(run_benchmark(args.repeat, args.runs).to_string(index=False))
@@ -0,0 +1,125 @@
+"""
+Import-time regression check: imports every src module in a fresh interpreter, times it and checks that none of the
+plotting, machine learning or dashboard packages (LAZY_PACKAGES) is loaded by the import itself, since those are
+imported lazily on first use (src/lazy_import.py). Times are compared with the "imports" section of
+benchmarks/baselines.json, the same way bench_suite.py compares its cases.
+
+Run from the repository root:
+    python benchmarks/bench_imports.py
+    python benchmarks/bench_imports.py --save-baseline
+    python benchmarks/bench_imports.py --fail-on-regression
+
+The pandas row is the floor every module pays; a module regresses when it is more than --tolerance slower than its
+baseline (and at least NOISE_FLOOR_SECONDS slower) even after CONFIRM_RUNS more timings, or when importing it loads a
+lazy package.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bench_suite import FILEPATH_BASELINES, REGRESSION_TOLERANCE, load_baselines
+
+# Creates global constants for the import-time check
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+IMPORT_MODULES = [
+    'pandas', 'src.decoding', 'src.scoring', 'src.scaling', 'src.data_cleaning', 'src.pipeline', 'src.lazy',
+    'src.schema', 'src.storage', 'src.cube', 'src.usage_histogram', 'src.bootstrap', 'src.risk_model', 'src.artifact_cache',
+    'src.wave_registry', 'src.risk_service', 'src.clustering', 'src.visualization', 'src.figure_cache',
+    'src.dashboard_service', 'src.render_report',
+]
+LAZY_PACKAGES = ['matplotlib', 'seaborn', 'sklearn', 'scipy', 'streamlit']
+NOISE_FLOOR_SECONDS = 0.2   # import times of one module vary by up to ~0.2 s from run to run
+CONFIRM_RUNS = 5            # a module that looks slower is timed again this many times before it counts as a regression
+
+# Run in a fresh interpreter per measurement: times one import and reports which lazy packages it loaded
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+__import__(sys.argv[1])
+seconds = time.perf_counter() - start
+print(json.dumps({'seconds': seconds, 'loaded': [name for name in sys.argv[2:] if name in sys.modules]}))
+"""
+
+
+def measure_import(module: str, runs: int) -> tuple:
+    best, loaded = float('inf'), []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT, module] + LAZY_PACKAGES, cwd=ROOT_DIR,
+                                capture_output=True, text=True, check=True).stdout
+        result = json.loads(output)
+        best, loaded = min(best, result['seconds']), result['loaded']
+    return best, loaded
+
+
+"""Adds baseline_s, time_ratio and status ('ok', 'regression', 'faster', 'new' or 'eager') to the results."""
+def compare_with_baselines(results: pd.DataFrame, baselines: dict, tolerance: float = REGRESSION_TOLERANCE) -> pd.DataFrame:
+    stored = baselines.get('imports', {})
+    statuses = []
+    for row in results.itertuples():
+        baseline = stored.get(row.module)
+        if row.module != 'pandas' and row.loaded:
+            statuses.append('eager')
+        elif baseline is None:
+            statuses.append('new')
+        elif row.seconds > baseline * (1 + tolerance) and row.seconds - baseline > NOISE_FLOOR_SECONDS:
+            statuses.append('regression')
+        elif row.seconds < baseline / (1 + tolerance) and baseline - row.seconds > NOISE_FLOOR_SECONDS:
+            statuses.append('faster')
+        else:
+            statuses.append('ok')
+    results = results.assign(baseline_s=[stored.get(module) for module in results['module']], status=statuses)
+    results['time_ratio'] = results['seconds'] / results['baseline_s'].astype(float)
+    return results
+
+
+# Stores the import times in the "imports" section of the baselines, keeping the modules that were not run
+def save_baselines(results: pd.DataFrame, filepath: str = FILEPATH_BASELINES) -> None:
+    baselines = load_baselines(filepath)
+    baselines.setdefault('imports', {}).update({row.module: round(row.seconds, 6) for row in results.itertuples()})
+    with open(filepath, 'w') as baseline_file:
+        json.dump(baselines, baseline_file, indent=2)
+        baseline_file.write('\n')
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description='Time the import of every src module and check that heavy packages load lazily.')
+    parser.add_argument('--modules', default=','.join(IMPORT_MODULES), help='comma separated modules to import')
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per module, the fastest one is reported')
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE, help='allowed slowdown before a module regresses')
+    parser.add_argument('--baselines', default=FILEPATH_BASELINES, help='baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='store these times as the new baselines')
+    parser.add_argument('--fail-on-regression', action='store_true', help='exit with status 1 when a module regresses or loads a lazy package')
+    args = parser.parse_args(argv)
+
+    rows = []
+    for module in args.modules.split(','):
+        seconds, loaded = measure_import(module.strip(), args.runs)
+        rows.append({'module': module.strip(), 'seconds': seconds, 'loaded': ','.join(loaded)})
+    results = pd.DataFrame(rows)
+
+    # A single slow interpreter start is noise: re-time the modules that look slower and keep their fastest time
+    baselines = load_baselines(args.baselines)
+    report = compare_with_baselines(results, baselines, args.tolerance)
+    for position in report.index[report['status'] == 'regression']:
+        seconds, _ = measure_import(results.at[position, 'module'], CONFIRM_RUNS)
+        results.at[position, 'seconds'] = min(results.at[position, 'seconds'], seconds)
+    report = compare_with_baselines(results, baselines, args.tolerance)
+    print(report.to_string(index=False, float_format=lambda value: f'{value:.4f}'))
+    if args.save_baseline:
+        save_baselines(results, args.baselines)
+        print(f'\nSaved baselines to {args.baselines}')
+
+    failures = report[report['status'].isin(['regression', 'eager'])]
+    if len(failures):
+        print(f'\n{len(failures)} module(s) regressed or loaded a lazy package at import')
+    return 1 if args.fail_on_regression and len(failures) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""
+Benchmarks the sharded ParallelCleaningPipeline (src/pipeline.py) against the serial CleaningPipeline on synthetic raw
+data and checks that every run writes the same cleaned CSV as the serial one.
+
+Run from the repository root:
+    python benchmarks/bench_parallel.py --rows 10m --workers 1,2,4,8,16,32 --chunksize 250k
+"""
+import argparse
+import filecmp
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from synthetic import parse_rows, write_raw_csv
+from src.pipeline import build_default_pipeline
+
+
+def time_run(raw_path: str, output_path: str, chunksize: int, workers: int = None) -> float:
+    start = time.perf_counter()
+    build_default_pipeline(chunksize, workers).run(raw_path, output_path)
+    return time.perf_counter() - start
+
+
+def run_benchmark(n_rows: int, worker_counts: list, chunksize: int, seed: int = 0) -> pd.DataFrame:
+    with tempfile.TemporaryDirectory() as work_dir:
+        raw_path = os.path.join(work_dir, 'raw.csv')
+        serial_path = os.path.join(work_dir, 'serial.csv')
+        parallel_path = os.path.join(work_dir, 'parallel.csv')
+        write_raw_csv(raw_path, n_rows, seed)
+
+        serial_time = time_run(raw_path, serial_path, chunksize)
+        rows = [{'workers': 'serial', 'seconds': round(serial_time, 3), 'speedup': 1.0, 'identical': True}]
+        for workers in worker_counts:
+            seconds = time_run(raw_path, parallel_path, chunksize, workers)
+            rows.append({'workers': workers, 'seconds': round(seconds, 3), 'speedup': round(serial_time / seconds, 2),
+                         'identical': filecmp.cmp(serial_path, parallel_path, shallow=False)})
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the parallel cleaning pipeline against the serial one.')
+    parser.add_argument('--rows', default='1m', help='synthetic rows, e.g. 1m or 10m')
+    parser.add_argument('--workers', default=str(os.cpu_count()), help='comma separated worker counts')
+    parser.add_argument('--chunksize', default='100k', help='rows per chunk (serial) and per shard (parallel)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    worker_counts = [int(workers) for workers in args.workers.split(',')]
+    print(run_benchmark(parse_rows(args.rows), worker_counts, parse_rows(args.chunksize), args.seed).to_string(index=False))
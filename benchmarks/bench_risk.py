@@ -0,0 +1,97 @@
+"""
+Benchmarks the heavy-user risk model (src/risk_model.py) and its HTTP service (src/risk_service.py) on synthetic
+cleaned data: batch scoring throughput (rows/s) of predict_proba for several row counts, in-process latency of
+score_record, and the request latency and throughput of POST /score against a local server.
+
+Run from the repository root:
+    python benchmarks/bench_risk.py --rows 10k --batch-rows 10k,100k,1m,5m --requests 2000
+"""
+import argparse
+import http.client
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from synthetic import parse_rows, write_raw_csv
+from src.pipeline import build_default_pipeline
+from src.risk_model import RiskModel
+from src.risk_service import make_server
+
+
+def _latency_row(name: str, seconds: np.ndarray) -> dict:
+    return {'benchmark': name, 'calls': len(seconds), 'p50_us': round(np.percentile(seconds, 50) * 1e6, 1),
+            'p99_us': round(np.percentile(seconds, 99) * 1e6, 1), 'per_second': round(len(seconds) / seconds.sum())}
+
+
+# Respondent dicts as a screening tool would send them (cleaned feature values only)
+def _records(cleaned: pd.DataFrame, model: RiskModel, n: int) -> list:
+    features = cleaned[model.numeric_features + model.categorical_features].astype({col: str for col in model.categorical_features})
+    return features.head(n).to_dict('records')
+
+
+def run_benchmark(n_rows: int, batch_rows: list, n_requests: int, seed: int = 0) -> pd.DataFrame:
+    with tempfile.TemporaryDirectory() as work_dir:
+        raw_path, cleaned_path = os.path.join(work_dir, 'raw.csv'), os.path.join(work_dir, 'cleaned.csv')
+        write_raw_csv(raw_path, n_rows, seed)
+        build_default_pipeline().run(raw_path, cleaned_path)
+        cleaned = pd.read_csv(cleaned_path)
+
+    start = time.perf_counter()
+    model = RiskModel().fit(cleaned)
+    rows = [{'benchmark': 'fit', 'rows': len(cleaned), 'seconds': round(time.perf_counter() - start, 3), 'roc_auc': round(model.metrics['roc_auc'], 3)}]
+
+    rng = np.random.default_rng(seed)
+    for size in batch_rows:
+        batch = cleaned.iloc[rng.integers(0, len(cleaned), size)].reset_index(drop=True)
+        start = time.perf_counter()
+        model.predict_proba(batch)
+        seconds = time.perf_counter() - start
+        rows.append({'benchmark': 'predict_proba', 'rows': size, 'seconds': round(seconds, 3), 'per_second': round(size / seconds)})
+
+    records = _records(cleaned, model, n_requests)
+    records = [records[position % len(records)] for position in range(n_requests)]
+    timings = np.empty(len(records))
+    for position, record in enumerate(records):
+        start = time.perf_counter()
+        model.score_record(record)
+        timings[position] = time.perf_counter() - start
+    rows.append(_latency_row('score_record', timings))
+
+    server = make_server(model, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    connection = http.client.HTTPConnection(*server.server_address)
+    headers = {'Content-Type': 'application/json'}
+    try:
+        for name, payloads in [('POST /score (record)', records), ('POST /score (100 records)', [records[:100]] * max(1, n_requests // 10))]:
+            timings = np.empty(len(payloads))
+            for position, payload in enumerate(payloads):
+                start = time.perf_counter()
+                connection.request('POST', '/score', json.dumps(payload), headers)
+                connection.getresponse().read()
+                timings[position] = time.perf_counter() - start
+            rows.append(_latency_row(name, timings))
+    finally:
+        connection.close()
+        server.shutdown()
+        server.server_close()
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the batch, single-record and HTTP scoring of the risk model.')
+    parser.add_argument('--rows', default='10k', help='synthetic rows the model is trained on, e.g. 10k')
+    parser.add_argument('--batch-rows', default='10k,100k,1m', help='comma separated batch sizes scored with predict_proba')
+    parser.add_argument('--requests', type=int, default=2000, help='single-record calls and HTTP requests timed')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    batch_rows = [parse_rows(size) for size in args.batch_rows.split(',')]
+    print(run_benchmark(parse_rows(args.rows), batch_rows, args.requests, args.seed).to_string(index=False, na_rep=""))
@@ -0,0 +1,68 @@
+"""
+Benchmarks the heavy user scoring kernel (src/scoring.py) against the original row-wise apply implementation.
+
+Run from the repository root:
+    python benchmarks/bench_scoring.py --repeat 20
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src.data_cleaning import RAW_DRUG_COLS, convert_drug_use_ratings, flag_heavy_users, replace_outliers_with_mean
+
+FILEPATH_RAW = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'raw', 'Drug_Consumption.csv')
+
+
+# Original implementations, kept here only as the baseline to compare against
+
+def apply_flag_heavy_users(df: pd.DataFrame, drug_cols: list) -> tuple:
+    df['usage_frequency'] = df[drug_cols].apply(lambda row: sum(1 for val in row if val >= 5), axis=1)
+    df['heavy_user'] = df['usage_frequency'] >= 5
+    counts = [(df[drug_cols] == level).sum().sum() for level in range(7)]
+    return df, counts
+
+
+def apply_replace_outliers_with_mean(df: pd.DataFrame, col: str) -> pd.DataFrame:
+    mean_value = df[col].mean()
+    df[col] = df[col].apply(lambda x: mean_value if x > 6 else x)
+    return df
+
+
+def time_steps(flag, replace, df: pd.DataFrame, runs: int) -> float:
+    best = float('inf')
+    for _ in range(runs):
+        df_copy = df.copy()
+        start = time.perf_counter()
+        flag(df_copy)
+        replace(df_copy, 'usage_frequency')
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_benchmark(repeat: int, runs: int = 3) -> pd.DataFrame:
+    raw = pd.read_csv(FILEPATH_RAW)
+    df = convert_drug_use_ratings(pd.concat([raw] * repeat, ignore_index=True), RAW_DRUG_COLS)
+
+    baseline_df, baseline_counts = apply_flag_heavy_users(df.copy(), RAW_DRUG_COLS)
+    kernel_df, summary = flag_heavy_users(df.copy(), RAW_DRUG_COLS, verbose=False)
+    assert np.array_equal(baseline_df['usage_frequency'], kernel_df['usage_frequency'])
+    assert summary['heavy_user'].tolist() == baseline_counts
+
+    baseline_time = time_steps(lambda d: apply_flag_heavy_users(d, RAW_DRUG_COLS), apply_replace_outliers_with_mean, df, runs)
+    kernel_time = time_steps(lambda d: flag_heavy_users(d, RAW_DRUG_COLS, verbose=False), replace_outliers_with_mean, df, runs)
+    return pd.DataFrame([{'rows': len(df), 'apply_s': round(baseline_time, 4), 'kernel_s': round(kernel_time, 4),
+                          'speedup': round(baseline_time / kernel_time, 1)}])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark heavy user flagging and outlier replacement.')
+    parser.add_argument('--repeat', type=int, default=20, help='times the 1,885-row raw dataset is tiled')
+    parser.add_argument('--runs', type=int, default=3, help='runs per implementation, the best one is reported')
+    args = parser.parse_args()
+    print(run_benchmark(args.repeat, args.runs).to_string(index=False))
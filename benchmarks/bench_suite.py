@@ -0,0 +1,277 @@
+"""
+Times and memory-profiles the cleaning functions, the aggregation helpers and headless chart rendering on synthetic
+data (benchmarks/synthetic.py) and compares the results with the stored baselines in benchmarks/baselines.json.
+
+Run from the repository root:
+    python benchmarks/bench_suite.py --sizes 10k,1m
+    python benchmarks/bench_suite.py --sizes 10k,1m --save-baseline
+    python benchmarks/bench_suite.py --sizes 10m --groups cleaning,aggregation --no-memory
+
+Cleaning cases run in the notebook's order, each on a copy of the previous case's output. Times are the best of
+--runs runs; peak memory is measured with tracemalloc in a separate run, so tracing never slows the timed runs.
+A case regresses when it is more than --tolerance slower (or larger) than its baseline; --fail-on-regression turns
+that into a non-zero exit status for CI. 10m rows need roughly 8 GB of memory.
+"""
+import matplotlib
+matplotlib.use('Agg')
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from synthetic import parse_rows, format_rows, generate_raw, load_marginals
+from src.data_cleaning import (
+    RAW_DRUG_COLS, RENAMED_DRUG_COLS, CLEANED_DRUG_COLS, AGE_COLS, PERSONALITY_TRAITS,
+    convert_drug_use_ratings, convert_to_midpoint, rename_personality_traits, add_drug_intensity_position,
+    rename_drug_columns, apply_min_max_scaling, flag_heavy_users, replace_outliers_with_mean,
+    convert_usage_frequency_to_labels, clean_column_names
+)
+from src.pipeline import round_values
+from src.schema import RAW_SCHEMA, validate_chunk
+from src.storage import apply_cleaned_dtypes
+from src.scoring import score_drug_levels
+from src.cube import AggregateCube
+from src.correlation import correlation_block
+from src.bitmap_index import BitmapIndex
+from src.respondent_store import RespondentStore
+from src.usage_histogram import UsageHistogram
+from src.figure_cache import save_figures
+from src import visualization
+
+FILEPATH_BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+# Creates global constants for the default run
+DEFAULT_SIZES = '10k,1m'
+GROUPS = ['cleaning', 'aggregation', 'rendering']
+REGRESSION_TOLERANCE = 0.25
+NOISE_FLOOR_SECONDS = 0.005   # cases faster than this are never reported as time regressions
+NOISE_FLOOR_MB = 1.0
+
+DASHBOARD_SELECTION = {'gender': ['F'], 'age': [21.0, 29.5], 'education': None}
+
+
+# Cleaning steps in the notebook's order: (name, function of the previous step's output)
+CLEANING_CASES = [
+    ('validate_chunk', lambda df: df[validate_chunk(df, RAW_SCHEMA)[0]]),
+    ('convert_drug_use_ratings', lambda df: convert_drug_use_ratings(df, RAW_DRUG_COLS)),
+    ('convert_to_midpoint', lambda df: convert_to_midpoint(df, AGE_COLS)),
+    ('rename_personality_traits', rename_personality_traits),
+    ('add_drug_intensity_position', lambda df: add_drug_intensity_position(df, RAW_DRUG_COLS)),
+    ('rename_drug_columns', rename_drug_columns),
+    ('apply_min_max_scaling', lambda df: apply_min_max_scaling(df, PERSONALITY_TRAITS)),
+    ('flag_heavy_users', lambda df: flag_heavy_users(df, RENAMED_DRUG_COLS, verbose=False)[0]),
+    ('replace_outliers_with_mean', lambda df: replace_outliers_with_mean(df, 'usage_frequency')),
+    ('round_values', lambda df: round_values(df, 2)),
+    ('convert_usage_frequency_to_labels', convert_usage_frequency_to_labels),
+    ('clean_column_names', clean_column_names),
+]
+
+# Aggregation helpers on the cleaned frame: (name, setup(cleaned) built once and untimed, function of the setup result)
+AGGREGATION_CASES = [
+    ('score_drug_levels', lambda df: df[CLEANED_DRUG_COLS].to_numpy(), lambda levels: score_drug_levels(levels, 5, 5)),
+    ('correlation_block_pearson', lambda df: df, lambda df: correlation_block(df, PERSONALITY_TRAITS, CLEANED_DRUG_COLS)),
+    ('correlation_block_spearman', lambda df: df, lambda df: correlation_block(df, PERSONALITY_TRAITS, CLEANED_DRUG_COLS, 'spearman')),
+    ('AggregateCube', lambda df: df, AggregateCube),
+    ('AggregateCube.corr', AggregateCube, lambda cube: cube.corr(DASHBOARD_SELECTION, PERSONALITY_TRAITS, CLEANED_DRUG_COLS)),
+    ('AggregateCube.boxplot_stats', AggregateCube, lambda cube: cube.boxplot_stats('age', DASHBOARD_SELECTION)),
+    ('BitmapIndex', lambda df: df, BitmapIndex),
+    ('BitmapIndex.positions', BitmapIndex, lambda index: index.positions(DASHBOARD_SELECTION)),
+    ('RespondentStore.from_frame', lambda df: df, RespondentStore.from_frame),
+    ('UsageHistogram', lambda df: df, UsageHistogram.from_data),
+    ('UsageHistogram.trait_means', UsageHistogram.from_data, lambda histogram: histogram.trait_means('impulsivity_impulsive', 'cannabis', DASHBOARD_SELECTION)),
+]
+
+# Charts rendered headless with the Agg backend: (name, plotting function, arguments after df)
+RENDERING_WARM_UP_ROWS = 1_000
+RENDERING_CASES = [
+    ('plot_age_distribution', visualization.plot_age_distribution, ('age',)),
+    ('plot_drug_usage_frequency', visualization.plot_drug_usage_frequency, (CLEANED_DRUG_COLS,)),
+    ('plot_personality_drug_correlation_heatmap', visualization.plot_personality_drug_correlation_heatmap, (CLEANED_DRUG_COLS,)),
+    ('plot_personality_drug_intensity_stacked', visualization.plot_personality_drug_intensity_stacked, ()),
+    ('plot_trait_drug_barplots', visualization.plot_trait_drug_barplots, (['impulsivity_impulsive'], ['cannabis'])),
+    ('plot_top_five_drugs', visualization.plot_top_five_drugs, (CLEANED_DRUG_COLS,)),
+    ('plot_drug_intensity_by_demographics', visualization.plot_drug_intensity_by_demographics, ()),
+    ('plot_drug_pairplot', visualization.plot_drug_pairplot, (['cannabis', 'lsd', 'alcohol'],)),
+]
+
+
+"""
+Runs func(make_input()) runs times and returns (best seconds, peak MB or None, result of the last run).
+make_input is called outside the timed region; the memory run traces only the allocations made by func.
+"""
+def measure(func, make_input, runs: int, trace_memory: bool) -> tuple:
+    best, result = float('inf'), None
+    for _ in range(runs):
+        data = make_input()
+        start = time.perf_counter()
+        result = func(data)
+        best = min(best, time.perf_counter() - start)
+
+    peak_mb = None
+    if trace_memory:
+        data = make_input()
+        tracemalloc.start()
+        func(data)
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return best, peak_mb, result
+
+
+def run_cleaning(raw: pd.DataFrame, runs: int, trace_memory: bool) -> tuple:
+    rows, df = [], raw
+    for name, func in CLEANING_CASES:
+        seconds, peak_mb, df = measure(func, lambda: df.copy(), runs, trace_memory)
+        rows.append({'group': 'cleaning', 'case': name, 'seconds': seconds, 'peak_mb': peak_mb})
+    return rows, df
+
+
+def run_aggregation(cleaned: pd.DataFrame, runs: int, trace_memory: bool) -> list:
+    rows = []
+    for name, setup, func in AGGREGATION_CASES:
+        prepared = setup(cleaned)
+        seconds, peak_mb, _ = measure(func, lambda: prepared, runs, trace_memory)
+        rows.append({'group': 'aggregation', 'case': name, 'seconds': seconds, 'peak_mb': peak_mb})
+    return rows
+
+
+# Charts are rendered once untimed first, so matplotlib's font cache and backend set-up are not billed to the first case
+def run_rendering(cleaned: pd.DataFrame, runs: int, trace_memory: bool) -> list:
+    rows = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        _, warm_up_func, warm_up_args = RENDERING_CASES[0]
+        save_figures(warm_up_func, cleaned.head(RENDERING_WARM_UP_ROWS), warm_up_args, {}, output_dir)
+        for name, func, args in RENDERING_CASES:
+            render = lambda df: save_figures(func, df, args, {}, output_dir)
+            seconds, peak_mb, _ = measure(render, lambda: cleaned, runs, trace_memory)
+            rows.append({'group': 'rendering', 'case': name, 'seconds': seconds, 'peak_mb': peak_mb})
+    return rows
+
+
+"""Runs the selected groups at one size and returns one row per case."""
+def run_size(n_rows: int, groups: list, runs: int, trace_memory: bool, seed: int, marginals: dict) -> list:
+    raw = generate_raw(n_rows, seed, marginals)
+    rows, cleaned = run_cleaning(raw, runs, trace_memory)
+    if 'cleaning' not in groups:
+        rows = []
+    del raw
+
+    cleaned = apply_cleaned_dtypes(cleaned)
+    if 'aggregation' in groups:
+        rows += run_aggregation(cleaned, runs, trace_memory)
+    if 'rendering' in groups:
+        rows += run_rendering(cleaned, runs, trace_memory)
+
+    for row in rows:
+        row['size'] = format_rows(n_rows)
+    return rows
+
+
+def load_baselines(filepath: str = FILEPATH_BASELINES) -> dict:
+    if not os.path.exists(filepath):
+        return {'machine': None, 'results': {}}
+    with open(filepath) as baseline_file:
+        return json.load(baseline_file)
+
+
+def machine_info() -> dict:
+    return {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count(),
+            'numpy': np.__version__, 'pandas': pd.__version__, 'matplotlib': matplotlib.__version__}
+
+
+# Stores the results as the new baselines, keeping the baselines of sizes that were not run
+def save_baselines(results: pd.DataFrame, filepath: str = FILEPATH_BASELINES) -> None:
+    baselines = load_baselines(filepath)
+    baselines['machine'] = machine_info()
+    for size, rows in results.groupby('size', sort=False):
+        baselines['results'][size] = {f'{row.group}/{row.case}': {'seconds': round(row.seconds, 6),
+                                                                   'peak_mb': None if pd.isna(row.peak_mb) else round(row.peak_mb, 3)}
+                                      for row in rows.itertuples()}
+    with open(filepath, 'w') as baseline_file:
+        json.dump(baselines, baseline_file, indent=2)
+        baseline_file.write('\n')
+
+
+"""Adds baseline_s, baseline_mb, time_ratio and status ('ok', 'regression', 'faster' or 'new') to the results."""
+def compare_with_baselines(results: pd.DataFrame, baselines: dict, tolerance: float = REGRESSION_TOLERANCE) -> pd.DataFrame:
+    stored = baselines['results']
+    baseline_s, baseline_mb, statuses = [], [], []
+    for row in results.itertuples():
+        baseline = stored.get(row.size, {}).get(f'{row.group}/{row.case}')
+        if baseline is None:
+            baseline_s.append(np.nan)
+            baseline_mb.append(np.nan)
+            statuses.append('new')
+            continue
+
+        baseline_s.append(baseline['seconds'])
+        baseline_mb.append(np.nan if baseline['peak_mb'] is None else baseline['peak_mb'])
+        slower = row.seconds > baseline['seconds'] * (1 + tolerance) and row.seconds > NOISE_FLOOR_SECONDS
+        larger = (baseline['peak_mb'] is not None and not pd.isna(row.peak_mb)
+                  and row.peak_mb > baseline['peak_mb'] * (1 + tolerance) + NOISE_FLOOR_MB)
+        if slower or larger:
+            statuses.append('regression')
+        elif row.seconds < baseline['seconds'] / (1 + tolerance) and baseline['seconds'] > NOISE_FLOOR_SECONDS:
+            statuses.append('faster')
+        else:
+            statuses.append('ok')
+
+    results = results.assign(baseline_s=baseline_s, baseline_mb=baseline_mb, status=statuses)
+    results['time_ratio'] = results['seconds'] / results['baseline_s']
+    return results
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark cleaning, aggregation and rendering on synthetic data.')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='comma separated row counts, e.g. 10k,1m,10m')
+    parser.add_argument('--groups', default=','.join(GROUPS), help=f'comma separated subset of {GROUPS}')
+    parser.add_argument('--runs', type=int, default=3, help='timed runs per case, the best one is reported')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc peak memory runs')
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE, help='allowed slowdown before a case regresses')
+    parser.add_argument('--baselines', default=FILEPATH_BASELINES, help='baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='store these results as the new baselines')
+    parser.add_argument('--fail-on-regression', action='store_true', help='exit with status 1 when a case regresses')
+    parser.add_argument('--output', help='also write the results to this CSV file')
+    args = parser.parse_args(argv)
+
+    groups = [group.strip() for group in args.groups.split(',')]
+    unknown = sorted(set(groups) - set(GROUPS))
+    if unknown:
+        parser.error(f'unknown groups {unknown}, choose from {GROUPS}')
+
+    marginals = load_marginals()
+    rows = []
+    for size in args.sizes.split(','):
+        rows += run_size(parse_rows(size), groups, args.runs, not args.no_memory, args.seed, marginals)
+    results = pd.DataFrame(rows, columns=['size', 'group', 'case', 'seconds', 'peak_mb'])
+
+    baselines = load_baselines(args.baselines)
+    report = compare_with_baselines(results, baselines, args.tolerance)
+    if baselines['machine'] is not None and baselines['machine'] != machine_info():
+        print(f'Note: baselines were recorded on a different machine: {baselines["machine"]}\n')
+    print(report.to_string(index=False, float_format=lambda value: f'{value:.4f}'))
+
+    if args.output:
+        report.to_csv(args.output, index=False)
+    if args.save_baseline:
+        save_baselines(results, args.baselines)
+        print(f'\nSaved baselines to {args.baselines}')
+
+    regressions = report[report['status'] == 'regression']
+    if len(regressions):
+        print(f'\n{len(regressions)} case(s) regressed by more than {args.tolerance:.0%}')
+    return 1 if args.fail_on_regression and len(regressions) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
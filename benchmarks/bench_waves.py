@@ -0,0 +1,65 @@
+"""
+Benchmarks the survey wave registry (src/wave_registry.py) on synthetic waves: the time of every append, with the
+waves whose statistics were recomputed (refit) and whose cleaned files were rewritten (refinalized), against
+re-running the pipeline over all waves concatenated (what a change of the raw file costs without the registry),
+and the time to load one wave against all of them.
+
+Run from the repository root:
+    python benchmarks/bench_waves.py --rows 100k --waves 5
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from synthetic import parse_rows, generate_raw
+from src.pipeline import build_default_pipeline
+from src.storage import save_cleaned_columnar
+from src.wave_registry import WaveRegistry
+
+
+def run_benchmark(n_rows: int, n_waves: int, seed: int = 0) -> pd.DataFrame:
+    work_dir = tempfile.mkdtemp()
+    try:
+        wave_paths = []
+        for wave in range(n_waves):
+            wave_paths.append(os.path.join(work_dir, f'wave{wave}.csv'))
+            generate_raw(n_rows, seed + wave, start_id=wave * n_rows + 1).to_csv(wave_paths[-1], index=False)
+
+        rows = []
+        registry = WaveRegistry(os.path.join(work_dir, 'registry'))
+        for wave_path in wave_paths:
+            start = time.perf_counter()
+            report = registry.append(wave_path)
+            rows.append({'benchmark': f'append {report["name"]}', 'total_rows': sum(registry.waves()['rows']),
+                         'seconds': round(time.perf_counter() - start, 3), 'refit': len(report['refit']), 'refinalized': len(report['refinalized'])})
+
+        all_path, cleaned_path = os.path.join(work_dir, 'all.csv'), os.path.join(work_dir, 'cleaned.csv')
+        pd.concat([pd.read_csv(wave_path) for wave_path in wave_paths]).to_csv(all_path, index=False)
+        start = time.perf_counter()
+        build_default_pipeline().run(all_path, cleaned_path)
+        save_cleaned_columnar(pd.read_csv(cleaned_path), os.path.join(work_dir, 'cleaned.parquet'))
+        rows.append({'benchmark': 'full re-run', 'total_rows': n_rows * n_waves, 'seconds': round(time.perf_counter() - start, 3)})
+
+        for name, waves in [('load last wave', registry.names()[-1:]), ('load all waves', None)]:
+            start = time.perf_counter()
+            df = registry.load(waves)
+            rows.append({'benchmark': name, 'total_rows': len(df), 'seconds': round(time.perf_counter() - start, 3)})
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark incremental wave appends against a full pipeline re-run.')
+    parser.add_argument('--rows', default='100k', help='synthetic rows per wave, e.g. 100k')
+    parser.add_argument('--waves', type=int, default=5, help='number of waves appended')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print(run_benchmark(parse_rows(args.rows), args.waves, args.seed).to_string(index=False, na_rep=''))
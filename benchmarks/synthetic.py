@@ -0,0 +1,80 @@
+"""
+Generates synthetic raw data with the schema of data/raw/Drug_Consumption.csv for the benchmarks.
+
+Every column is sampled independently from its marginal distribution in the real file: the CL0-CL6 frequencies of each
+drug, the age band, gender, education, country and ethnicity frequencies, and the empirical distribution of each
+(quantized) trait z-score. Rows are therefore realistic column by column, but the correlations between columns are not
+kept. Generation is seeded and chunked, so the same seed always gives the same rows and large files stream to disk.
+
+Run from the repository root:
+    python benchmarks/synthetic.py --rows 1m --output /tmp/drug_consumption_1m.csv
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+FILEPATH_RAW = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'raw', 'Drug_Consumption.csv')
+
+# Creates global constant for the number of rows generated (and written) at a time
+GENERATE_CHUNKSIZE = 1_000_000
+
+
+"""Parses row counts written as 10000, 10k, 1m or 10M."""
+def parse_rows(text: str) -> int:
+    text = str(text).strip().lower().replace('_', '')
+    multiplier = {'k': 1_000, 'm': 1_000_000}.get(text[-1:], 1)
+    return int(float(text.rstrip('km')) * multiplier)
+
+
+"""Formats a row count as the short label used in reports and baselines (10k, 1m, 10m)."""
+def format_rows(n_rows: int) -> str:
+    for suffix, size in (('m', 1_000_000), ('k', 1_000)):
+        if n_rows >= size and n_rows % size == 0:
+            return f'{n_rows // size}{suffix}'
+    return str(n_rows)
+
+
+"""Returns {column: (values, probabilities)} for every column of the raw file except ID."""
+def load_marginals(filepath: str = FILEPATH_RAW) -> dict:
+    raw = pd.read_csv(filepath)
+    marginals = {}
+    for col in raw.columns:
+        if col == 'ID':
+            continue
+        counts = raw[col].value_counts(sort=False)
+        marginals[col] = (counts.index.to_numpy(), (counts / counts.sum()).to_numpy())
+    return marginals
+
+
+"""Returns n_rows synthetic raw respondents with IDs start_id, start_id + 1, ... in the raw file's column order."""
+def generate_raw(n_rows: int, seed: int = 0, marginals: dict = None, start_id: int = 1) -> pd.DataFrame:
+    marginals = marginals or load_marginals()
+    rng = np.random.default_rng(seed)
+    data = {'ID': np.arange(start_id, start_id + n_rows)}
+    for col, (values, probabilities) in marginals.items():
+        data[col] = values[rng.choice(len(values), size=n_rows, p=probabilities)]
+    return pd.DataFrame(data)
+
+
+"""Yields the synthetic rows in chunks; chunk i is seeded with (seed, i) so the output does not depend on memory limits."""
+def generate_raw_chunks(n_rows: int, seed: int = 0, chunksize: int = GENERATE_CHUNKSIZE, marginals: dict = None):
+    marginals = marginals or load_marginals()
+    for index, start in enumerate(range(0, n_rows, chunksize)):
+        yield generate_raw(min(chunksize, n_rows - start), [seed, index], marginals, start_id=start + 1)
+
+
+"""Writes n_rows synthetic rows to a CSV file, one chunk at a time."""
+def write_raw_csv(filepath: str, n_rows: int, seed: int = 0, chunksize: int = GENERATE_CHUNKSIZE) -> None:
+    for index, chunk in enumerate(generate_raw_chunks(n_rows, seed, chunksize)):
+        chunk.to_csv(filepath, index=False, mode='w' if index == 0 else 'a', header=index == 0)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write synthetic Drug_Consumption.csv-schema data.')
+    parser.add_argument('--rows', default='10k', help='number of rows, e.g. 10k, 1m or 10m')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', required=True, help='CSV file to write')
+    args = parser.parse_args()
+    write_raw_csv(args.output, parse_rows(args.rows), args.seed)
@@ -0,0 +1,314 @@
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.data_cleaning import RAW_DRUG_COLS, CLEANED_DRUG_COLS, PERSONALITY_TRAITS, PERSONALITY_TRAIT_NAMES, DRUG_COLUMN_NAMES
+from src.decoding import CL_CODES, AGE_BANDS, AGE_MIDPOINTS, FREQUENCY_LABELS
+from src.pipeline import CleaningPipeline, build_default_pipeline
+from src.scaling import StreamingScaler, load_scalers
+from src.scoring import HEAVY_USE_LEVEL, HEAVY_USER_MIN_DRUGS, OUTLIER_THRESHOLD
+from src.storage import save_cleaned_columnar, load_cleaned_columnar
+from src.bootstrap import BOOTSTRAP_REPLICATES, BOOTSTRAP_CONFIDENCE, BOOTSTRAP_SEED, bootstrap_trait_means
+from src.risk_model import RISK_REGULARIZATION, RISK_RANDOM_STATE, RiskModel
+from src.tracing import traced_stage
+from src.usage_histogram import UsageHistogram
+
+# Creates global constants for the cleaned artifact cache (kept at the repository root so notebooks and the app share it)
+ARTIFACT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.artifact_cache')
+ARTIFACT_CACHE_MAX_VERSIONS = 5
+ARTIFACT_CACHE_FORMAT = 4   # bump when the layout of a cache entry changes
+
+# Creates global constant with the cleaned columns the standard (z-score) feature scaler is fitted on
+FEATURE_SCALER_COLS = PERSONALITY_TRAITS + CLEANED_DRUG_COLS + ['drug_intensity_position']
+
+# Creates global constant with the modules whose source is part of the entry key, so editing the cleaning code rebuilds:
+# every module the cleaned rows, the scalers and the usage histogram are computed with
+CLEANING_MODULES = [
+    'src.decoding', 'src.scoring', 'src.scaling', 'src.data_cleaning', 'src.schema', 'src.pipeline', 'src.storage',
+    'src.cube', 'src.usage_histogram',
+]
+
+# Creates global constant with the module each artifact computed on first use is keyed on, on top of the entry key,
+# so editing it recomputes only that artifact and keeps the cleaned data
+ARTIFACT_MODULES = {'bootstrap_intervals': 'src.bootstrap', 'risk_model': 'src.risk_model'}
+
+# Memo of raw file hashes by (size, mtime), so an unchanged raw file is not re-read at every startup
+RAW_FINGERPRINTS_FILE = 'raw_fingerprints.json'
+MANIFEST_FILE = 'manifest.json'
+
+
+"""Returns the cleaning parameters recorded in the key and in every manifest (category codes, midpoints, thresholds, renames)."""
+def cleaning_parameters() -> dict:
+    return {
+        'cl_codes': CL_CODES,
+        'age_midpoints': dict(zip(AGE_BANDS, AGE_MIDPOINTS.tolist())),
+        'frequency_labels': FREQUENCY_LABELS,
+        'heavy_use_level': HEAVY_USE_LEVEL,
+        'heavy_user_min_drugs': HEAVY_USER_MIN_DRUGS,
+        'outlier_threshold': OUTLIER_THRESHOLD,
+        'drug_cols': RAW_DRUG_COLS,
+        'personality_trait_names': PERSONALITY_TRAIT_NAMES,
+        'drug_column_names': DRUG_COLUMN_NAMES,
+    }
+
+
+def _source(obj) -> str:
+    try:
+        return inspect.getsource(obj)
+    except (OSError, TypeError):
+        return ''
+
+
+"""Describes the pipeline's steps (kind, function name and source, arguments) without their fitted state."""
+def _describe_pipeline(pipeline: CleaningPipeline) -> list:
+    description = []
+    for step in pipeline.steps:
+        fields = {name: value for name, value in step.items() if name not in ('scaler', 'mean', 'has_outliers')}
+        if 'func' in fields:
+            func = fields.pop('func')
+            fields['func'] = f'{func.__module__}.{func.__qualname__}'
+            fields['source'] = _source(func)
+        description.append(fields)
+    return description
+
+
+"""
+Persistent, versioned cache of the cleaned dataset and its derived aggregates.
+
+An entry is keyed by a SHA-256 of the raw CSV's contents, the cleaning parameters, the pipeline steps and the source of
+the cleaning modules (computed once per raw file version for the default pipeline), and holds cleaned.parquet, one Parquet file per derived aggregate, the fitted scalers and a
+manifest.json. A lookup with unchanged inputs only stats the raw file and opens the Parquet file; any change to the
+inputs builds a new entry with the chunked CleaningPipeline. Entries are evicted least recently used first once there are more than max_versions.
+
+derived maps an artifact name to a function of the cleaned DataFrame returning a DataFrame; the pipeline's usage
+summary (the flag_heavy_users table) is always stored as 'usage_summary' and the tidy UsageHistogram table as
+'usage_histogram'. The pipeline's min-max bounds are kept in
+cleaned.scaling.json and a standard scaler of the cleaned features in features.scaling.json. The bootstrap intervals and
+the risk model are added to the entry on first use under their own key (see artifact_key).
+"""
+class ArtifactCache:
+
+    def __init__(self, cache_dir: str = ARTIFACT_CACHE_DIR, max_versions: int = ARTIFACT_CACHE_MAX_VERSIONS, derived: dict = None):
+        self.cache_dir = cache_dir
+        self.max_versions = max_versions
+        self.derived = dict(derived or {})
+        self._keys = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # SHA-256 of the raw file, re-read only when its size or modification time changed
+    def raw_fingerprint(self, filepath: str) -> str:
+        memo_path = os.path.join(self.cache_dir, RAW_FINGERPRINTS_FILE)
+        stat = os.stat(filepath)
+        stamp = [stat.st_size, stat.st_mtime_ns]
+        try:
+            with open(memo_path) as memo_file:
+                memo = json.load(memo_file)
+        except (OSError, ValueError):
+            memo = {}
+
+        entry = memo.get(os.path.abspath(filepath))
+        if entry is not None and entry['stamp'] == stamp:
+            return entry['sha256']
+
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as raw_file:
+            for block in iter(lambda: raw_file.read(1 << 20), b''):
+                digest.update(block)
+
+        memo[os.path.abspath(filepath)] = {'stamp': stamp, 'sha256': digest.hexdigest()}
+        handle, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.tmp-')
+        with os.fdopen(handle, 'w') as memo_file:
+            json.dump(memo, memo_file)
+        os.replace(tmp_path, memo_path)
+        return digest.hexdigest()
+
+    """
+    Key of the entry holding the cleaned data, the scalers and the aggregates. With the default pipeline it is computed
+    once per raw file version (path, size and modification time) and reused by every later lookup.
+    """
+    def key(self, raw_path: str, pipeline: CleaningPipeline = None) -> str:
+        if pipeline is not None:
+            return self._compute_key(raw_path, pipeline)
+        stat = os.stat(raw_path)
+        memo_key = (os.path.abspath(raw_path), stat.st_size, stat.st_mtime_ns)
+        if memo_key not in self._keys:
+            self._keys[memo_key] = self._compute_key(raw_path, build_default_pipeline())
+        return self._keys[memo_key]
+
+    def _compute_key(self, raw_path: str, pipeline: CleaningPipeline) -> str:
+        digest = hashlib.sha256()
+        digest.update(repr(ARTIFACT_CACHE_FORMAT).encode())
+        digest.update(self.raw_fingerprint(raw_path).encode())
+        digest.update(json.dumps(cleaning_parameters(), sort_keys=True).encode())
+        digest.update(repr(_describe_pipeline(pipeline)).encode())
+        for module_name in CLEANING_MODULES:
+            digest.update(_source(importlib.import_module(module_name)).encode())
+        for name, func in sorted(self.derived.items()):
+            digest.update(f'{name}:{func.__module__}.{func.__qualname__}:{_source(func)}'.encode())
+        return digest.hexdigest()
+
+    # Key of an artifact computed on first use: the entry key and the source of the artifact's module (ARTIFACT_MODULES)
+    def artifact_key(self, raw_path: str, name: str, pipeline: CleaningPipeline = None) -> str:
+        digest = hashlib.sha256(self.key(raw_path, pipeline).encode())
+        digest.update(_source(importlib.import_module(ARTIFACT_MODULES[name])).encode())
+        return digest.hexdigest()
+
+    """
+    Returns the path of an on-demand artifact in the entry, <name>-<artifact key prefix>-<settings>.<ext>. Versions
+    of it computed with an older module source are removed, since their key can no longer come up.
+    """
+    def _artifact_path(self, raw_path: str, name: str, settings: list, ext: str, pipeline: CleaningPipeline = None) -> str:
+        entry_dir = self.get(raw_path, pipeline)
+        version = self.artifact_key(raw_path, name, pipeline)[:16]
+        for file_name in os.listdir(entry_dir):
+            if file_name.startswith(f'{name}-') and not file_name.startswith(f'{name}-{version}-'):
+                os.remove(os.path.join(entry_dir, file_name))
+        return os.path.join(entry_dir, '-'.join([name, version] + [str(setting) for setting in settings]) + ext)
+
+    # Runs the pipeline on the raw file and writes a complete entry into entry_dir
+    def _build(self, raw_path: str, pipeline: CleaningPipeline, key: str, entry_dir: str) -> None:
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp-')
+        try:
+            start = time.perf_counter()
+            csv_path = os.path.join(tmp_dir, 'cleaned.csv')
+            summary = pipeline.run(raw_path, csv_path)
+            cleaned = pd.read_csv(csv_path)
+            os.remove(csv_path)
+            feature_cols = [col for col in FEATURE_SCALER_COLS if col in cleaned.columns]
+            StreamingScaler('standard').partial_fit(cleaned[feature_cols]).save(os.path.join(tmp_dir, 'features.scaling.json'))
+
+            save_cleaned_columnar(cleaned, os.path.join(tmp_dir, 'cleaned.parquet'))
+            artifacts = {'usage_summary': summary, 'usage_histogram': UsageHistogram.from_data(cleaned).to_frame()}
+            for name, func in self.derived.items():
+                artifacts[name] = func(cleaned)
+            for name, artifact in artifacts.items():
+                pq.write_table(pa.Table.from_pandas(artifact, preserve_index=False), os.path.join(tmp_dir, f'{name}.parquet'))
+
+            manifest = {
+                'key': key,
+                'raw_path': os.path.abspath(raw_path),
+                'raw_sha256': self.raw_fingerprint(raw_path),
+                'parameters': cleaning_parameters(),
+                'artifacts': ['cleaned'] + list(artifacts),
+                'rows': len(cleaned),
+                'created': time.time(),
+                'build_seconds': time.perf_counter() - start,
+            }
+            with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w') as manifest_file:
+                json.dump(manifest, manifest_file, indent=2)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        try:
+            os.replace(tmp_dir, entry_dir)
+        except OSError:
+            # Another process stored the same entry first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    """
+    Returns the entry directory for the raw file and pipeline (build_default_pipeline() when None),
+    building it first when the inputs changed since the last build.
+    """
+    def get(self, raw_path: str, pipeline: CleaningPipeline = None) -> str:
+        key = self.key(raw_path, pipeline)
+        entry_dir = os.path.join(self.cache_dir, key)
+
+        if os.path.isdir(entry_dir):
+            os.utime(entry_dir)
+            return entry_dir
+
+        with traced_stage('build_artifacts', category='cache', key=key):
+            self._build(raw_path, pipeline or build_default_pipeline(), key, entry_dir)
+        self._evict()
+        return entry_dir
+
+    # Loads one artifact ('cleaned', 'usage_summary' or a derived name), reading only the given columns when set
+    def load(self, raw_path: str, name: str = 'cleaned', columns: list = None, pipeline: CleaningPipeline = None) -> pd.DataFrame:
+        path = os.path.join(self.get(raw_path, pipeline), f'{name}.parquet')
+        if name == 'cleaned':
+            return load_cleaned_columnar(path, columns=columns)
+        return pq.read_table(path, columns=columns).to_pandas()
+
+    # Min-max scalers fitted by the cleaning pipeline, one per scaling step (for cleaning later waves with the same bounds)
+    def load_cleaning_scalers(self, raw_path: str, pipeline: CleaningPipeline = None) -> list:
+        return load_scalers(os.path.join(self.get(raw_path, pipeline), 'cleaned.scaling.json'))
+
+    # Per-drug level counts and trait sums of every demographic cell, the source of the frequency charts
+    def load_usage_histogram(self, raw_path: str, pipeline: CleaningPipeline = None) -> UsageHistogram:
+        return UsageHistogram.from_frame(self.load(raw_path, 'usage_histogram', pipeline=pipeline))
+
+    """
+    Bootstrap confidence intervals of every trait mean per drug level (see bootstrap_trait_means), computed on first
+    use and stored in the cache entry next to the cleaned data, one file per replicates/confidence/seed setting.
+    """
+    def load_bootstrap_intervals(self, raw_path: str, replicates: int = BOOTSTRAP_REPLICATES, confidence: float = BOOTSTRAP_CONFIDENCE,
+                                 seed: int = BOOTSTRAP_SEED, pipeline: CleaningPipeline = None) -> pd.DataFrame:
+        path = self._artifact_path(raw_path, 'bootstrap_intervals', [replicates, confidence, seed], '.parquet', pipeline)
+        entry_dir = os.path.dirname(path)
+        if not os.path.exists(path):
+            cleaned = load_cleaned_columnar(os.path.join(entry_dir, 'cleaned.parquet'), columns=PERSONALITY_TRAITS + CLEANED_DRUG_COLS)
+            with traced_stage('bootstrap_intervals', category='cache', replicates=replicates):
+                intervals = bootstrap_trait_means(cleaned, replicates=replicates, confidence=confidence, seed=seed)
+            handle, tmp_path = tempfile.mkstemp(dir=entry_dir, prefix='.tmp-', suffix='.parquet')
+            os.close(handle)
+            pq.write_table(pa.Table.from_pandas(intervals, preserve_index=False), tmp_path)
+            os.replace(tmp_path, path)
+        return pq.read_table(path).to_pandas()
+
+    # Heavy-user risk model (see RiskModel), trained on first use and stored in the cache entry as JSON
+    def load_risk_model(self, raw_path: str, regularization: float = RISK_REGULARIZATION, random_state: int = RISK_RANDOM_STATE,
+                        pipeline: CleaningPipeline = None) -> RiskModel:
+        path = self._artifact_path(raw_path, 'risk_model', [regularization, random_state], '.json', pipeline)
+        entry_dir = os.path.dirname(path)
+        if not os.path.exists(path):
+            model = RiskModel(regularization=regularization, random_state=random_state)
+            cleaned = load_cleaned_columnar(os.path.join(entry_dir, 'cleaned.parquet'),
+                                            columns=model.numeric_features + model.categorical_features + [model.target])
+            with traced_stage('risk_model', category='cache'):
+                model.fit(cleaned)
+            handle, tmp_path = tempfile.mkstemp(dir=entry_dir, prefix='.tmp-', suffix='.json')
+            os.close(handle)
+            model.save(tmp_path)
+            os.replace(tmp_path, path)
+        return RiskModel.load(path)
+
+    # Standard scaler of the cleaned trait, drug and intensity columns
+    def load_feature_scaler(self, raw_path: str, pipeline: CleaningPipeline = None) -> StreamingScaler:
+        return StreamingScaler.load(os.path.join(self.get(raw_path, pipeline), 'features.scaling.json'))
+
+    # Manifests of the stored entries, most recently used first
+    def versions(self) -> list:
+        entries = sorted(self._entries(), key=os.path.getmtime, reverse=True)
+        manifests = []
+        for entry_dir in entries:
+            with open(os.path.join(entry_dir, MANIFEST_FILE)) as manifest_file:
+                manifests.append(json.load(manifest_file))
+        return manifests
+
+    def _entries(self) -> list:
+        return [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                if os.path.isdir(os.path.join(self.cache_dir, name)) and not name.startswith('.')]
+
+    # Keeps at most max_versions entries, removing the least recently used ones
+    def _evict(self) -> None:
+        entries = self._entries()
+        if len(entries) <= self.max_versions:
+            return None
+        entries.sort(key=os.path.getmtime)
+        for entry_dir in entries[:len(entries) - self.max_versions]:
+            shutil.rmtree(entry_dir, ignore_errors=True)
+
+    # Removes every cached entry
+    def clear(self) -> None:
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+# Creates global constant with the demographic columns indexed by default
+BITMAP_INDEX_COLS = ['gender', 'age', 'education', 'country', 'ethnicity']
+
+
+"""
+Bitmap index over demographic columns: one packed bitset (uint64 words, bit i = row i) per distinct value per column.
+Built once per dataset load; a filter selection {column: allowed values} is then answered with bitwise OR within a
+column and AND across columns over rows/64 words, without touching the string columns. The filter reuses two
+preallocated word buffers, so only the returned positions are allocated.
+"""
+class BitmapIndex:
+
+    def __init__(self, df: pd.DataFrame, cols: list = BITMAP_INDEX_COLS):
+        self.cols = [col for col in cols if col in df.columns]
+        self.n_rows = len(df)
+        self.n_words = (self.n_rows + 63) // 64
+        self.values = {}
+        self.bitsets = {}
+
+        for col in self.cols:
+            codes, uniques = pd.factorize(df[col], use_na_sentinel=False)
+            self.values[col] = pd.Index(uniques)
+            bitsets = np.zeros((len(uniques), self.n_words * 8), dtype=np.uint8)
+            for code in range(len(uniques)):
+                packed = np.packbits(codes == code, bitorder='little')
+                bitsets[code, :len(packed)] = packed
+            self.bitsets[col] = bitsets.view(np.uint64)
+
+        self._result = np.empty(self.n_words, dtype=np.uint64)
+        self._column = np.empty(self.n_words, dtype=np.uint64)
+        self._all_rows = np.zeros(self.n_words * 8, dtype=np.uint8)
+        self._all_rows[:(self.n_rows + 7) // 8] = np.packbits(np.ones(self.n_rows, dtype=bool), bitorder='little')
+        self._all_rows = self._all_rows.view(np.uint64)
+
+    """
+    Returns the packed mask (uint64 words) of rows matching the selection. Columns left out or set to None are not filtered.
+    The returned array is an internal buffer that the next call overwrites; copy it to keep it.
+    """
+    def mask(self, selection: dict = None) -> np.ndarray:
+        np.copyto(self._result, self._all_rows)
+        for col, allowed in (selection or {}).items():
+            if allowed is None:
+                continue
+            if col not in self.bitsets:
+                raise KeyError(f'{col} is not indexed, indexed columns are {self.cols}')
+            self._column.fill(0)
+            for code in self.values[col].get_indexer(list(allowed)):
+                if code >= 0:
+                    np.bitwise_or(self._column, self.bitsets[col][code], out=self._column)
+            np.bitwise_and(self._result, self._column, out=self._result)
+        return self._result
+
+    # Number of rows matching the selection (popcount of the mask)
+    def count(self, selection: dict = None) -> int:
+        return int(np.bitwise_count(self.mask(selection)).sum())
+
+    # Row positions matching the selection, for DataFrame.iloc
+    def positions(self, selection: dict = None) -> np.ndarray:
+        bits = np.unpackbits(self.mask(selection).view(np.uint8), count=self.n_rows, bitorder='little')
+        return np.flatnonzero(bits)
@@ -0,0 +1,138 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.data_cleaning import PERSONALITY_TRAITS, CLEANED_DRUG_COLS
+from src.decoding import CL_LEVELS
+from src.scoring import drug_level_matrix
+
+# Creates global constants for the bootstrap confidence intervals
+BOOTSTRAP_REPLICATES = 1000
+BOOTSTRAP_CONFIDENCE = 0.95
+BOOTSTRAP_SEED = 42
+BOOTSTRAP_BATCH_ENTRIES = 5_000_000    # resampled (row, drug) entries per block, bounds the memory of one batch
+
+# Arrays each worker process receives once in its initializer
+_worker_data = {}
+
+
+"""
+Flat (drug, level) group of every respondent's answer for each drug, as an int32 N x drugs matrix;
+missing levels get the group -1.
+"""
+def _level_groups(df: pd.DataFrame, drug_cols: list) -> np.ndarray:
+    levels = drug_level_matrix(df, drug_cols)
+    if levels.dtype.kind == 'f':
+        levels = np.where(np.isnan(levels), -1, levels)
+    levels = levels.astype(np.int32)
+    groups = np.arange(len(drug_cols), dtype=np.int32) * len(CL_LEVELS) + levels
+    return np.where((levels >= 0) & (levels < len(CL_LEVELS)), groups, -1)
+
+
+"""
+Group sums of one batch of bootstrap replicates: draws the resampled rows of every replicate row_block at a time
+(all N at once by default) as a replicates x row_block index matrix, and returns (counts, sums) of shape
+(replicates, groups) and (replicates, groups, traits) accumulated from one weighted bincount per trait and block.
+"""
+def _resample_batch(groups: np.ndarray, traits: np.ndarray, replicates: int, seed, row_block: int = None) -> tuple:
+    n_rows, n_drugs = groups.shape
+    n_groups = n_drugs * len(CL_LEVELS)
+    rng = np.random.default_rng(seed)
+    row_block = n_rows if row_block is None else max(1, row_block)
+
+    # One bin per (replicate, group) plus a trailing bin that collects missing levels
+    size = replicates * n_groups + 1
+    offsets = (np.arange(replicates) * n_groups)[:, None, None]
+    counts = np.zeros(size, dtype=np.int64)
+    sums = np.zeros((traits.shape[1], size))
+    for start in range(0, n_rows, row_block):
+        rows = rng.integers(0, n_rows, size=(replicates, min(row_block, n_rows - start)))
+        sampled = groups[rows]
+        index = np.where(sampled >= 0, sampled + offsets, replicates * n_groups).ravel()
+        counts += np.bincount(index, minlength=size)
+        for position in range(traits.shape[1]):
+            weights = np.repeat(traits[rows, position].ravel(), n_drugs)
+            sums[position] += np.bincount(index, weights=weights, minlength=size)
+
+    counts = counts[:-1].reshape(replicates, n_groups)
+    sums = sums[:, :-1].reshape(traits.shape[1], replicates, n_groups).transpose(1, 2, 0)
+    return counts, sums
+
+
+def _init_worker(groups: np.ndarray, traits: np.ndarray, row_block: int = None) -> None:
+    _worker_data['groups'] = groups
+    _worker_data['traits'] = traits
+    _worker_data['row_block'] = row_block
+
+
+# Means of one batch inside a worker (NaN where a replicate drew nobody at that level)
+def _batch_means(replicates: int, seed) -> np.ndarray:
+    counts, sums = _resample_batch(_worker_data['groups'], _worker_data['traits'], replicates, seed, _worker_data['row_block'])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts[..., None]
+
+
+"""
+Bootstrap confidence intervals of the mean of every trait at every use level of every drug (7 x 19 x 7 by default),
+computed for the whole grid at once.
+
+Respondents are resampled with replacement. Each batch of replicates is one index matrix of resampled rows and the
+group sums of all traits, drugs and levels come from weighted bincounts over it, so no group is resampled on its
+own. A batch resamples at most BOOTSTRAP_BATCH_ENTRIES (row, drug) entries at a time: as many replicates as fit, and
+when a single replicate does not fit (N x drugs above the limit), its rows are drawn and counted in blocks. Batches run across worker processes; every batch gets its own seed spawned from `seed`, so the intervals are
+the same for any number of workers. Intervals are percentile intervals of the replicate means at `confidence`.
+
+Returns a tidy DataFrame with trait, drug, level, n, mean, ci_low and ci_high (levels nobody reported are left out).
+"""
+def bootstrap_trait_means(df: pd.DataFrame, traits: list = PERSONALITY_TRAITS, drugs: list = CLEANED_DRUG_COLS,
+                          replicates: int = BOOTSTRAP_REPLICATES, confidence: float = BOOTSTRAP_CONFIDENCE,
+                          seed: int = BOOTSTRAP_SEED, workers: int = None) -> pd.DataFrame:
+    groups = _level_groups(df, drugs)
+    values = df[traits].to_numpy(dtype=np.float64)
+    n_groups = len(drugs) * len(CL_LEVELS)
+
+    batch_size = int(max(1, min(replicates, BOOTSTRAP_BATCH_ENTRIES // max(groups.size, 1))))
+    row_block = max(1, BOOTSTRAP_BATCH_ENTRIES // max(len(drugs), 1)) if groups.size > BOOTSTRAP_BATCH_ENTRIES else None
+    sizes = [min(batch_size, replicates - start) for start in range(0, replicates, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    workers = min(workers or os.cpu_count(), len(sizes))
+    if workers <= 1:
+        _init_worker(groups, values, row_block)
+        batches = [_batch_means(size, batch_seed) for size, batch_seed in zip(sizes, seeds)]
+        _worker_data.clear()
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(groups, values, row_block)) as pool:
+            batches = list(pool.map(_batch_means, sizes, seeds))
+
+    present = groups >= 0
+    counts = np.bincount(groups[present], minlength=n_groups)
+    rows = np.broadcast_to(np.arange(len(df))[:, None], groups.shape)[present]
+    sums = np.stack([np.bincount(groups[present], weights=values[rows, position], minlength=n_groups)
+                     for position in range(len(traits))], axis=1)
+
+    # Percentiles over the replicates that drew someone at the level (only levels somebody reported)
+    observed = np.flatnonzero(counts > 0)
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.nanpercentile(np.concatenate(batches)[:, observed], [tail, 100 - tail], axis=0)
+
+    result = []
+    for position, trait in enumerate(traits):
+        result.append(pd.DataFrame({
+            'trait': trait,
+            'drug': np.asarray(drugs, dtype=object)[observed // len(CL_LEVELS)],
+            'level': (observed % len(CL_LEVELS)).astype(np.int8),
+            'n': counts[observed],
+            'mean': sums[observed, position] / counts[observed],
+            'ci_low': low[:, position],
+            'ci_high': high[:, position],
+        }))
+    return pd.concat(result, ignore_index=True)
+
+
+"""Rows of a bootstrap_trait_means table for one trait and drug, ordered by level."""
+def trait_drug_intervals(intervals: pd.DataFrame, trait: str, drug: str) -> pd.DataFrame:
+    selected = intervals[(intervals['trait'] == trait) & (intervals['drug'] == drug)]
+    return selected.sort_values('level').reset_index(drop=True)
@@ -0,0 +1,129 @@
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from src.data_cleaning import CLEANED_DRUG_COLS
+from src.lazy_import import lazy_import
+from src.scaling import StreamingScaler
+
+# scikit-learn is imported on the first fit
+cluster = lazy_import('sklearn.cluster')
+preprocessing = lazy_import('sklearn.preprocessing')
+
+# Creates global constants for the clustering defaults used by the dashboard
+N_CLUSTERS = 3
+RANDOM_STATE = 42
+MINIBATCH_THRESHOLD = 100_000   # respondent pools larger than this are fitted with MiniBatchKMeans
+MINIBATCH_SIZE = 10_000
+CLUSTER_CACHE_SIZE = 32
+
+
+"""
+Caching KMeans service for the dashboard's cluster section.
+
+Fitted models are cached (LRU) by filter selection and feature set. Large respondent pools switch to a streaming
+MiniBatchKMeans fit over chunks. Every fit starts from k-means++ seeded with random_state, so the clusters of a
+selection depend only on its rows, never on which selections were fitted or evicted before. With warm_start=True a new
+selection instead starts from the centroids of the previous fit, mapped back to original units and rescaled, so small
+filter changes converge in a few iterations, at the cost of results that depend on the order of requests.
+
+With a saved standard StreamingScaler (scaler), features are scaled with the dataset-wide means and deviations
+instead of a StandardScaler fitted on every selection, so the same respondent is scaled the same way in every view.
+
+Cluster ids are made stable by sorting the clusters by their mean drug use (the order_by features, highest first),
+so Cluster 0 is always the heaviest-using group whatever KMeans' internal label order is.
+"""
+class ClusteringService:
+
+    def __init__(self, n_clusters: int = N_CLUSTERS, random_state: int = RANDOM_STATE, cache_size: int = CLUSTER_CACHE_SIZE,
+                 minibatch_threshold: int = MINIBATCH_THRESHOLD, batch_size: int = MINIBATCH_SIZE, order_by: list = None,
+                 scaler: StreamingScaler = None, warm_start: bool = False):
+        self.n_clusters = n_clusters
+        self.random_state = random_state
+        self.cache_size = cache_size
+        self.minibatch_threshold = minibatch_threshold
+        self.batch_size = batch_size
+        self.order_by = order_by
+        self.scaler = scaler.with_method('standard') if scaler is not None else None
+        self.warm_start = warm_start
+        self._cache = OrderedDict()
+        self._last_centers = None   # (features, centers in original units)
+
+    @staticmethod
+    def cache_key(selection: dict, features: list) -> tuple:
+        selection_key = tuple(sorted((col, tuple(sorted(map(str, values)))) for col, values in (selection or {}).items() if values is not None))
+        return selection_key, tuple(features)
+
+    # Warm start centroids for the given features in the new scaled space, or 'k-means++' when warm starts are off or there is no previous fit
+    def _initial_centers(self, features: list, scaler: 'preprocessing.StandardScaler'):
+        if not self.warm_start or self._last_centers is None or self._last_centers[0] != tuple(features):
+            return 'k-means++'
+        return scaler.transform(self._last_centers[1])
+
+    def _fit_model(self, values: np.ndarray, features: list):
+        if len(values) > self.minibatch_threshold:
+            if self.scaler is not None:
+                scaler = self.scaler.select(features)
+            else:
+                scaler = preprocessing.StandardScaler()
+                for start in range(0, len(values), self.batch_size):
+                    scaler.partial_fit(values[start:start + self.batch_size])
+            init = self._initial_centers(features, scaler)
+            model = cluster.MiniBatchKMeans(n_clusters=self.n_clusters, random_state=self.random_state, batch_size=self.batch_size,
+                                    init=init, n_init=1 if not isinstance(init, str) else 3)
+            for start in range(0, len(values), self.batch_size):
+                model.partial_fit(scaler.transform(values[start:start + self.batch_size]))
+        else:
+            scaler = self.scaler.select(features) if self.scaler is not None else preprocessing.StandardScaler().fit(values)
+            init = self._initial_centers(features, scaler)
+            model = cluster.KMeans(n_clusters=self.n_clusters, random_state=self.random_state, init=init,
+                           n_init=1 if not isinstance(init, str) else 'auto')
+            model.fit(scaler.transform(values))
+        return scaler, model
+
+    # Maps KMeans labels to stable ids: 0 for the cluster with the highest mean of the order_by features
+    def _stable_order(self, centers: np.ndarray, features: list) -> np.ndarray:
+        order_by = self.order_by or [col for col in features if col in CLEANED_DRUG_COLS] or features
+        score = centers[:, [features.index(col) for col in order_by]].sum(axis=1)
+        order = np.argsort(-score, kind='stable')
+        mapping = np.empty(len(order), dtype=np.int64)
+        mapping[order] = np.arange(len(order))
+        return mapping
+
+    # Predicts in chunks so large pools never build a full scaled copy
+    def _predict(self, scaler: 'preprocessing.StandardScaler', model, values: np.ndarray) -> np.ndarray:
+        return np.concatenate([model.predict(scaler.transform(values[start:start + self.batch_size]))
+                               for start in range(0, max(len(values), 1), self.batch_size)])[:len(values)]
+
+    """
+    Returns the stable cluster id of every row of df[features] (rows with missing values must be dropped first).
+    selection identifies the filter state the rows came from, e.g. {'gender': [...], 'age': [...], 'education': [...]}.
+    """
+    def fit_predict(self, df: pd.DataFrame, features: list, selection: dict = None) -> pd.Series:
+        features = list(features)
+        key = self.cache_key(selection, features) + (len(df),)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]['labels']
+
+        values = df[features].to_numpy(dtype=np.float64)
+        scaler, model = self._fit_model(values, features)
+
+        centers = scaler.inverse_transform(model.cluster_centers_)
+        mapping = self._stable_order(centers, features)
+        labels = pd.Series(mapping[self._predict(scaler, model, values)], index=df.index, name='Cluster')
+
+        self._last_centers = (tuple(features), centers[np.argsort(mapping)])
+        self._cache[key] = {'scaler': scaler, 'model': model, 'mapping': mapping, 'labels': labels}
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return labels
+
+    # Cluster centroids of a cached fit in original units, indexed by stable cluster id
+    def centers(self, features: list, selection: dict = None, n_rows: int = None) -> pd.DataFrame:
+        for key, entry in reversed(self._cache.items()):
+            if key[:2] == self.cache_key(selection, features) and (n_rows is None or key[2] == n_rows):
+                centers = entry['scaler'].inverse_transform(entry['model'].cluster_centers_)
+                return pd.DataFrame(centers[np.argsort(entry['mapping'])], columns=list(features))
+        raise KeyError('No cached clustering for this selection and feature set')
@@ -0,0 +1,129 @@
+import numpy as np
+import pandas as pd
+
+
+"""
+Computes a rows x cols Pearson correlation block from sufficient statistics: the row count n, the column sums and sums of squares
+of the row and column variables, and their rows x cols cross-product matrix. Shared by CorrelationStats and AggregateCube.
+"""
+def pearson_from_moments(n: float, row_sums: np.ndarray, col_sums: np.ndarray, row_squares: np.ndarray,
+                         col_squares: np.ndarray, cross_products: np.ndarray) -> np.ndarray:
+    cov = cross_products - np.outer(row_sums, col_sums) / n
+    row_var = row_squares - row_sums ** 2 / n
+    col_var = col_squares - col_sums ** 2 / n
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return cov / np.sqrt(np.outer(row_var, col_var))
+
+
+"""Returns the midrank (average rank, 1-based) of every distinct value from its count, as scipy/pandas average ranking does."""
+def _midranks(counts: np.ndarray) -> np.ndarray:
+    return np.cumsum(counts) - (counts - 1) / 2
+
+
+"""
+Streaming correlation between a set of row variables and column variables (e.g. 7 traits x 19 drugs), computing only that block.
+Batches of respondents can be added and removed without a full recompute; each update costs time proportional to the batch, not the history.
+
+method='pearson' keeps sums, sums of squares and the rows x cols cross-products.
+method='spearman' keeps a joint count table per (row, col) pair over the distinct values seen, and ranks from those tables
+(average ranks for ties). It suits ordinal columns such as drug levels 0-6 and the quantized trait scores; continuous
+columns with many distinct values make the tables large.
+Rows with missing values in any of the variables must be dropped before they are added.
+"""
+class CorrelationStats:
+
+    def __init__(self, rows: list, cols: list = None, method: str = 'pearson'):
+        if method not in ('pearson', 'spearman'):
+            raise ValueError(f"method must be 'pearson' or 'spearman', got {method!r}")
+        self.rows = list(rows)
+        self.cols = list(rows) if cols is None else list(cols)
+        self.method = method
+        self.n = 0
+
+        if method == 'pearson':
+            self.variables = list(dict.fromkeys(self.rows + self.cols))
+            self.sums = np.zeros(len(self.variables))
+            self.squares = np.zeros(len(self.variables))
+            self.cross_products = np.zeros((len(self.rows), len(self.cols)))
+        else:
+            self.values = {col: np.zeros(0) for col in dict.fromkeys(self.rows + self.cols)}
+            self.tables = [[np.zeros((0, 0), dtype=np.int64) for _ in self.cols] for _ in self.rows]
+
+    # Extends the known distinct values of col with those in new_values and re-lays out every table that uses col
+    def _extend_values(self, col: str, new_values: np.ndarray) -> None:
+        known = self.values[col]
+        merged = np.union1d(known, new_values)
+        if len(merged) == len(known):
+            return None
+        positions = np.searchsorted(merged, known)
+        for i, row in enumerate(self.rows):
+            for j, other in enumerate(self.cols):
+                table = self.tables[i][j]
+                if row == col:
+                    grown = np.zeros((len(merged), table.shape[1]), dtype=np.int64)
+                    grown[positions, :] = table
+                    self.tables[i][j] = table = grown
+                if other == col:
+                    grown = np.zeros((table.shape[0], len(merged)), dtype=np.int64)
+                    grown[:, positions] = table
+                    self.tables[i][j] = grown
+        self.values[col] = merged
+
+    def _update(self, df: pd.DataFrame, sign: int) -> 'CorrelationStats':
+        if self.method == 'pearson':
+            row_values = df[self.rows].to_numpy(dtype=np.float64)
+            col_values = df[self.cols].to_numpy(dtype=np.float64)
+            values = df[self.variables].to_numpy(dtype=np.float64)
+            self.sums += sign * values.sum(axis=0)
+            self.squares += sign * (values ** 2).sum(axis=0)
+            self.cross_products += sign * (row_values.T @ col_values)
+        else:
+            codes = {}
+            for col in self.values:
+                values = df[col].to_numpy(dtype=np.float64)
+                if sign > 0:
+                    self._extend_values(col, np.unique(values))
+                elif not np.isin(values, self.values[col]).all():
+                    raise ValueError(f'Cannot remove values of {col} that were never added')
+                codes[col] = np.searchsorted(self.values[col], values)
+            for i, row in enumerate(self.rows):
+                for j, col in enumerate(self.cols):
+                    shape = self.tables[i][j].shape
+                    counts = np.bincount(codes[row] * shape[1] + codes[col], minlength=shape[0] * shape[1])
+                    self.tables[i][j] += sign * counts.reshape(shape)
+        self.n += sign * len(df)
+        return self
+
+    # Adds a batch of respondents
+    def add(self, df: pd.DataFrame) -> 'CorrelationStats':
+        return self._update(df, 1)
+
+    # Removes a batch of respondents that was added before
+    def remove(self, df: pd.DataFrame) -> 'CorrelationStats':
+        return self._update(df, -1)
+
+    # Returns the rows x cols correlation block
+    def corr(self) -> pd.DataFrame:
+        if self.method == 'pearson':
+            row_index = [self.variables.index(row) for row in self.rows]
+            col_index = [self.variables.index(col) for col in self.cols]
+            block = pearson_from_moments(self.n, self.sums[row_index], self.sums[col_index],
+                                         self.squares[row_index], self.squares[col_index], self.cross_products)
+        else:
+            block = np.empty((len(self.rows), len(self.cols)))
+            mean_rank = (self.n + 1) / 2
+            for i, row in enumerate(self.rows):
+                for j, col in enumerate(self.cols):
+                    table = self.tables[i][j]
+                    row_counts, col_counts = table.sum(axis=1), table.sum(axis=0)
+                    row_ranks = _midranks(row_counts) - mean_rank
+                    col_ranks = _midranks(col_counts) - mean_rank
+                    cov = row_ranks @ table @ col_ranks
+                    with np.errstate(divide='ignore', invalid='ignore'):
+                        block[i, j] = cov / np.sqrt((row_counts * row_ranks ** 2).sum() * (col_counts * col_ranks ** 2).sum())
+        return pd.DataFrame(block, index=self.rows, columns=self.cols)
+
+
+"""Computes the rows x cols correlation block of df in one pass (without the full square matrix of DataFrame.corr)."""
+def correlation_block(df: pd.DataFrame, rows: list, cols: list = None, method: str = 'pearson') -> pd.DataFrame:
+    return CorrelationStats(rows, cols, method).add(df).corr()
@@ -0,0 +1,192 @@
+import numpy as np
+import pandas as pd
+
+from src.correlation import pearson_from_moments
+from src.data_cleaning import PERSONALITY_TRAITS, CLEANED_DRUG_COLS
+from src.decoding import CL_LEVELS
+
+# Creates global constants for the default cube layout used by the dashboard
+CUBE_KEY_COLS = ['gender', 'age', 'education']
+CUBE_VALUE_COLS = PERSONALITY_TRAITS + CLEANED_DRUG_COLS
+CUBE_HISTOGRAM_COL = 'drug_intensity_position'
+
+
+"""
+Computes matplotlib boxplot statistics (same as matplotlib.cbook.boxplot_stats) from a histogram of integer values,
+so boxplots can be drawn with Axes.bxp without the raw rows. Returns None for an empty histogram.
+With unique_fliers every flier value is listed once instead of once per row (the same markers, far fewer of them).
+"""
+def histogram_boxplot_stats(counts: np.ndarray, values: np.ndarray, whis: float = 1.5, label=None, unique_fliers: bool = False) -> dict:
+    counts = np.asarray(counts)
+    total = int(counts.sum())
+    if total == 0:
+        return None
+
+    cumulative = np.cumsum(counts)
+
+    # Returns the value at a 0-based position of the sorted data
+    def value_at(rank: int) -> float:
+        return values[np.searchsorted(cumulative, rank, side='right')]
+
+    # Linear interpolation between the closest ranks, like np.percentile
+    def percentile(q: float) -> float:
+        position = q / 100 * (total - 1)
+        lower = int(np.floor(position))
+        low_value = value_at(lower)
+        high_value = value_at(min(lower + 1, total - 1))
+        return low_value + (high_value - low_value) * (position - lower)
+
+    q1, median, q3 = percentile(25), percentile(50), percentile(75)
+    iqr = q3 - q1
+    present = values[counts > 0]
+
+    inside_low = present[present >= q1 - whis * iqr]
+    inside_high = present[present <= q3 + whis * iqr]
+    whislo = inside_low.min() if len(inside_low) else q1
+    whishi = inside_high.max() if len(inside_high) else q3
+    outside = (values < whislo) | (values > whishi)
+    if unique_fliers:
+        fliers = values[outside & (counts > 0)]
+    else:
+        fliers = np.repeat(values, counts)[np.repeat(outside, counts)]
+
+    return {
+        'label': label, 'mean': float((counts * values).sum() / total), 'iqr': iqr,
+        'q1': q1, 'med': median, 'q3': q3, 'whislo': whislo, 'whishi': whishi, 'fliers': fliers,
+    }
+
+
+"""
+Returns a boolean mask over the flattened cells (key columns in order, row-major) of the demographic values a
+selection allows; levels maps every key column to the pd.Index of its values.
+"""
+def selection_cell_mask(levels: dict, key_cols: list, selection: dict = None) -> np.ndarray:
+    selection = selection or {}
+    mask = np.ones((), dtype=bool)
+    for col in key_cols:
+        allowed = selection.get(col)
+        key_mask = np.ones(len(levels[col]), dtype=bool) if allowed is None else levels[col].isin(list(allowed))
+        mask = np.logical_and.outer(mask, key_mask)
+    return np.asarray(mask).reshape(-1)
+
+
+"""
+Aggregate cube of sufficient statistics keyed by the demographic cells (gender, age, education by default).
+Every cell stores its row count, per-column sums, cross-products (sums of squares on the diagonal), min/max,
+drug level histograms and a histogram of drug_intensity_position. Any filter selection is answered by adding up the
+selected cells, so means, correlations and distributions never rescan respondent rows.
+
+A selection is a dict {key column: allowed values}; key columns left out (or set to None) are not filtered.
+"""
+class AggregateCube:
+
+    def __init__(self, df: pd.DataFrame, key_cols: list = CUBE_KEY_COLS, value_cols: list = CUBE_VALUE_COLS,
+                 drug_cols: list = CLEANED_DRUG_COLS, histogram_col: str = CUBE_HISTOGRAM_COL):
+        self.key_cols = list(key_cols)
+        self.value_cols = list(value_cols)
+        self.drug_cols = list(drug_cols)
+        self.histogram_col = histogram_col
+
+        codes = []
+        self.levels = {}
+        for col in self.key_cols:
+            code, uniques = pd.factorize(df[col], sort=True, use_na_sentinel=False)
+            codes.append(code)
+            self.levels[col] = pd.Index(uniques)
+        self.shape = tuple(len(self.levels[col]) for col in self.key_cols)
+        n_cells = int(np.prod(self.shape))
+        cells = np.ravel_multi_index(codes, self.shape) if len(df) else np.zeros(0, dtype=np.intp)
+
+        # Groups the rows by cell once, so every per-cell statistic is a contiguous slice
+        order = np.argsort(cells, kind='stable')
+        values = df[self.value_cols].to_numpy(dtype=np.float64)[order]
+        self.counts = np.bincount(cells, minlength=n_cells)
+        bounds = np.concatenate([[0], np.cumsum(self.counts)])
+
+        n_values = len(self.value_cols)
+        self.sums = np.zeros((n_cells, n_values))
+        self.cross_products = np.zeros((n_cells, n_values, n_values))
+        self.mins = np.full((n_cells, n_values), np.inf)
+        self.maxs = np.full((n_cells, n_values), -np.inf)
+        for cell in np.flatnonzero(self.counts):
+            block = values[bounds[cell]:bounds[cell + 1]]
+            self.sums[cell] = block.sum(axis=0)
+            self.cross_products[cell] = block.T @ block
+            self.mins[cell] = block.min(axis=0)
+            self.maxs[cell] = block.max(axis=0)
+
+        n_drugs, n_levels = len(self.drug_cols), len(CL_LEVELS)
+        drug_levels = df[self.drug_cols].to_numpy(dtype=np.int64)
+        level_index = (cells[:, None] * n_drugs + np.arange(n_drugs)) * n_levels + drug_levels
+        self.level_counts = np.bincount(level_index.ravel(), minlength=n_cells * n_drugs * n_levels).reshape(n_cells, n_drugs, n_levels)
+
+        intensity = df[self.histogram_col].to_numpy(dtype=np.int64)
+        self.histogram_values = np.arange(intensity.max() + 1 if len(intensity) else 1)
+        n_bins = len(self.histogram_values)
+        self.histogram_counts = np.bincount(cells * n_bins + intensity, minlength=n_cells * n_bins).reshape(n_cells, n_bins)
+
+    def _cell_mask(self, selection: dict = None) -> np.ndarray:
+        return selection_cell_mask(self.levels, self.key_cols, selection)
+
+    def count(self, selection: dict = None) -> int:
+        return int(self.counts[self._cell_mask(selection)].sum())
+
+    def mean(self, selection: dict = None) -> pd.Series:
+        mask = self._cell_mask(selection)
+        return pd.Series(self.sums[mask].sum(axis=0) / self.counts[mask].sum(), index=self.value_cols)
+
+    # Sample covariance (ddof=1) of the value columns over the selected cells
+    def cov(self, selection: dict = None) -> pd.DataFrame:
+        mask = self._cell_mask(selection)
+        n = self.counts[mask].sum()
+        sums = self.sums[mask].sum(axis=0)
+        cross_products = self.cross_products[mask].sum(axis=0)
+        cov = (cross_products - np.outer(sums, sums) / n) / (n - 1)
+        return pd.DataFrame(cov, index=self.value_cols, columns=self.value_cols)
+
+    # Pearson correlation over the selected cells, optionally only the rows x cols block
+    def corr(self, selection: dict = None, rows: list = None, cols: list = None) -> pd.DataFrame:
+        mask = self._cell_mask(selection)
+        rows = rows or self.value_cols
+        cols = cols or self.value_cols
+        row_index = [self.value_cols.index(row) for row in rows]
+        col_index = [self.value_cols.index(col) for col in cols]
+
+        sums = self.sums[mask].sum(axis=0)
+        cross_products = self.cross_products[mask].sum(axis=0)
+        squares = np.diag(cross_products)
+        block = pearson_from_moments(self.counts[mask].sum(), sums[row_index], sums[col_index], squares[row_index],
+                                     squares[col_index], cross_products[np.ix_(row_index, col_index)])
+        return pd.DataFrame(block, index=rows, columns=cols)
+
+    # count, mean, std, min and max of the value columns (the parts of DataFrame.describe that can be merged)
+    def describe(self, selection: dict = None) -> pd.DataFrame:
+        mask = self._cell_mask(selection)
+        n = self.counts[mask].sum()
+        return pd.DataFrame({
+            'count': float(n),
+            'mean': self.mean(selection),
+            'std': np.sqrt(np.diag(self.cov(selection).to_numpy())),
+            'min': self.mins[mask].min(axis=0),
+            'max': self.maxs[mask].max(axis=0),
+        }, index=self.value_cols).T
+
+    # Respondent counts per drug (rows) and level 0-6 (columns) over the selected cells
+    def drug_level_counts(self, selection: dict = None) -> pd.DataFrame:
+        counts = self.level_counts[self._cell_mask(selection)].sum(axis=0)
+        return pd.DataFrame(counts, index=self.drug_cols, columns=CL_LEVELS.tolist())
+
+    # Boxplot statistics of the histogram column for every level of `by` within the selection
+    def boxplot_stats(self, by: str, selection: dict = None, unique_fliers: bool = False) -> list:
+        mask = self._cell_mask(selection).reshape(self.shape)
+        axis = self.key_cols.index(by)
+        histograms = self.histogram_counts.reshape(self.shape + (-1,))
+
+        stats = []
+        for position, level in enumerate(self.levels[by]):
+            level_mask = np.take(mask, [position], axis=axis)
+            level_histograms = np.take(histograms, [position], axis=axis)[level_mask]
+            level_stats = histogram_boxplot_stats(level_histograms.sum(axis=0), self.histogram_values, label=level, unique_fliers=unique_fliers)
+            if level_stats is not None:
+                stats.append(level_stats)
+        return stats
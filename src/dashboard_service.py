@@ -0,0 +1,247 @@
+import io
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from src.bitmap_index import BitmapIndex
+from src.clustering import ClusteringService
+from src.cube import AggregateCube
+from src.data_cleaning import PERSONALITY_TRAITS, CLEANED_DRUG_COLS
+from src.tracing import traced_stage
+from src.usage_histogram import UsageHistogram
+from src.bootstrap import trait_drug_intervals
+from src.large_data import is_large
+from src.visualization import plot_boxplot_from_stats, plot_density_scatter, plot_interval_bars
+from src.lazy_import import lazy_import
+
+# Plotting libraries are imported when the first section is drawn
+sns = lazy_import('seaborn')
+mpl_figure = lazy_import('matplotlib.figure')
+
+# Creates global constant with the dashboard sections in page order
+DASHBOARD_SECTIONS = ['overview', 'barplot', 'summary', 'heatmap', 'clusters', 'boxplots']
+
+# Creates global constant with the part of the dashboard state each section depends on
+SECTION_INPUTS = {
+    'overview': ('selection',),
+    'barplot': ('trait', 'drug'),
+    'summary': (),
+    'heatmap': ('selection',),
+    'clusters': ('selection',),
+    'boxplots': ('selection',),
+}
+
+# Creates global constants for the section pool and payload cache
+SECTION_WORKERS = 4
+SECTION_CACHE_SIZE = 128
+SAVEFIG_OPTIONS = {'bbox_inches': 'tight', 'dpi': 200, 'format': 'png'}   # what st.pyplot saves figures with
+
+
+"""Saves a Figure (created with the object-oriented API, so worker threads never touch pyplot state) as PNG bytes."""
+def figure_png(fig: 'mpl_figure.Figure') -> bytes:
+    buffer = io.BytesIO()
+    fig.savefig(buffer, **SAVEFIG_OPTIONS)
+    return buffer.getvalue()
+
+
+def _selection_key(selection: dict) -> tuple:
+    return tuple(sorted((col, tuple(sorted(map(str, values)))) for col, values in (selection or {}).items() if values is not None))
+
+
+"""
+Handle on the section payloads of one dashboard state. as_completed() yields (section, future) as each payload is
+ready, in completion order, so the page can stream sections; cancel() withdraws the request when the user has
+already moved on (sections no other request is waiting for are cancelled or abandoned at their next checkpoint).
+"""
+class SectionRequest:
+
+    def __init__(self, service: 'DashboardService', futures: dict):
+        self.service = service
+        self.futures = futures
+        self.cancelled = False
+
+    def as_completed(self, timeout: float = None):
+        names = {future: name for name, future in self.futures.items()}
+        for future in as_completed(names, timeout=timeout):
+            if future.cancelled() or isinstance(future.exception(), CancelledError):
+                continue
+            yield names[future], future
+
+    def result(self, section: str, timeout: float = None):
+        return self.futures[section].result(timeout)
+
+    def cancel(self) -> None:
+        if not self.cancelled:
+            self.cancelled = True
+            self.service._release(self)
+
+
+"""
+Data-service layer for app.py: computes the payload of every dashboard section (tables, or figures already rendered
+to PNG) concurrently in a thread pool, so the page can show each section as soon as it is ready instead of running
+them one after another.
+
+Payloads are cached (LRU) by the part of the state they depend on (SECTION_INPUTS), so changing the drug only
+recomputes the barplot. Requests for a section that is already being computed share one task. The default,
+unfiltered view is submitted at construction, so the first page load is served from finished or running tasks.
+Threads are used instead of processes because the sections share the cube, bitmap index and cluster models, and
+the numpy/scikit-learn work and Agg rendering they do runs alongside the script thread. The barplot is drawn from the
+usage histogram table (built from df when not given), so it does not aggregate respondent rows, with the bootstrap
+confidence intervals of intervals (a bootstrap_trait_means table) when given.
+"""
+class DashboardService:
+
+    def __init__(self, df: pd.DataFrame, cube: AggregateCube, bitmap_index: BitmapIndex, clustering_service: ClusteringService,
+                 trait_cols: list = PERSONALITY_TRAITS, drug_cols: list = CLEANED_DRUG_COLS, workers: int = SECTION_WORKERS,
+                 cache_size: int = SECTION_CACHE_SIZE, precompute: bool = True, histogram: UsageHistogram = None,
+                 intervals: pd.DataFrame = None):
+        self.df = df
+        self.cube = cube
+        self.bitmap_index = bitmap_index
+        self.clustering_service = clustering_service
+        self.trait_cols = list(trait_cols)
+        self.drug_cols = list(drug_cols)
+        self.histogram = histogram if histogram is not None else UsageHistogram.from_data(df, drug_cols=self.drug_cols, trait_cols=self.trait_cols)
+        self.intervals = intervals
+        self.cache_size = cache_size
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dashboard-section')
+        self._lock = threading.Lock()
+        self._cluster_lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._inflight = {}   # key -> {'future', 'waiters', 'cancel'}
+        self.default_request = self.submit(self.default_state()) if precompute else None
+
+    # The unfiltered view the page opens with: every demographic value selected, the first trait and drug
+    def default_state(self) -> dict:
+        selection = {col: list(self.df[col].unique()) for col in ('gender', 'age', 'education')}
+        return {'selection': selection, 'trait': self.trait_cols[0], 'drug': self.drug_cols[0]}
+
+    @staticmethod
+    def section_key(section: str, state: dict) -> tuple:
+        key = [section]
+        for name in SECTION_INPUTS[section]:
+            key.append(_selection_key(state[name]) if name == 'selection' else state[name])
+        return tuple(key)
+
+    """
+    Starts (or reuses) the computation of every section for state = {'selection', 'trait', 'drug'} and returns a
+    SectionRequest. Cached sections come back as finished futures.
+    """
+    def submit(self, state: dict, sections: list = DASHBOARD_SECTIONS) -> SectionRequest:
+        request = SectionRequest(self, {})
+        positions = None
+        with self._lock:
+            for section in sections:
+                key = self.section_key(section, state)
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    future = Future()
+                    future.set_result(self._cache[key])
+                elif key in self._inflight:
+                    self._inflight[key]['waiters'].add(id(request))
+                    future = self._inflight[key]['future']
+                else:
+                    if positions is None and 'selection' in SECTION_INPUTS[section]:
+                        positions = self.bitmap_index.positions(state['selection'])
+                    cancel = threading.Event()
+                    future = self._pool.submit(self._run, section, key, state, positions, cancel)
+                    self._inflight[key] = {'future': future, 'waiters': {id(request)}, 'cancel': cancel}
+                request.futures[section] = future
+        return request
+
+    # Drops the request from every running section; sections nobody waits for any more are cancelled
+    def _release(self, request: SectionRequest) -> None:
+        with self._lock:
+            for key, entry in list(self._inflight.items()):
+                entry['waiters'].discard(id(request))
+                if not entry['waiters']:
+                    entry['cancel'].set()
+                    entry['future'].cancel()
+                    del self._inflight[key]
+
+    def _run(self, section: str, key: tuple, state: dict, positions, cancel: threading.Event):
+        try:
+            if cancel.is_set():
+                raise CancelledError()
+            rows = len(self.df) if positions is None else len(positions)
+            with traced_stage(section, category='dashboard', rows_in=rows):
+                payload = getattr(self, f'_compute_{section}')(state, positions, cancel)
+            with self._lock:
+                self._cache[key] = payload
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            return payload
+        finally:
+            with self._lock:
+                if self._inflight.get(key, {}).get('cancel') is cancel:
+                    del self._inflight[key]
+
+    @staticmethod
+    def _checkpoint(cancel: threading.Event) -> None:
+        if cancel.is_set():
+            raise CancelledError()
+
+    # --- Section payloads ---
+
+    def _compute_overview(self, state: dict, positions, cancel: threading.Event) -> dict:
+        return {'count': len(positions), 'head': self.df.iloc[positions[:5]]}
+
+    def _compute_barplot(self, state: dict, positions, cancel: threading.Event) -> bytes:
+        trait, drug = state['trait'], state['drug']
+        fig = mpl_figure.Figure(figsize=(8, 5))
+        ax = fig.subplots()
+        sns.barplot(x=drug, y=trait, data=self.histogram.trait_means(trait, drug), errorbar=None, palette='coolwarm', ax=ax)
+        if self.intervals is not None:
+            plot_interval_bars(ax, trait_drug_intervals(self.intervals, trait, drug))
+        ax.set_title(f'{trait} vs {drug} Usage', fontsize=14, fontweight='bold')
+        self._checkpoint(cancel)
+        return figure_png(fig)
+
+    def _compute_summary(self, state: dict, positions, cancel: threading.Event) -> pd.DataFrame:
+        return self.df.describe()
+
+    def _compute_heatmap(self, state: dict, positions, cancel: threading.Event) -> bytes:
+        cols = self.trait_cols + self.drug_cols
+        corr = self.cube.corr(state['selection'], rows=cols, cols=cols)
+        self._checkpoint(cancel)
+        fig = mpl_figure.Figure(figsize=(12, 8))
+        ax = fig.subplots()
+        sns.heatmap(corr, cmap='coolwarm', annot=False, ax=ax)
+        ax.set_title('Correlation Between Personality Traits and Drug Use', fontsize=14, fontweight='bold')
+        self._checkpoint(cancel)
+        return figure_png(fig)
+
+    # KMeans on the selected respondents (cached per selection, Cluster 0 = heaviest drug use); large selections are drawn as a density
+    def _compute_clusters(self, state: dict, positions, cancel: threading.Event) -> bytes:
+        features = self.trait_cols + self.drug_cols
+        filtered_df = self.df.iloc[positions]
+        cluster_features = filtered_df[features].dropna()
+        with self._cluster_lock:
+            self._checkpoint(cancel)
+            clusters = self.clustering_service.fit_predict(cluster_features, features, state['selection'])
+        clustered_df = filtered_df.loc[cluster_features.index].assign(Cluster=clusters)
+        self._checkpoint(cancel)
+
+        fig = mpl_figure.Figure(figsize=(8, 6))
+        ax = fig.subplots()
+        plot_density_scatter(ax, clustered_df, 'impulsivity_impulsive', 'sensation_seeking_ss', hue='Cluster', palette='Set2')
+        ax.set_title('Clusters Based on Personality and Drug Use', fontsize=14, fontweight='bold')
+        return figure_png(fig)
+
+    def _compute_boxplots(self, state: dict, positions, cancel: threading.Event) -> bytes:
+        selection = state['selection']
+        # Past the large-data threshold each flier value is drawn once instead of once per respondent
+        unique_fliers = is_large(len(positions))
+        fig = mpl_figure.Figure(figsize=(18, 6))
+        ax = fig.subplots(1, 3)
+        plot_boxplot_from_stats(ax[0], self.cube.boxplot_stats('age', selection, unique_fliers), 'Blues', 'Drug Use Intensity by Age Group', 'age')
+        plot_boxplot_from_stats(ax[1], self.cube.boxplot_stats('gender', selection, unique_fliers), 'Set2', 'Drug Use Intensity by Gender', 'gender')
+        plot_boxplot_from_stats(ax[2], self.cube.boxplot_stats('education', selection, unique_fliers), 'viridis', 'Drug Use Intensity by Education', 'education')
+        fig.tight_layout()
+        self._checkpoint(cancel)
+        return figure_png(fig)
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
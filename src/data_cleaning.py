@@ -1,12 +1,47 @@
 import pandas as pd
-from sklearn.preprocessing import MinMaxScaler
-import seaborn as sns
-import matplotlib.pyplot as plt
+from src.decoding import FREQUENCY_LABELS, decode_drug_use_ratings, decode_age_midpoints, decode_usage_frequency_labels
+from src.scoring import HEAVY_USE_LEVEL, HEAVY_USER_MIN_DRUGS, OUTLIER_THRESHOLD, score_drug_levels, replace_outliers, drug_level_matrix
+from src.scaling import StreamingScaler
+from src.lazy_import import lazy_import
+
+# Plotting libraries are imported on first use, so the cleaning functions only need pandas and NumPy
+sns = lazy_import('seaborn')
+plt = lazy_import('matplotlib.pyplot')
 
 # Creates global constants for filepaths
 FILEPATH_RAW = '../data/raw/Drug_Consumption.csv'
 FILEPATH_CLEANED = '../data/cleaned/cleaned_drug_consumption.csv'
 
+# Creates global constants for the column groups used by the cleaning steps
+RAW_DRUG_COLS = ['Alcohol', 'Amphet', 'Amyl', 'Benzos', 'Caff', 'Cannabis', 'Choc', 'Coke', 'Crack', 'Ecstasy', 'Heroin', 'Ketamine', 'Legalh', 'LSD', 'Meth', 'Mushrooms', 'Nicotine', 'Semer', 'VSA']
+RENAMED_DRUG_COLS = ['Alcohol', 'amphetamine', 'amyl_nitrate', 'benzodiazepines', 'caffeine', 'Cannabis', 'chocolate', 'cocaine', 'crack_cocaine', 'Ecstasy', 'Heroin', 'Ketamine', 'legal_highs', 'LSD', 'methamphetamine', 'magic_mushrooms', 'Nicotine', 'Semer', 'volatile_solvent_abuse']
+CLEANED_DRUG_COLS = ['alcohol', 'amphetamine', 'amyl_nitrate', 'benzodiazepines', 'caffeine', 'cannabis', 'chocolate', 'cocaine', 'crack_cocaine', 'ecstasy', 'heroin', 'ketamine', 'legal_highs', 'lsd', 'methamphetamine', 'magic_mushrooms', 'nicotine', 'semer', 'volatile_solvent_abuse']
+AGE_COLS = ['Age']
+DEMOGRAPHIC_COLS = ['gender', 'education', 'country', 'ethnicity']
+PERSONALITY_TRAIT_NAMES = {
+    'Nscore': 'neuroticism_nscore',
+    'Escore': 'extraversion_escore',
+    'Oscore': 'openness_oscore',
+    'AScore': 'agreeableness_ascore',
+    'Cscore': 'conscientiousness_cscore',
+    'Impulsive': 'impulsivity_impulsive',
+    'SS': 'sensation_seeking_ss'
+}
+DRUG_COLUMN_NAMES = {
+    'Amphet': 'amphetamine',
+    'Amyl': 'amyl_nitrate',
+    'Benzos': 'benzodiazepines',
+    'Caff': 'caffeine',
+    'Choc': 'chocolate',
+    'Coke': 'cocaine',
+    'Crack': 'crack_cocaine',
+    'Legalh': 'legal_highs',
+    'Meth': 'methamphetamine',
+    'Mushrooms': 'magic_mushrooms',
+    'VSA': 'volatile_solvent_abuse'
+}
+PERSONALITY_TRAITS = ['neuroticism_nscore', 'extraversion_escore', 'openness_oscore', 'agreeableness_ascore', 'conscientiousness_cscore', 'impulsivity_impulsive', 'sensation_seeking_ss']
+
 """Loads the dataset from a CSV file into a pandas DataFrame."""
 def load_dataset(filepath: str) -> pd.DataFrame:
   return pd.read_csv(filepath)
@@ -20,48 +55,17 @@ def clean_column_names(df: pd.DataFrame) -> pd.DataFrame:
   df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_')
   return df
 
-"""Converts drug use ratings in specified columns to numerical values."""
-def convert_drug_use_ratings(df: pd.DataFrame, drug_cols: list) -> pd.DataFrame:
+"""Converts drug use ratings (CL0-CL6) in specified columns to int8 values 0-6. Unknown codes raise UnknownCodeError unless errors='coerce'."""
+def convert_drug_use_ratings(df: pd.DataFrame, drug_cols: list, errors: str = 'raise') -> pd.DataFrame:
+  return decode_drug_use_ratings(df, drug_cols, errors=errors)
 
-  category_dict = {
-      'CL0': 0,  
-      'CL1': 1,  
-      'CL2': 2, 
-      'CL3': 3,  
-      'CL4': 4, 
-      'CL5': 5,  
-      'CL6': 6   
-  }
-
-  df[drug_cols] = df[drug_cols].replace(category_dict)
-  return df
-
-"""Converts age ranges in Age column to their midpoint numerical values."""
-def convert_to_midpoint(df: pd.DataFrame, age_col: list) -> pd.DataFrame:
-   
-    midpoint_dict = {
-        '18-24': 21,    
-        '25-34': 29.5,  
-        '35-44': 39.5,  
-        '45-54': 49.5,    
-        '55-64': 59.5,  
-        '65+': 70,
-    }
-
-    df[age_col] = df[age_col].replace(midpoint_dict)
-    return df
+"""Converts age ranges in Age column to their midpoint numerical (float) values."""
+def convert_to_midpoint(df: pd.DataFrame, age_col: list, errors: str = 'raise') -> pd.DataFrame:
+    return decode_age_midpoints(df, age_col, errors=errors)
 
 """Changes column headers for personality traits to more descriptive names."""
 def rename_personality_traits(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.rename(columns={
-        'Nscore': 'neuroticism_nscore',
-        'Escore': 'extraversion_escore',
-        'Oscore': 'openness_oscore',
-        'AScore': 'agreeableness_ascore',
-        'Cscore': 'conscientiousness_cscore',
-        'Impulsive': 'impulsivity_impulsive',
-        'SS': 'sensation_seeking_ss'
-    })
+    df = df.rename(columns=PERSONALITY_TRAIT_NAMES)
     return df
 
 """
@@ -74,30 +78,18 @@ def add_drug_intensity_position(df: pd.DataFrame, drug_cols: list) -> pd.DataFra
 """ Changes column names for some of the drug column names to be more descriptive. """
 
 def rename_drug_columns(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.rename(columns={
-        'Amphet': 'amphetamine',
-        'Amyl': 'amyl_nitrate',
-        'Benzos': 'benzodiazepines',
-        'Caff': 'caffeine', 
-        'Choc': 'chocolate',
-        'Coke': 'cocaine',
-        'Crack': 'crack_cocaine',
-        'Legalh': 'legal_highs',
-        'Meth': 'methamphetamine',
-        'Mushrooms': 'magic_mushrooms',
-        'VSA': 'volatile_solvent_abuse'
-    })
+    df = df.rename(columns=DRUG_COLUMN_NAMES)
     return df
 
 
 """
 Transforms personality traits scores to numeric values between 0 and 1. This makes comparisons cleaner and more intuitive when plotting graphs
+Pass a fitted (e.g. loaded) StreamingScaler to scale with saved bounds instead of fitting on df.
 """
-def apply_min_max_scaling(df: pd.DataFrame, min_max_personality_traits: list) -> pd.DataFrame:
-    min_max_scaler = MinMaxScaler()
-    df_scaled = df.copy()
-    df_scaled[min_max_personality_traits] = min_max_scaler.fit_transform(df_scaled[min_max_personality_traits])
-    return df_scaled
+def apply_min_max_scaling(df: pd.DataFrame, min_max_personality_traits: list, scaler: StreamingScaler = None) -> pd.DataFrame:
+    if scaler is None:
+        scaler = StreamingScaler().partial_fit(df[min_max_personality_traits])
+    return scaler.transform(df)
 
 
 """ Creates function to visualize and verify data balance across demographics and personality traits. """
@@ -129,55 +121,37 @@ def visualize_data_balance(df: pd.DataFrame, demographic_cols: list, personality
     return None
 
 
-"""Creates usage_frequency and heavy_user columns to flag frequent daily and weekly drug users."""
+"""
+Creates usage_frequency and heavy_user columns to flag frequent daily and weekly drug users.
+usage_frequency counts the drugs used at use_level or above, heavy_user flags rows with at least heavy_count of them.
+"""
 
-def flag_heavy_users(df: pd.DataFrame, drug_cols: list) -> pd.DataFrame:
+def flag_heavy_users(df: pd.DataFrame, drug_cols: list, verbose: bool = True, use_level: int = HEAVY_USE_LEVEL, heavy_count: int = HEAVY_USER_MIN_DRUGS) -> pd.DataFrame:
 
-    df['usage_frequency'] = df[drug_cols].apply(lambda row: sum(1 for val in row if val >= 5), axis=1)
-    
-    df['heavy_user'] = df['usage_frequency'] >= 5
+    scores = score_drug_levels(drug_level_matrix(df, drug_cols), use_level, heavy_count)
+    df['usage_frequency'] = scores['usage_frequency']
+    df['heavy_user'] = scores['heavy_user']
 
     summary = pd.DataFrame({
-        'Usage Frequency': ['Never Used', 'Used Over a Decade Ago', 'Used in Last Decade', 'Used in Last Year', 'Monthly User', 'Weekly User', 'Daily User'],
-        'heavy_user': [
-            (df[drug_cols] == 0).sum().sum(),          
-            (df[drug_cols] == 1).sum().sum(),          
-            (df[drug_cols] == 2).sum().sum(),         
-            (df[drug_cols] == 3).sum().sum(), 
-            (df[drug_cols] == 4).sum().sum(),          
-            (df[drug_cols] == 5).sum().sum(),       
-            (df[drug_cols] == 6).sum().sum(),         
-        ]
+        'Usage Frequency': FREQUENCY_LABELS,
+        'heavy_user': scores['histogram']
     })
 
-    print(summary.to_string(index=False))
+    if verbose:
+        print(summary.to_string(index=False))
     return df, summary
 
-""" Replaces outlier values that are higher than 6 with the average  value of that column"""
+""" Replaces outlier values that are higher than threshold (6 by default) with the average value of that column"""
 
-def replace_outliers_with_mean(df: pd.DataFrame, col: str) -> pd.DataFrame:
+def replace_outliers_with_mean(df: pd.DataFrame, col: str, threshold: float = OUTLIER_THRESHOLD) -> pd.DataFrame:
 
-    mean_value = df[col].mean()  
-    df[col] = df[col].apply(lambda x: mean_value if x > 6 else x)
+    df[col] = replace_outliers(df[col].to_numpy(), threshold, df[col].mean())
     return df
 
-""" Converts float values in user_frequency column to String labels for better readability in visualizations."""
+""" Converts float values in user_frequency column to categorical labels for better readability in visualizations."""
 
-def convert_usage_frequency_to_labels(df: pd.DataFrame) -> pd.DataFrame:
-
-    frequency_labels_dict = {
-        0: 'Never Used',
-        1: 'Used Over a Decade Ago',
-        2: 'Used in Last Decade',
-        3: 'Used in Last Year',
-        3.6: 'Used in Last Year',
-        4: 'Monthly User',
-        5: 'Weekly User',
-        6: 'Daily User'
-    }
-    df['usage_frequency_label'] = df['usage_frequency'].replace(frequency_labels_dict)
-
-    return df
+def convert_usage_frequency_to_labels(df: pd.DataFrame, errors: str = 'raise') -> pd.DataFrame:
+    return decode_usage_frequency_labels(df, errors=errors)
 
 
 
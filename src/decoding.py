@@ -0,0 +1,124 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+
+# Creates global lookup tables for the coded survey answers
+CL_CODES = ['CL0', 'CL1', 'CL2', 'CL3', 'CL4', 'CL5', 'CL6']
+CL_LEVELS = np.arange(len(CL_CODES), dtype=np.int8)
+
+AGE_BANDS = ['18-24', '25-34', '35-44', '45-54', '55-64', '65+']
+AGE_MIDPOINTS = np.array([21, 29.5, 39.5, 49.5, 59.5, 70], dtype=np.float64)
+
+FREQUENCY_LABELS = ['Never Used', 'Used Over a Decade Ago', 'Used in Last Decade', 'Used in Last Year', 'Monthly User', 'Weekly User', 'Daily User']
+
+
+"""Raised when a column holds codes that are not in the lookup table it is decoded with."""
+class UnknownCodeError(ValueError):
+
+    def __init__(self, unknown: dict):
+        self.unknown = unknown
+        details = '; '.join(f'{col}: {codes}' for col, codes in unknown.items())
+        super().__init__(f'Unknown codes found ({details})')
+
+
+"""Looks up every value of a 2D array in the given codes and returns the positions, with -1 for unknown values."""
+def _lookup_positions(values: np.ndarray, codes: list) -> np.ndarray:
+    flat = values.ravel()
+    positions = pd.Index(codes).get_indexer(flat)
+    return positions.reshape(values.shape)
+
+
+"""Collects the distinct unknown values of each column as {column: [values]}."""
+def _collect_unknown(values: np.ndarray, positions: np.ndarray, cols: list) -> dict:
+    unknown = {}
+    for index, col in enumerate(cols):
+        mask = positions[:, index] < 0
+        if mask.any():
+            unknown[col] = pd.unique(values[mask, index]).tolist()
+    return unknown
+
+
+"""Raises or warns about unknown codes depending on errors ('raise' or 'coerce')."""
+def _report_unknown(unknown: dict, errors: str) -> None:
+    if not unknown:
+        return None
+    if errors == 'raise':
+        raise UnknownCodeError(unknown)
+    if errors == 'coerce':
+        warnings.warn(str(UnknownCodeError(unknown)) + ', they were set to missing', stacklevel=3)
+        return None
+    raise ValueError(f"errors must be 'raise' or 'coerce', got {errors!r}")
+
+
+"""Returns the unknown values per column without decoding anything."""
+def find_unknown_codes(df: pd.DataFrame, cols: list, codes: list) -> dict:
+    values = df[cols].to_numpy()
+    return _collect_unknown(values, _lookup_positions(values, codes), cols)
+
+
+"""
+Decodes CL0-CL6 drug use ratings into int8 levels 0-6 in one hash lookup over all drug columns.
+Columns that are already numeric are only range checked. With errors='coerce' unknown codes become <NA> (nullable Int8).
+"""
+def decode_drug_use_ratings(df: pd.DataFrame, drug_cols: list, errors: str = 'raise') -> pd.DataFrame:
+    drug_cols = list(drug_cols)
+    coded_cols = [col for col in drug_cols if not pd.api.types.is_numeric_dtype(df[col])]
+    numeric_cols = [col for col in drug_cols if col not in coded_cols]
+
+    if coded_cols:
+        values = df[coded_cols].to_numpy()
+        positions = _lookup_positions(values, CL_CODES)
+        unknown = _collect_unknown(values, positions, coded_cols)
+        _report_unknown(unknown, errors)
+
+        levels = CL_LEVELS[np.maximum(positions, 0)]
+        missing = positions < 0
+        for index, col in enumerate(coded_cols):
+            if missing[:, index].any():
+                df[col] = pd.arrays.IntegerArray(levels[:, index], missing[:, index])
+            else:
+                df[col] = levels[:, index]
+
+    if numeric_cols:
+        values = df[numeric_cols].to_numpy(dtype=np.float64, na_value=np.nan)
+        out_of_range = ~np.isin(values, CL_LEVELS)
+        unknown = {col: pd.unique(values[out_of_range[:, index], index]).tolist()
+                   for index, col in enumerate(numeric_cols) if out_of_range[:, index].any()}
+        _report_unknown(unknown, errors)
+        for index, col in enumerate(numeric_cols):
+            if out_of_range[:, index].any():
+                df[col] = pd.arrays.IntegerArray(np.where(out_of_range[:, index], 0, values[:, index]).astype(np.int8), out_of_range[:, index])
+            else:
+                df[col] = values[:, index].astype(np.int8)
+
+    return df
+
+
+"""Decodes age bands into float midpoints through the precomputed AGE_MIDPOINTS table."""
+def decode_age_midpoints(df: pd.DataFrame, age_cols: list, errors: str = 'raise') -> pd.DataFrame:
+    age_cols = list(age_cols)
+    values = df[age_cols].to_numpy()
+    positions = _lookup_positions(values, AGE_BANDS)
+    _report_unknown(_collect_unknown(values, positions, age_cols), errors)
+
+    midpoints = np.where(positions >= 0, AGE_MIDPOINTS[np.maximum(positions, 0)], np.nan)
+    for index, col in enumerate(age_cols):
+        df[col] = midpoints[:, index]
+    return df
+
+
+"""
+Decodes usage_frequency values into an ordered categorical usage_frequency_label column.
+Fractional values (the outlier mean, e.g. 3.6) take the label of the level below them, values outside 0-6 are unknown.
+"""
+def decode_usage_frequency_labels(df: pd.DataFrame, col: str = 'usage_frequency', label_col: str = 'usage_frequency_label', errors: str = 'raise') -> pd.DataFrame:
+    values = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+    found = (values >= 0) & (values <= len(FREQUENCY_LABELS) - 1)
+
+    if not found.all():
+        _report_unknown({col: pd.unique(values[~found]).tolist()}, errors)
+
+    codes = np.where(found, np.floor(np.where(found, values, 0)), -1).astype(np.int8)
+    df[label_col] = pd.Categorical.from_codes(codes, categories=FREQUENCY_LABELS, ordered=True)
+    return df
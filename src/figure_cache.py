@@ -0,0 +1,169 @@
+import hashlib
+import importlib
+import inspect
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from src.lazy_import import lazy_import
+
+# Creates global constants for the on-disk figure cache
+FIGURE_CACHE_DIR = '.figure_cache'
+FIGURE_CACHE_MAX_ENTRIES = 512
+
+# Creates global constant with the modules the charts are drawn with, whose source is part of every key
+FIGURE_MODULES = ['src.visualization', 'src.usage_histogram', 'src.bootstrap', 'src.large_data', 'src.correlation', 'src.cube']
+
+plt = lazy_import('matplotlib.pyplot')
+
+
+"""Temporarily turns plt.show into a no-op so the plotting functions leave their figures open for saving."""
+@contextmanager
+def suppress_show():
+    show = plt.show
+    plt.show = lambda *args, **kwargs: None
+    try:
+        yield
+    finally:
+        plt.show = show
+
+
+"""
+Calls func(df, *args, **kwargs) with plt.show disabled, saves every figure it opens into output_dir as
+<prefix><index>.<fmt> and closes those figures. Returns the saved paths in the order the figures were opened.
+"""
+def save_figures(func, df: pd.DataFrame, args: tuple, kwargs: dict, output_dir: str, fmt: str = 'png', prefix: str = '') -> list:
+    open_before = set(plt.get_fignums())
+    paths = []
+    try:
+        with suppress_show():
+            func(df, *args, **kwargs)
+        created = [num for num in plt.get_fignums() if num not in open_before]
+        for index, num in enumerate(created):
+            path = os.path.join(output_dir, f'{prefix}{index}.{fmt}')
+            plt.figure(num).savefig(path, format=fmt, bbox_inches='tight')
+            paths.append(path)
+    finally:
+        for num in set(plt.get_fignums()) - open_before:
+            plt.close(num)
+    return paths
+
+
+def _source(obj) -> str:
+    try:
+        return inspect.getsource(obj)
+    except (OSError, TypeError):
+        return ''
+
+
+"""
+Returns the plotting function's name and source with the source of its module and of FIGURE_MODULES, so editing a
+chart or any helper it draws with (plot_interval_bars, usage_histogram, ...) also invalidates its cached images.
+"""
+def _function_fingerprint(func) -> str:
+    modules = dict.fromkeys([func.__module__] + FIGURE_MODULES)
+    sources = [_source(importlib.import_module(name)) for name in modules]
+    return f'{func.__module__}.{func.__qualname__}:{_source(func)}:' + ''.join(sources)
+
+
+"""
+Adds a plot argument to the digest: DataFrames, Series, indexes and arrays by their contents (their repr is shortened
+by pandas and NumPy, so different inputs could share it), containers element by element, anything else by repr.
+"""
+def _hash_argument(digest, value) -> None:
+    if isinstance(value, pd.DataFrame):
+        digest.update(repr((type(value).__name__, list(value.columns), [str(dtype) for dtype in value.dtypes])).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, (pd.Series, pd.Index)):
+        digest.update(repr((type(value).__name__, value.name, str(value.dtype))).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=isinstance(value, pd.Series)).to_numpy().tobytes())
+    elif isinstance(value, np.ndarray):
+        digest.update(repr(('ndarray', value.dtype.str, value.shape)).encode())
+        digest.update(np.ascontiguousarray(value).tobytes() if value.dtype != object else repr(value.tolist()).encode())
+    elif isinstance(value, (list, tuple)):
+        digest.update(f'{type(value).__name__}[{len(value)}]'.encode())
+        for item in value:
+            _hash_argument(digest, item)
+    elif isinstance(value, dict):
+        digest.update(f'dict[{len(value)}]'.encode())
+        for name, item in sorted(value.items(), key=lambda pair: repr(pair[0])):
+            digest.update(repr(name).encode())
+            _hash_argument(digest, item)
+    else:
+        digest.update(repr(value).encode())
+
+
+"""
+Memoizing on-disk cache for the plotting functions in src/visualization.py.
+
+The key is a SHA-256 of the function (name and source), the contents of the input columns and the plot arguments.
+On a miss the function runs with plt.show disabled, every figure it opens is saved as PNG or SVG and then closed.
+On a hit the saved files are returned without plotting. Entries are evicted least recently used first once there
+are more than max_entries.
+"""
+class FigureCache:
+
+    def __init__(self, cache_dir: str = FIGURE_CACHE_DIR, max_entries: int = FIGURE_CACHE_MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, func, df: pd.DataFrame, args: tuple = (), kwargs: dict = None, fmt: str = 'png') -> str:
+        digest = hashlib.sha256()
+        digest.update(_function_fingerprint(func).encode())
+        digest.update(repr((list(df.columns), [str(dtype) for dtype in df.dtypes], fmt)).encode())
+        digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+        _hash_argument(digest, tuple(args))
+        _hash_argument(digest, dict(kwargs or {}))
+        return digest.hexdigest()
+
+    def _entry_files(self, entry_dir: str) -> list:
+        return [os.path.join(entry_dir, name) for name in sorted(os.listdir(entry_dir), key=lambda name: int(name.split('.')[0]))]
+
+    # Keeps at most max_entries entries, removing the least recently used ones
+    def _evict(self) -> None:
+        entries = [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir)
+                   if os.path.isdir(os.path.join(self.cache_dir, name)) and not name.startswith('.')]
+        if len(entries) <= self.max_entries:
+            return None
+        entries.sort(key=os.path.getmtime)
+        for entry_dir in entries[:len(entries) - self.max_entries]:
+            shutil.rmtree(entry_dir, ignore_errors=True)
+
+    """
+    Renders func(df, *args, **kwargs) or returns its cached images, as a list of file paths (one per figure).
+    When columns is given only those columns are hashed and passed to func, so changes to other columns keep the cache valid.
+    """
+    def render(self, func, df: pd.DataFrame, *args, columns: list = None, fmt: str = 'png', **kwargs) -> list:
+        if columns is not None:
+            df = df[columns]
+        key = self.key(func, df, args, kwargs, fmt)
+        entry_dir = os.path.join(self.cache_dir, key)
+
+        if os.path.isdir(entry_dir):
+            os.utime(entry_dir)
+            return self._entry_files(entry_dir)
+
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp-')
+        try:
+            save_figures(func, df, args, kwargs, tmp_dir, fmt)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        try:
+            os.replace(tmp_dir, entry_dir)
+        except OSError:
+            # Another process stored the same entry first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self._evict()
+        return self._entry_files(entry_dir)
+
+    # Removes every cached image
+    def clear(self) -> None:
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        os.makedirs(self.cache_dir, exist_ok=True)
@@ -0,0 +1,114 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.cube import histogram_boxplot_stats
+
+# Creates global constants for the large-data rendering mode
+LARGE_N_THRESHOLD = 100_000                # rows above which charts switch to density, sketch and sample rendering
+LARGE_N_ENV_VAR = 'DRUG_CONSUMPTION_LARGE_N'   # overrides LARGE_N_THRESHOLD, e.g. DRUG_CONSUMPTION_LARGE_N=500000
+SAMPLE_SIZE = 20_000
+SAMPLE_SEED = 42
+SKETCH_BINS = 4096
+HEXBIN_GRIDSIZE = 60
+
+
+"""Returns the large-data row threshold: the given value, else the DRUG_CONSUMPTION_LARGE_N variable, else LARGE_N_THRESHOLD."""
+def large_n_threshold(threshold: int = None) -> int:
+    if threshold is not None:
+        return int(threshold)
+    value = os.environ.get(LARGE_N_ENV_VAR)
+    return int(float(value)) if value else LARGE_N_THRESHOLD
+
+
+def is_large(n_rows: int, threshold: int = None) -> bool:
+    return n_rows > large_n_threshold(threshold)
+
+
+"""Returns the plotting order of a column's values the way seaborn picks it: categories, sorted numbers, or order of appearance."""
+def category_order(values: pd.Series) -> list:
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return [value for value in values.cat.categories if (values == value).any()]
+    uniques = pd.unique(values.dropna())
+    if pd.api.types.is_numeric_dtype(values):
+        return sorted(uniques)
+    return list(uniques)
+
+
+"""
+Returns a stratified random sample of about n rows: every value of `by` keeps its share of the rows (largest
+remainder rounding, at least one row per non-empty stratum) and rows are drawn with a fixed seed, so the same data
+always gives the same sample. Rows keep their original order. Returns df unchanged when it has n rows or fewer.
+"""
+def stratified_sample(df: pd.DataFrame, by: str = None, n: int = SAMPLE_SIZE, seed: int = SAMPLE_SEED) -> pd.DataFrame:
+    if len(df) <= n:
+        return df
+    rng = np.random.default_rng(seed)
+    if by is None:
+        return df.iloc[np.sort(rng.choice(len(df), n, replace=False))]
+
+    codes, _ = pd.factorize(df[by], use_na_sentinel=False)
+    sizes = np.bincount(codes)
+    quota = sizes * n / len(df)
+    allocation = np.minimum(np.maximum(np.floor(quota).astype(np.int64), 1), sizes)
+    remainder = n - allocation.sum()
+    if remainder > 0:
+        # Largest remainders first, among the strata that still have rows left
+        order = np.argsort(-(quota - np.floor(quota)) + (allocation >= sizes) * 2, kind='stable')
+        allocation[order[:remainder]] += 1
+        allocation = np.minimum(allocation, sizes)
+
+    # A random key per row; within each stratum the rows with the smallest keys are kept
+    order = np.lexsort((rng.random(len(df)), codes))
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    rank = np.arange(len(df)) - starts[codes[order]]
+    kept = order[rank < allocation[codes[order]]]
+    return df.iloc[np.sort(kept)]
+
+
+"""
+Boxplot statistics of a large column from a histogram sketch instead of sorting it, in the form Axes.bxp draws.
+
+Integer-valued columns whose range fits in `bins` (drug levels, drug_intensity_position) are counted exactly, so
+the quartiles, whiskers and fliers equal matplotlib's. Other columns are binned into `bins` equal-width bins
+between their min and max, which puts every statistic within one bin width of the exact one. Fliers are drawn once
+per distinct value (a repeated marker at the same position draws the same pixels). Returns None for no values.
+"""
+def sketch_boxplot_stats(values, whis: float = 1.5, label=None, bins: int = SKETCH_BINS) -> dict:
+    values = np.asarray(values, dtype=np.float64)
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return None
+    low, high = values.min(), values.max()
+
+    if np.array_equal(values, np.round(values)) and high - low < bins:
+        counts = np.bincount((values - low).astype(np.int64))
+        centers = np.arange(len(counts)) + low
+    else:
+        counts, edges = np.histogram(values, bins=bins, range=(low, high))
+        centers = (edges[:-1] + edges[1:]) / 2
+
+    stats = histogram_boxplot_stats(counts, centers, whis, label, unique_fliers=True)
+    stats['mean'] = float(values.mean())
+    return stats
+
+
+"""Sketched boxplot statistics of value_col for every value of `by`, in seaborn's category order."""
+def grouped_boxplot_stats(df: pd.DataFrame, value_col: str, by: str, whis: float = 1.5, bins: int = SKETCH_BINS) -> list:
+    codes, uniques = pd.factorize(df[by], use_na_sentinel=True)
+    uniques = pd.Index(uniques)
+    values = df[value_col].to_numpy(dtype=np.float64)
+    order = np.argsort(codes, kind='stable')
+    bounds = np.concatenate([[0], np.cumsum(np.bincount(codes[codes >= 0], minlength=len(uniques)))])
+    # Rows with a missing group code sort first, so the groups start after them
+    offset = np.count_nonzero(codes < 0)
+
+    stats = []
+    for level in category_order(df[by]):
+        position = uniques.get_loc(level)
+        group = values[order[offset + bounds[position]:offset + bounds[position + 1]]]
+        group_stats = sketch_boxplot_stats(group, whis, level, bins)
+        if group_stats is not None:
+            stats.append(group_stats)
+    return stats
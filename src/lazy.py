@@ -0,0 +1,350 @@
+import operator
+
+import numpy as np
+import pandas as pd
+
+from src.data_cleaning import (
+    RAW_DRUG_COLS, RENAMED_DRUG_COLS, AGE_COLS, PERSONALITY_TRAITS, PERSONALITY_TRAIT_NAMES, DRUG_COLUMN_NAMES,
+    flag_heavy_users, replace_outliers_with_mean
+)
+from src.decoding import decode_drug_use_ratings, decode_age_midpoints, decode_usage_frequency_labels
+from src.scaling import StreamingScaler
+from src.scoring import HEAVY_USE_LEVEL, HEAVY_USER_MIN_DRUGS, OUTLIER_THRESHOLD
+from src.tracing import active_tracer
+
+# Creates global constant with the comparison operators a filter step accepts
+FILTER_OPERATORS = {
+    '==': operator.eq, '!=': operator.ne, '<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge,
+    'isin': lambda series, values: series.isin(values),
+}
+
+# Steps that need every row (global statistics or aggregation); filters are never moved above them
+_GLOBAL_OPS = ('min_max', 'outliers', 'groupby')
+
+
+"""Returns the columns a step creates (new names it adds to the frame)."""
+def _created(step: dict) -> list:
+    if step['op'] in ('intensity', 'labels'):
+        return [step['name']]
+    if step['op'] == 'heavy_users':
+        return ['usage_frequency', 'heavy_user']
+    return []
+
+
+"""Returns the columns a step overwrites or creates, or None when it may write any column."""
+def _writes(step: dict) -> list:
+    op = step['op']
+    if op in ('decode_ratings', 'decode_ages', 'min_max'):
+        return step['cols']
+    if op == 'outliers':
+        return [step['col']]
+    if op == 'round':
+        return step['cols']
+    if op in ('filter', 'select'):
+        return []
+    return None if op in ('rename', 'groupby') else _created(step)
+
+
+"""Returns a copy of the step with every column name it refers to passed through mapping."""
+def _translate(step: dict, mapping: dict) -> dict:
+    step = dict(step)
+    for field in ('cols', 'by'):
+        if step.get(field) is not None:
+            step[field] = [mapping.get(col, col) for col in step[field]]
+    for field in ('col', 'name'):
+        if field in step:
+            step[field] = mapping.get(step[field], step[field])
+    if 'aggs' in step:
+        step['aggs'] = {mapping.get(col, col): func for col, func in step['aggs'].items()}
+    return step
+
+
+"""Composes two renames applied one after the other into one mapping."""
+def _compose_renames(first: dict, second: dict) -> dict:
+    mapping = {old: second.get(new, new) for old, new in first.items()}
+    for old, new in second.items():
+        if old not in first.values() and old not in first:
+            mapping[old] = new
+    return {old: new for old, new in mapping.items() if old != new}
+
+
+"""Returns the columns of the frame after the step, given the columns before it."""
+def _schema_after(step: dict, cols: list) -> list:
+    op = step['op']
+    if op == 'rename':
+        return [step['mapping'].get(col, col) for col in cols]
+    if op == 'select':
+        return list(step['cols'])
+    if op == 'groupby':
+        return list(step['by']) + [col for col in step['aggs'] if col not in step['by']]
+    return cols + [col for col in _created(step) if col not in cols]
+
+
+# A whole-frame round leaves string columns alone, so a filter comparing against strings can move above it
+def _rounds_strings_only(step: dict, filter_step: dict) -> bool:
+    if step['op'] != 'round' or step['cols'] is not None:
+        return False
+    value = filter_step['value']
+    values = value if isinstance(value, (list, tuple, set)) else [value]
+    return all(isinstance(item, str) for item in values)
+
+
+"""Runs one optimized plan step on the working frame and returns the (possibly new) frame."""
+def _apply_op(df: pd.DataFrame, step: dict) -> pd.DataFrame:
+    op = step['op']
+    if op == 'decode_ratings':
+        decode_drug_use_ratings(df, step['cols'])
+    elif op == 'decode_ages':
+        decode_age_midpoints(df, step['cols'])
+    elif op == 'rename':
+        df.rename(columns=step['mapping'], inplace=True)
+    elif op == 'intensity':
+        df[step['name']] = df[step['cols']].sum(axis=1)
+    elif op == 'heavy_users':
+        flag_heavy_users(df, step['cols'], verbose=False, use_level=step['use_level'], heavy_count=step['heavy_count'])
+    elif op == 'min_max':
+        df[step['cols']] = StreamingScaler().partial_fit(df[step['cols']]).transform(df[step['cols']])
+    elif op == 'outliers':
+        replace_outliers_with_mean(df, step['col'], step['threshold'])
+    elif op == 'labels':
+        decode_usage_frequency_labels(df, step['col'], step['name'])
+    elif op == 'round':
+        if step['cols'] is None:
+            df = df.round(step['decimals'])
+        else:
+            df[step['cols']] = df[step['cols']].round(step['decimals'])
+    elif op == 'filter':
+        mask = FILTER_OPERATORS[step['operator']](df[step['col']], step['value'])
+        df = df.take(np.flatnonzero(mask.to_numpy()))
+    elif op == 'select':
+        df = df[step['cols']].copy(deep=False)
+    elif op == 'groupby':
+        df = df.groupby(step['by'], observed=True).agg(step['aggs']).reset_index()
+    return df
+
+
+"""
+Lazy, deferred-execution plan over the cleaning and analysis steps.
+
+Every method returns a new LazyFrame with the step added to the plan; nothing runs until collect(). Before running,
+the plan is optimized:
+  - renames are moved to the end of the plan and merged into a single in-place rename,
+  - filters are pushed up to the source, above decoding and derived columns that do not touch the filtered column
+    (never above scaling, outlier replacement or aggregation, whose statistics depend on which rows are present),
+  - columns are pruned: only the columns the result needs are read from the CSV, steps whose output is never used are
+    dropped, and decoding/scaling only touch the columns that are still needed.
+Steps run in place on one working frame instead of copying between steps.
+"""
+class LazyFrame:
+
+    def __init__(self, source, source_schema: list, steps: list = None):
+        self.source = source
+        self.source_schema = list(source_schema)
+        self.steps = list(steps or [])
+        self.schema = self._final_schema(self.steps)
+
+    def _with_step(self, step: dict) -> 'LazyFrame':
+        return LazyFrame(self.source, self.source_schema, self.steps + [step])
+
+    # --- Cleaning steps (same names and defaults as src/data_cleaning.py) ---
+
+    def convert_drug_use_ratings(self, drug_cols: list = RAW_DRUG_COLS) -> 'LazyFrame':
+        return self._with_step({'op': 'decode_ratings', 'cols': list(drug_cols)})
+
+    def convert_to_midpoint(self, age_cols: list = AGE_COLS) -> 'LazyFrame':
+        return self._with_step({'op': 'decode_ages', 'cols': list(age_cols)})
+
+    def rename(self, mapping: dict) -> 'LazyFrame':
+        return self._with_step({'op': 'rename', 'mapping': {old: new for old, new in mapping.items() if old in self.schema}})
+
+    def rename_personality_traits(self) -> 'LazyFrame':
+        return self.rename(PERSONALITY_TRAIT_NAMES)
+
+    def rename_drug_columns(self) -> 'LazyFrame':
+        return self.rename(DRUG_COLUMN_NAMES)
+
+    def clean_column_names(self) -> 'LazyFrame':
+        return self.rename({col: col.strip().lower().replace(' ', '_') for col in self.schema})
+
+    def add_drug_intensity_position(self, drug_cols: list = RAW_DRUG_COLS, name: str = 'drug_intensity_position') -> 'LazyFrame':
+        return self._with_step({'op': 'intensity', 'cols': list(drug_cols), 'name': name})
+
+    def flag_heavy_users(self, drug_cols: list = RENAMED_DRUG_COLS, use_level: int = HEAVY_USE_LEVEL, heavy_count: int = HEAVY_USER_MIN_DRUGS) -> 'LazyFrame':
+        return self._with_step({'op': 'heavy_users', 'cols': list(drug_cols), 'use_level': use_level, 'heavy_count': heavy_count})
+
+    def apply_min_max_scaling(self, cols: list = PERSONALITY_TRAITS) -> 'LazyFrame':
+        return self._with_step({'op': 'min_max', 'cols': list(cols)})
+
+    def replace_outliers_with_mean(self, col: str = 'usage_frequency', threshold: float = OUTLIER_THRESHOLD) -> 'LazyFrame':
+        return self._with_step({'op': 'outliers', 'col': col, 'threshold': threshold})
+
+    def convert_usage_frequency_to_labels(self, col: str = 'usage_frequency', name: str = 'usage_frequency_label') -> 'LazyFrame':
+        return self._with_step({'op': 'labels', 'col': col, 'name': name})
+
+    def round(self, decimals: int = 2, cols: list = None) -> 'LazyFrame':
+        return self._with_step({'op': 'round', 'decimals': decimals, 'cols': None if cols is None else list(cols)})
+
+    # --- Filtering, projection and aggregation ---
+
+    # Keeps rows where `col <op> value`; op is one of FILTER_OPERATORS ('==', '!=', '<', '<=', '>', '>=', 'isin')
+    def filter(self, col: str, op: str, value) -> 'LazyFrame':
+        if op not in FILTER_OPERATORS:
+            raise ValueError(f'op must be one of {list(FILTER_OPERATORS)}, got {op!r}')
+        return self._with_step({'op': 'filter', 'col': col, 'operator': op, 'value': value})
+
+    def select(self, cols: list) -> 'LazyFrame':
+        return self._with_step({'op': 'select', 'cols': list(cols)})
+
+    # Groups by the `by` columns and aggregates {column: function name}, e.g. {'alcohol': 'mean'}
+    def groupby_agg(self, by: list, aggs: dict) -> 'LazyFrame':
+        return self._with_step({'op': 'groupby', 'by': list(by), 'aggs': dict(aggs)})
+
+    # --- Optimizer ---
+
+    # Moves every rename to the end of the plan (rewriting the steps it passes) and merges them into one
+    def _sink_renames(self, steps: list) -> list:
+        steps = list(steps)
+        moved = True
+        while moved:
+            moved = False
+            for index in range(len(steps) - 1):
+                rename, step = steps[index], steps[index + 1]
+                if rename['op'] != 'rename' or step['op'] == 'rename':
+                    continue
+                mapping = rename['mapping']
+                if set(_created(step)) & (set(mapping) | set(mapping.values())):
+                    continue
+                inverse = {new: old for old, new in mapping.items()}
+                steps[index], steps[index + 1] = _translate(step, inverse), rename
+                moved = True
+
+        merged = []
+        for step in steps:
+            if step['op'] == 'rename' and merged and merged[-1]['op'] == 'rename':
+                merged[-1] = {'op': 'rename', 'mapping': _compose_renames(merged[-1]['mapping'], step['mapping'])}
+            else:
+                merged.append(step)
+        return [step for step in merged if step['op'] != 'rename' or step['mapping']]
+
+    # Moves each filter above the row-independent steps that do not write its column
+    def _push_filters(self, steps: list) -> list:
+        steps = list(steps)
+        for index in range(len(steps)):
+            if steps[index]['op'] != 'filter':
+                continue
+            position = index
+            while position > 0:
+                previous = steps[position - 1]
+                writes = _writes(previous)
+                if _rounds_strings_only(previous, steps[position]):
+                    writes = ()
+                if previous['op'] in _GLOBAL_OPS or previous['op'] in ('rename', 'filter') or writes is None or steps[position]['col'] in writes:
+                    break
+                steps[position - 1], steps[position] = steps[position], previous
+                position -= 1
+        return steps
+
+    # Walks the plan backwards keeping only the columns and steps the result needs; returns (source columns, steps)
+    def _prune(self, steps: list) -> tuple:
+        needed = set(self._final_schema(steps))
+        pruned = []
+        for step in reversed(steps):
+            op = step['op']
+            step = dict(step)
+
+            if op == 'rename':
+                inverse = {new: old for old, new in step['mapping'].items()}
+                needed = {inverse.get(col, col) for col in needed}
+            elif op == 'select':
+                step['cols'] = [col for col in step['cols'] if col in needed]
+                needed = set(step['cols'])
+            elif op == 'groupby':
+                step['aggs'] = {col: func for col, func in step['aggs'].items() if col in needed}
+                needed = set(step['by']) | set(step['aggs'])
+            elif op == 'filter':
+                needed.add(step['col'])
+            elif op in ('decode_ratings', 'decode_ages', 'min_max') or (op == 'round' and step['cols'] is not None):
+                step['cols'] = [col for col in step['cols'] if col in needed]
+                if not step['cols']:
+                    continue
+            elif op == 'outliers':
+                if step['col'] not in needed:
+                    continue
+            elif op in ('intensity', 'heavy_users', 'labels'):
+                if not set(_created(step)) & needed:
+                    continue
+                needed = (needed - set(_created(step))) | set(step['cols'] if 'cols' in step else [step['col']])
+            pruned.append(step)
+
+        source_cols = [col for col in self.source_schema if col in needed]
+        return source_cols, list(reversed(pruned))
+
+    def _final_schema(self, steps: list) -> list:
+        schema = self.source_schema
+        for step in steps:
+            schema = _schema_after(step, schema)
+        return schema
+
+    # Returns (source columns to read, optimized steps)
+    def optimized_plan(self) -> tuple:
+        steps = self._sink_renames(self.steps)
+        steps = self._push_filters(steps)
+        return self._prune(steps)
+
+    # Describes the optimized plan, one step per line
+    def explain(self) -> str:
+        source_cols, steps = self.optimized_plan()
+        lines = [f'read {len(source_cols)} columns: {source_cols}']
+        for step in steps:
+            details = {key: value for key, value in step.items() if key != 'op'}
+            lines.append(f"{step['op']} {details}")
+        return '\n'.join(lines)
+
+    # --- Execution ---
+
+    def _read(self, cols: list) -> pd.DataFrame:
+        if isinstance(self.source, pd.DataFrame):
+            return self.source[cols].copy()
+        return pd.read_csv(self.source, usecols=cols)[cols]
+
+    # Runs the optimized plan and returns the resulting DataFrame
+    def collect(self) -> pd.DataFrame:
+        source_cols, steps = self.optimized_plan()
+        df = self._read(source_cols)
+
+        tracer = active_tracer()
+        for step in steps:
+            if tracer is None:
+                df = _apply_op(df, step)
+            else:
+                with tracer.stage(step['op'], df, 'lazy') as record:
+                    df = _apply_op(df, step)
+                    record.set_output(df)
+        return df
+
+
+"""Starts a lazy plan over a CSV file; only the columns the final result needs are read when it is collected."""
+def scan_csv(filepath: str) -> LazyFrame:
+    return LazyFrame(filepath, pd.read_csv(filepath, nrows=0).columns.tolist())
+
+
+"""Starts a lazy plan over an in-memory DataFrame (which is never modified)."""
+def from_frame(df: pd.DataFrame) -> LazyFrame:
+    return LazyFrame(df, df.columns.tolist())
+
+
+"""Builds the lazy plan for the full cleaning notebook (raw CSV -> cleaned frame), the lazy counterpart of build_default_pipeline."""
+def cleaning_plan(filepath: str) -> LazyFrame:
+    return (scan_csv(filepath)
+            .convert_drug_use_ratings(RAW_DRUG_COLS)
+            .convert_to_midpoint(AGE_COLS)
+            .rename_personality_traits()
+            .add_drug_intensity_position(RAW_DRUG_COLS)
+            .rename_drug_columns()
+            .apply_min_max_scaling(PERSONALITY_TRAITS)
+            .round(2, PERSONALITY_TRAITS)
+            .flag_heavy_users(RENAMED_DRUG_COLS)
+            .replace_outliers_with_mean('usage_frequency', OUTLIER_THRESHOLD)
+            .round(2)
+            .convert_usage_frequency_to_labels()
+            .clean_column_names())
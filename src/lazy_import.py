@@ -0,0 +1,68 @@
+import importlib
+import os
+import sys
+import threading
+
+# Creates global constants for lazy imports and the headless mode
+HEADLESS_ENV_VAR = 'DRUG_CONSUMPTION_HEADLESS'   # DRUG_CONSUMPTION_HEADLESS=1 renders with Agg and never opens a window
+HEADLESS_BACKEND = 'Agg'
+PLOTTING_PACKAGES = ('matplotlib', 'seaborn')
+
+
+def is_headless() -> bool:
+    return os.environ.get(HEADLESS_ENV_VAR, '').lower() in ('1', 'true', 'yes')
+
+
+# Selects the non-interactive backend: through MPLBACKEND while matplotlib is not imported yet, so importing it stays lazy
+def _use_headless_backend() -> None:
+    if 'matplotlib' in sys.modules:
+        sys.modules['matplotlib'].use(HEADLESS_BACKEND)
+    else:
+        os.environ['MPLBACKEND'] = HEADLESS_BACKEND
+
+
+"""
+Turns on the headless mode: matplotlib renders with the Agg backend and never initializes an interactive one. It is
+set through the DRUG_CONSUMPTION_HEADLESS variable, so worker processes started afterwards are headless too.
+"""
+def enable_headless() -> None:
+    os.environ[HEADLESS_ENV_VAR] = '1'
+    _use_headless_backend()
+
+
+"""
+Module placeholder that imports the real module on first attribute access, so `plt = lazy_import('matplotlib.pyplot')`
+at the top of a module costs nothing until a function actually draws. Setting an attribute sets it on the real
+module (figure_cache swaps plt.show this way). Plotting packages are imported headless when the headless mode is on.
+"""
+class LazyModule:
+
+    def __init__(self, name: str):
+        object.__setattr__(self, '_name', name)
+        object.__setattr__(self, '_module', None)
+        object.__setattr__(self, '_lock', threading.Lock())
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            with self._lock:
+                if self._module is None:
+                    if is_headless() and self._name.split('.')[0] in PLOTTING_PACKAGES:
+                        _use_headless_backend()
+                    object.__setattr__(self, '_module', importlib.import_module(self._name))
+                module = self._module
+        return module
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr: str, value) -> None:
+        setattr(self._load(), attr, value)
+
+    def __repr__(self) -> str:
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return f'<lazy module {self._name!r} ({state})>'
+
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
@@ -0,0 +1,402 @@
+import io
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.data_cleaning import (
+    RAW_DRUG_COLS, RENAMED_DRUG_COLS, AGE_COLS, PERSONALITY_TRAITS,
+    convert_drug_use_ratings, convert_to_midpoint, rename_personality_traits,
+    add_drug_intensity_position, rename_drug_columns, flag_heavy_users,
+    convert_usage_frequency_to_labels, clean_column_names
+)
+from src.scaling import StreamingScaler, scaling_params_path, save_scalers, load_scalers
+from src.schema import RAW_SCHEMA, SchemaValidationError, validate_chunk, quarantine_rows, quarantine_path, error_report_path
+from src.scoring import OUTLIER_THRESHOLD, replace_outliers
+from src.tracing import active_tracer, traced_stage
+
+# Creates global constant for the number of rows read from the CSV at a time
+DEFAULT_CHUNKSIZE = 100_000
+
+# Creates global constant with the step kinds that need statistics over the whole file
+GLOBAL_STEP_KINDS = ('min_max', 'outlier_mean')
+
+# Creates global constant with what a validation step does with invalid rows
+VALIDATION_ERRORS = ('raise', 'quarantine')
+
+
+"""Returns the name a step is traced under: the function name of a map step, the kind of the built-in steps."""
+def step_name(step: dict) -> str:
+    if step['kind'] == 'map':
+        return getattr(step['func'], '__name__', 'step')
+    return step['kind']
+
+
+"""
+Returns (reads, writes): the columns a step reads and the columns it overwrites or creates, either being None when
+the step may touch any column (map steps that declare nothing, renames). A validation step writes every column,
+since the rows it drops change them all.
+"""
+def step_columns(step: dict) -> tuple:
+    kind = step['kind']
+    if kind == 'map':
+        return step.get('reads'), step.get('writes')
+    if kind == 'validate':
+        return list(step['schema']), None
+    if kind == 'min_max':
+        return list(step['cols']), list(step['cols'])
+    if kind == 'outlier_mean':
+        return [step['col']], [step['col']]
+    return list(step['drug_cols']), ['usage_frequency', 'heavy_user']
+
+
+"""
+Runs the cleaning steps chunk by chunk over a CSV reader so memory stays bounded by the chunk size.
+Steps that need statistics over the whole file (min-max scaling, outlier mean) are fitted in a pre-pass
+before the output pass, so the result matches running the same steps on the fully loaded DataFrame.
+"""
+class CleaningPipeline:
+
+    def __init__(self, chunksize: int = DEFAULT_CHUNKSIZE):
+        self.chunksize = chunksize
+        self.steps = []
+        self.summary = None
+        self.fitted = False
+        self.rejected = []          # (quarantined rows, error report) of the chunks cleaned since the last write
+        self.quarantined_rows = 0
+
+    """
+    Adds a row-independent step, called as func(df, *args, **kwargs) and returning the DataFrame. reads and writes
+    optionally declare the columns it reads and the columns it overwrites or creates (see step_columns).
+    """
+    def add_step(self, func, *args, reads: list = None, writes: list = None, **kwargs) -> 'CleaningPipeline':
+        self.steps.append({'kind': 'map', 'func': func, 'args': args, 'kwargs': kwargs, 'reads': reads, 'writes': writes})
+        self.fitted = False
+        return self
+
+    # Adds min-max scaling of the given columns, with the bounds fitted over every chunk or taken from a saved scaler
+    def add_min_max_scaling(self, cols: list, scaler: StreamingScaler = None) -> 'CleaningPipeline':
+        self.steps.append({'kind': 'min_max', 'cols': cols, 'scaler': scaler, 'frozen': scaler is not None})
+        self.fitted = False
+        return self
+
+    # Adds replacement of values above threshold with the column mean, with the mean fitted over every chunk
+    def add_outlier_replacement(self, col: str, threshold: float = OUTLIER_THRESHOLD) -> 'CleaningPipeline':
+        self.steps.append({'kind': 'outlier_mean', 'col': col, 'threshold': threshold, 'mean': None, 'has_outliers': None})
+        self.fitted = False
+        return self
+
+    """
+    Adds a check of every chunk against a schema (see src/schema.py), one vectorized pass per chunk. With errors='raise'
+    the first invalid chunk raises SchemaValidationError with the row-level report, before any later step runs on it.
+    With errors='quarantine' invalid rows are dropped from the chunk; run() writes them to <output>.quarantine.csv and
+    the report to <output>.errors.csv. Add it first, so it sees the raw columns.
+    """
+    def add_validation(self, schema: dict = RAW_SCHEMA, errors: str = 'raise') -> 'CleaningPipeline':
+        if errors not in VALIDATION_ERRORS:
+            raise ValueError(f'errors must be one of {VALIDATION_ERRORS}, got {errors!r}')
+        self.steps.append({'kind': 'validate', 'schema': schema, 'errors': errors})
+        self.fitted = False
+        return self
+
+    # Adds the usage_frequency and heavy_user columns and sums the usage summary across chunks
+    def add_heavy_user_flags(self, drug_cols: list) -> 'CleaningPipeline':
+        self.steps.append({'kind': 'heavy_users', 'drug_cols': drug_cols})
+        self.fitted = False
+        return self
+
+    def _read_chunks(self, filepath: str):
+        reader = pd.read_csv(filepath, chunksize=self.chunksize)
+        tracer = active_tracer()
+        return reader if tracer is None else tracer.trace_iterator('read_csv', reader)
+
+    def _apply_step(self, chunk: pd.DataFrame, step: dict, collect_summary: bool) -> pd.DataFrame:
+        kind = step['kind']
+
+        if kind == 'map':
+            chunk = step['func'](chunk, *step['args'], **step['kwargs'])
+
+        elif kind == 'validate':
+            valid, errors = validate_chunk(chunk, step['schema'])
+            if len(errors):
+                if step['errors'] == 'raise':
+                    raise SchemaValidationError(errors)
+                if collect_summary:
+                    self.rejected.append((quarantine_rows(chunk, valid, errors), errors))
+                chunk = chunk[valid].copy()
+
+        elif kind == 'min_max':
+            chunk[step['cols']] = step['scaler'].transform(chunk[step['cols']])
+
+        elif kind == 'outlier_mean':
+            if step['has_outliers']:
+                values = chunk[step['col']].to_numpy(dtype=float)
+                chunk[step['col']] = replace_outliers(values, step['threshold'], step['mean'])
+
+        elif kind == 'heavy_users':
+            chunk, summary = flag_heavy_users(chunk, step['drug_cols'], verbose=False)
+            if collect_summary:
+                if self.summary is None:
+                    self.summary = summary
+                else:
+                    self.summary['heavy_user'] += summary['heavy_user']
+
+        return chunk
+
+    # Runs the steps on one chunk; with tracing enabled every step is recorded as a stage of the given category
+    def _apply(self, chunk: pd.DataFrame, steps: list, collect_summary: bool = False, category: str = 'cleaning') -> pd.DataFrame:
+        tracer = active_tracer()
+        for step in steps:
+            if tracer is None:
+                chunk = self._apply_step(chunk, step, collect_summary)
+            else:
+                with tracer.stage(step_name(step), chunk, category) as record:
+                    chunk = self._apply_step(chunk, step, collect_summary)
+                    record.set_output(chunk)
+        return chunk
+
+    """
+    Statistics of one chunk for the global step at index, taken after running the steps before it on the chunk
+    (from the step at start on, for chunks that already went through the steps before start).
+    """
+    def _partial_stats(self, chunk: pd.DataFrame, index: int, start: int = 0) -> dict:
+        step = self.steps[index]
+        chunk = self._apply(chunk, self.steps[start:index], category='fit')
+
+        if step['kind'] == 'min_max':
+            return {'count': len(chunk), 'scaler': StreamingScaler().partial_fit(chunk[step['cols']])}
+
+        values = chunk[step['col']].dropna()
+        if len(values) == 0:
+            return {'count': 0, 'sum': 0, 'max': None}
+        return {'count': len(values), 'sum': values.sum(), 'max': values.max()}
+
+    # Combines the chunk statistics, in chunk order, into the fitted state of the global step at index
+    def _reduce_stats(self, index: int, partials: list) -> None:
+        step = self.steps[index]
+        partials = [partial for partial in partials if partial['count']]
+
+        if step['kind'] == 'min_max':
+            scaler = StreamingScaler()
+            for partial in partials:
+                scaler.merge(partial['scaler'])
+            step['scaler'] = scaler
+            return None
+
+        total, count, maximum = 0, 0, None
+        for partial in partials:
+            total += partial['sum']
+            count += partial['count']
+            maximum = partial['max'] if maximum is None else max(maximum, partial['max'])
+        step['mean'] = total / count if count else float('nan')
+        step['has_outliers'] = maximum is not None and maximum > step['threshold']
+
+    # Positions of the global steps that are fitted on the input (saved scalers are kept as they are)
+    def _fit_indices(self) -> list:
+        return [index for index, step in enumerate(self.steps) if step['kind'] in GLOBAL_STEP_KINDS and not step.get('frozen')]
+
+    # Fitted scalers of the min-max steps, in step order
+    def scalers(self) -> list:
+        return [step['scaler'] for step in self.steps if step['kind'] == 'min_max']
+
+    # Writes the fitted scalers next to the cleaned output (<output>.scaling.json) so later waves can reuse the bounds
+    def _save_scaling(self, output_path: str) -> None:
+        if self.scalers():
+            save_scalers(self.scalers(), scaling_params_path(output_path))
+
+    # Appends the rows quarantined since the last call to <output>.quarantine.csv and their errors to <output>.errors.csv
+    def _write_rejected(self, output_path: str) -> None:
+        for rows, errors in self.rejected:
+            first = self.quarantined_rows == 0
+            rows.to_csv(quarantine_path(output_path), index=False, mode='w' if first else 'a', header=first)
+            errors.to_csv(error_report_path(output_path), index=False, mode='w' if first else 'a', header=first)
+            self.quarantined_rows += len(rows)
+        self.rejected = []
+
+    # Removes the quarantine files of an earlier run into the same output
+    def _reset_rejected(self, output_path: str) -> None:
+        self.rejected = []
+        self.quarantined_rows = 0
+        for path in (quarantine_path(output_path), error_report_path(output_path)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    # Fits the global statistics with one pass over the file per global step, each pass only running the steps before it
+    def fit(self, filepath: str) -> 'CleaningPipeline':
+        for index in self._fit_indices():
+            self._reduce_stats(index, [self._partial_stats(chunk, index) for chunk in self._read_chunks(filepath)])
+
+        self.fitted = True
+        return self
+
+    # Applies every step to an in-memory DataFrame using the fitted statistics
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        return self._apply(df, self.steps)
+
+    # Streams the input CSV through every step and appends each cleaned chunk to the output CSV
+    def run(self, input_path: str, output_path: str) -> pd.DataFrame:
+        if not self.fitted:
+            self.fit(input_path)
+
+        self.summary = None
+        self._reset_rejected(output_path)
+        first_chunk = True
+        for chunk in self._read_chunks(input_path):
+            chunk = self._apply(chunk, self.steps, collect_summary=True)
+            chunk.to_csv(output_path, index=False, mode='w' if first_chunk else 'a', header=first_chunk)
+            self._write_rejected(output_path)
+            first_chunk = False
+
+        self._save_scaling(output_path)
+        return self.summary
+
+
+"""
+Returns (header_end, offsets) for a CSV file with one record per line: header_end is the byte offset where the data
+rows start and offsets are the byte offsets at which every rows_per_shard-th row starts, ending with the file size.
+Rows are found by scanning the file for newlines block by block, so the file is never parsed or loaded whole.
+"""
+def csv_shard_offsets(filepath: str, rows_per_shard: int, block_size: int = 1 << 24) -> tuple:
+    newlines = []
+    with open(filepath, 'rb') as csv_file:
+        position = 0
+        for block in iter(lambda: csv_file.read(block_size), b''):
+            newlines.append(np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord('\n')) + position)
+            position += len(block)
+    row_ends = np.concatenate(newlines) + 1 if newlines else np.array([], dtype=np.int64)
+    if len(row_ends) == 0 or row_ends[-1] < position:
+        row_ends = np.append(row_ends, position)
+
+    header_end = int(row_ends[0])
+    offsets = [header_end] + [int(offset) for offset in row_ends[rows_per_shard::rows_per_shard] if offset < position] + [position]
+    return header_end, offsets
+
+
+def _read_shard(filepath: str, header_end: int, start: int, end: int) -> pd.DataFrame:
+    with open(filepath, 'rb') as csv_file:
+        header = csv_file.read(header_end)
+        csv_file.seek(start)
+        body = csv_file.read(end - start)
+    return pd.read_csv(io.BytesIO(header + body))
+
+
+def _shard_partial_stats(pipeline: 'CleaningPipeline', filepath: str, header_end: int, start: int, end: int, index: int) -> dict:
+    return pipeline._partial_stats(_read_shard(filepath, header_end, start, end), index)
+
+
+# Cleans one shard into its part file and returns its usage summary and quarantined rows; rows are numbered from first_row
+def _shard_output(pipeline: 'CleaningPipeline', filepath: str, header_end: int, start: int, end: int,
+                  part_path: str, header: bool, first_row: int) -> tuple:
+    pipeline.summary = None
+    pipeline.rejected = []
+    chunk = _read_shard(filepath, header_end, start, end)
+    chunk.index += first_row
+    chunk = pipeline._apply(chunk, pipeline.steps, collect_summary=True)
+    chunk.to_csv(part_path, index=False, header=header)
+    return pipeline.summary, pipeline.rejected
+
+
+"""
+CleaningPipeline that shards the input CSV by byte ranges of chunksize rows across a pool of worker processes.
+
+Each worker parses and cleans its own shard, so parsing scales with the workers instead of running in the parent.
+The global statistics are fitted in a map/reduce pre-pass: workers return per-shard partial statistics (min/max,
+sum/count/max) and the parent reduces them in shard order, exactly as the serial fit reduces its chunks. Shards
+are the serial pipeline's chunks, so the output file and usage summary are identical to CleaningPipeline.run with
+the same chunksize. The input must have one record per line (no quoted newlines), like the raw survey file.
+"""
+class ParallelCleaningPipeline(CleaningPipeline):
+
+    def __init__(self, chunksize: int = DEFAULT_CHUNKSIZE, workers: int = None):
+        super().__init__(chunksize)
+        self.workers = workers
+
+    def _fit_with_pool(self, pool: ProcessPoolExecutor, filepath: str, header_end: int, offsets: list) -> None:
+        for index in self._fit_indices():
+            with traced_stage(f'fit_{step_name(self.steps[index])}', category='fit', shards=len(offsets) - 1):
+                partials = list(pool.map(_shard_partial_stats, *zip(*[(self, filepath, header_end, start, end, index)
+                                                                  for start, end in zip(offsets[:-1], offsets[1:])])))
+            self._reduce_stats(index, partials)
+        self.fitted = True
+
+    def fit(self, filepath: str) -> 'ParallelCleaningPipeline':
+        header_end, offsets = csv_shard_offsets(filepath, self.chunksize)
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            self._fit_with_pool(pool, filepath, header_end, offsets)
+        return self
+
+    # Cleans every shard in the pool into a part file and concatenates the parts in shard order into the output CSV
+    def run(self, input_path: str, output_path: str) -> pd.DataFrame:
+        header_end, offsets = csv_shard_offsets(input_path, self.chunksize)
+        parts_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(output_path)), prefix='.parts-')
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                if not self.fitted:
+                    self._fit_with_pool(pool, input_path, header_end, offsets)
+
+                part_paths = [os.path.join(parts_dir, f'{index}.csv') for index in range(len(offsets) - 1)]
+                with traced_stage('clean_shards', shards=len(part_paths), workers=self.workers or os.cpu_count()):
+                    results = list(pool.map(_shard_output, *zip(*[(self, input_path, header_end, start, end, part_path, index == 0, index * self.chunksize)
+                                                                  for index, (start, end, part_path)
+                                                                  in enumerate(zip(offsets[:-1], offsets[1:], part_paths))])))
+                self.summary = None
+                self._reset_rejected(output_path)
+                for summary, rejected in results:
+                    self.rejected += rejected
+                    if summary is None:
+                        continue
+                    if self.summary is None:
+                        self.summary = summary
+                    else:
+                        self.summary['heavy_user'] += summary['heavy_user']
+
+            with traced_stage('concatenate_parts', category='io'), open(output_path, 'wb') as output_file:
+                for part_path in part_paths:
+                    with open(part_path, 'rb') as part_file:
+                        shutil.copyfileobj(part_file, output_file)
+        finally:
+            shutil.rmtree(parts_dir, ignore_errors=True)
+
+        self._write_rejected(output_path)
+        self._save_scaling(output_path)
+        return self.summary
+
+
+""" Rounds every numeric column of the DataFrame to the given number of decimals. """
+
+def round_values(df: pd.DataFrame, decimals: int = 2, cols: list = None) -> pd.DataFrame:
+    if cols is None:
+        return df.round(decimals)
+    df[cols] = df[cols].round(decimals)
+    return df
+
+
+"""
+Builds the pipeline with the same steps, in the same order, as the cleaning notebook (raw CSV -> cleaned CSV).
+With workers set, the shards run in a ParallelCleaningPipeline across that many processes. With scaling_path set
+(a .scaling.json written by an earlier run), personality traits are scaled with the saved bounds instead of being
+refitted, so a new survey wave stays comparable with the cleaned history. Every chunk is first checked against
+RAW_SCHEMA; validation='quarantine' sets invalid rows aside instead of failing and validation=None skips the check.
+"""
+def build_default_pipeline(chunksize: int = DEFAULT_CHUNKSIZE, workers: int = None, scaling_path: str = None,
+                           validation: str = 'raise') -> CleaningPipeline:
+    pipeline = CleaningPipeline(chunksize) if workers is None else ParallelCleaningPipeline(chunksize, workers)
+    trait_scaler = load_scalers(scaling_path)[0] if scaling_path else None
+    if validation is not None:
+        pipeline.add_validation(RAW_SCHEMA, validation)
+    pipeline.add_step(convert_drug_use_ratings, RAW_DRUG_COLS, reads=RAW_DRUG_COLS, writes=RAW_DRUG_COLS)
+    pipeline.add_step(convert_to_midpoint, AGE_COLS, reads=AGE_COLS, writes=AGE_COLS)
+    pipeline.add_step(rename_personality_traits)
+    pipeline.add_step(add_drug_intensity_position, RAW_DRUG_COLS, reads=RAW_DRUG_COLS, writes=['drug_intensity_position'])
+    pipeline.add_step(rename_drug_columns)
+    pipeline.add_min_max_scaling(PERSONALITY_TRAITS, trait_scaler)
+    pipeline.add_step(round_values, 2, PERSONALITY_TRAITS, reads=PERSONALITY_TRAITS, writes=PERSONALITY_TRAITS)
+    pipeline.add_heavy_user_flags(RENAMED_DRUG_COLS)
+    pipeline.add_outlier_replacement('usage_frequency', OUTLIER_THRESHOLD)
+    pipeline.add_step(round_values, 2)
+    pipeline.add_step(convert_usage_frequency_to_labels, reads=['usage_frequency'], writes=['usage_frequency_label'])
+    pipeline.add_step(clean_column_names)
+    return pipeline
@@ -0,0 +1,163 @@
+"""
+Renders the report charts (the img/ set) from the cleaned dataset across a pool of headless worker processes.
+
+Run from the repository root:
+    python -m src.render_report --data data/cleaned/cleaned_drug_consumption.parquet --output img --trait-drug-grid
+
+The cleaned data is written once as an uncompressed Arrow file in shared memory (/dev/shm when available) and every
+worker memory-maps it when it starts, so tasks only carry the chart spec instead of a pickled DataFrame.
+"""
+import argparse
+import importlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from src.data_cleaning import PERSONALITY_TRAITS, CLEANED_DRUG_COLS
+from src.figure_cache import FigureCache, save_figures
+from src.lazy_import import enable_headless
+from src.storage import apply_cleaned_dtypes, load_cleaned_columnar, save_cleaned_columnar
+from src.usage_histogram import HISTOGRAM_DRUG_COL, HISTOGRAM_LEVEL_COL, HISTOGRAM_COUNT_COL, UsageHistogram, trait_sum_col
+
+# Charts are rendered without a display, in this process and in the workers it starts
+enable_headless()
+
+# Creates global constant with the charts published under img/
+# 'data' is 'cleaned' (default), 'usage_summary' or 'histogram' (the tidy UsageHistogram table)
+REPORT_SPEC = [
+    {'name': '1_drug_usage_freq_dist', 'function': 'src.visualization.plot_drug_usage_distribution', 'data': 'usage_summary'},
+    {'name': '2_heavy_drug_usage_freq', 'function': 'src.visualization.combine_and_plot_heavy_users', 'data': 'usage_summary'},
+    {'name': '3_age_distribution', 'function': 'src.visualization.plot_age_distribution', 'args': ['age']},
+    {'name': '4_gender_distribution', 'function': 'src.visualization.plot_gender_distribution', 'args': ['gender']},
+    {'name': '5_drug_usage_frequency', 'function': 'src.visualization.plot_drug_usage_frequency', 'data': 'histogram', 'args': [CLEANED_DRUG_COLS]},
+    {'name': '6_corr_heatmap_personality_traits', 'function': 'src.visualization.plot_personality_trait_correlation'},
+    {'name': '7_corr_heatmap_drug_personality', 'function': 'src.visualization.plot_personality_drug_correlation_heatmap', 'args': [CLEANED_DRUG_COLS]},
+    {'name': '8_education_distribution', 'function': 'src.data_cleaning.visualize_data_balance', 'args': [['education'], []]},
+    {'name': '9_personality_drug_intensity_levels', 'function': 'src.visualization.plot_personality_drug_intensity_stacked'},
+    {'name': '10_top_five_used_drugs', 'function': 'src.visualization.plot_top_five_drugs', 'data': 'histogram', 'args': [CLEANED_DRUG_COLS]},
+    {'name': '11_country_distribution', 'function': 'src.data_cleaning.visualize_data_balance', 'args': [['country'], []]},
+    {'name': '12_ethnicity_distribution', 'function': 'src.data_cleaning.visualize_data_balance', 'args': [['ethnicity'], []]},
+]
+
+# Data each worker loads once in its initializer
+_worker_data = {}
+
+
+"""Returns one chart per trait x drug pair (7 x 19 = 133 by default) from plot_trait_drug_barplots, drawn from the histogram table."""
+def trait_drug_grid_spec(traits: list = PERSONALITY_TRAITS, drugs: list = CLEANED_DRUG_COLS) -> list:
+    return [{'name': f'trait_drug/{trait}_vs_{drug}', 'function': 'src.visualization.plot_trait_drug_barplots',
+             'args': [[trait], [drug]], 'data': 'histogram',
+             'columns': [HISTOGRAM_DRUG_COL, HISTOGRAM_LEVEL_COL, HISTOGRAM_COUNT_COL, trait_sum_col(trait)]}
+            for trait in traits for drug in drugs]
+
+
+"""Builds the usage level summary (Usage Frequency / heavy_user counts) that the usage distribution charts plot."""
+def usage_summary(histogram: UsageHistogram) -> pd.DataFrame:
+    return histogram.usage_summary().sort_values('heavy_user', ascending=False)
+
+
+def _init_worker(arrow_path: str, cache_dir: str) -> None:
+    df = load_cleaned_columnar(arrow_path)
+    histogram = UsageHistogram.from_data(df)
+    _worker_data['cleaned'] = df
+    _worker_data['histogram'] = histogram.to_frame()
+    _worker_data['usage_summary'] = usage_summary(histogram)
+    _worker_data['cache'] = FigureCache(cache_dir) if cache_dir else None
+
+
+def _resolve_function(dotted_name: str):
+    module_name, function_name = dotted_name.rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+"""Renders one spec entry inside a worker and writes <output_dir>/<name>.<fmt> (or <name>_<n>.<fmt> for several figures)."""
+def _render_chart(chart: dict, output_dir: str, fmt: str) -> list:
+    func = _resolve_function(chart['function'])
+    df = _worker_data[chart.get('data', 'cleaned')]
+    if chart.get('columns'):
+        df = df[chart['columns']]
+    args, kwargs = tuple(chart.get('args', [])), chart.get('kwargs', {})
+
+    target = os.path.join(output_dir, chart['name'])
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    cache = _worker_data['cache']
+
+    if cache is not None:
+        rendered = cache.render(func, df, *args, fmt=fmt, **kwargs)
+        temporary_dir = None
+    else:
+        temporary_dir = tempfile.mkdtemp(dir=output_dir, prefix='.render-')
+        rendered = save_figures(func, df, args, kwargs, temporary_dir, fmt)
+
+    paths = []
+    for index, path in enumerate(rendered):
+        destination = f'{target}.{fmt}' if len(rendered) == 1 else f'{target}_{index + 1}.{fmt}'
+        shutil.copyfile(path, destination)
+        paths.append(destination)
+
+    if temporary_dir is not None:
+        shutil.rmtree(temporary_dir, ignore_errors=True)
+    return paths
+
+
+"""
+Renders every chart of spec from the cleaned dataset at data_path into output_dir using a process pool.
+Returns {chart name: [written files]}.
+"""
+def render_report(data_path: str, output_dir: str, spec: list = REPORT_SPEC, workers: int = None,
+                  fmt: str = 'png', cache_dir: str = None) -> dict:
+    if data_path.endswith('.csv'):
+        df = apply_cleaned_dtypes(pd.read_csv(data_path))
+    else:
+        df = load_cleaned_columnar(data_path)
+
+    os.makedirs(output_dir, exist_ok=True)
+    shared_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+    handle, arrow_path = tempfile.mkstemp(suffix='.arrow', dir=shared_dir)
+    os.close(handle)
+
+    results = {}
+    try:
+        save_cleaned_columnar(df, arrow_path)
+        del df
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(arrow_path, cache_dir)) as pool:
+            futures = {pool.submit(_render_chart, chart, output_dir, fmt): chart['name'] for chart in spec}
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+    finally:
+        os.remove(arrow_path)
+    return results
+
+
+def main(argv: list = None) -> None:
+    parser = argparse.ArgumentParser(description='Render the report charts from the cleaned drug consumption dataset.')
+    parser.add_argument('--data', default='data/cleaned/cleaned_drug_consumption.parquet', help='cleaned dataset (.parquet, .arrow or .csv)')
+    parser.add_argument('--output', default='img', help='directory the charts are written to')
+    parser.add_argument('--spec', help='JSON file with a list of charts ({"name", "function", "args", "kwargs", "columns", "data"}); defaults to the img/ set')
+    parser.add_argument('--trait-drug-grid', action='store_true', help='also render every trait x drug barplot')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--format', default='png', choices=['png', 'svg'])
+    parser.add_argument('--cache-dir', default=None, help='reuse unchanged charts from this FigureCache directory')
+    args = parser.parse_args(argv)
+
+    if args.spec:
+        with open(args.spec) as spec_file:
+            spec = json.load(spec_file)
+    else:
+        spec = list(REPORT_SPEC)
+    if args.trait_drug_grid:
+        spec += trait_drug_grid_spec()
+
+    start = time.perf_counter()
+    results = render_report(args.data, args.output, spec, args.workers, args.format, args.cache_dir)
+    files = sum(len(paths) for paths in results.values())
+    print(f'Rendered {len(results)} charts ({files} files) into {args.output} in {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
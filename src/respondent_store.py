@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+from src.data_cleaning import PERSONALITY_TRAITS, CLEANED_DRUG_COLS, DEMOGRAPHIC_COLS
+from src.scoring import HEAVY_USE_LEVEL, HEAVY_USER_MIN_DRUGS, OUTLIER_THRESHOLD, score_drug_levels, replace_outliers
+
+# Creates global constant with the dictionary-encoded columns of the store (age midpoints are encoded like the strings)
+STORE_CODED_COLS = ['age'] + DEMOGRAPHIC_COLS
+
+
+"""
+Array-backed store for cleaned respondents, about 56 bytes per respondent:
+  ids     - int32 vector
+  drugs   - contiguous uint8 N x 19 matrix of drug levels 0-6 (CLEANED_DRUG_COLS order)
+  traits  - contiguous float32 N x 7 matrix of personality scores (PERSONALITY_TRAITS order)
+  codes   - one int8 code vector per demographic column, with its categories kept in `categories`
+drug_intensity_position, usage_frequency and heavy_user are derived from the drug matrix when asked for instead of stored.
+usage_means holds the dataset-wide mean usage_frequency for every use level 0-6 (the share of drug levels at or above
+it per respondent), which replaces the outliers; take() carries it over so a subset keeps the cleaned values.
+
+to_frame() hands the arrays to pandas without copying them (each column is a view into the matrices), so the functions
+in src/visualization.py can run on national-scale panels straight from the store.
+"""
+class RespondentStore:
+
+    def __init__(self, ids: np.ndarray, drugs: np.ndarray, traits: np.ndarray, codes: dict, categories: dict, usage_means: np.ndarray = None):
+        self.ids = np.ascontiguousarray(ids, dtype=np.int32)
+        self.drugs = np.ascontiguousarray(drugs, dtype=np.uint8)
+        self.traits = np.ascontiguousarray(traits, dtype=np.float32)
+        self.codes = codes
+        self.categories = categories
+        self.usage_means = usage_means if usage_means is not None else self._usage_means(self.drugs)
+
+    # Returns the mean count of drugs per row at or above every level 0-6, from one bincount of the drug matrix
+    @staticmethod
+    def _usage_means(drugs: np.ndarray) -> np.ndarray:
+        histogram = score_drug_levels(drugs)['histogram']
+        return histogram[::-1].cumsum()[::-1] / max(len(drugs), 1)
+
+    # Builds the store from a cleaned DataFrame (the output of the cleaning pipeline or the cleaned CSV/Parquet)
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> 'RespondentStore':
+        codes, categories = {}, {}
+        for col in STORE_CODED_COLS:
+            code, uniques = pd.factorize(df[col], sort=True)
+            if len(uniques) > np.iinfo(np.int8).max:
+                raise ValueError(f'{col} has {len(uniques)} distinct values, more than an int8 code can hold')
+            codes[col] = code.astype(np.int8)
+            categories[col] = pd.Index(uniques)
+
+        ids = df['id'].to_numpy() if 'id' in df.columns else np.arange(len(df))
+        drugs = df[CLEANED_DRUG_COLS].to_numpy(dtype=np.uint8)
+        traits = df[PERSONALITY_TRAITS].to_numpy(dtype=np.float32)
+        return cls(ids, drugs, traits, codes, categories)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def nbytes(self) -> int:
+        return self.ids.nbytes + self.drugs.nbytes + self.traits.nbytes + sum(code.nbytes for code in self.codes.values())
+
+    # Returns a new store with only the rows at the given positions (e.g. BitmapIndex.positions)
+    def take(self, positions: np.ndarray) -> 'RespondentStore':
+        codes = {col: code[positions] for col, code in self.codes.items()}
+        return RespondentStore(self.ids[positions], self.drugs[positions], self.traits[positions], codes, self.categories, self.usage_means)
+
+    def drug_intensity_position(self) -> np.ndarray:
+        return self.drugs.sum(axis=1, dtype=np.int16)
+
+    """
+    usage_frequency (after outlier replacement) and heavy_user as computed by flag_heavy_users and
+    replace_outliers_with_mean, with usage_frequency rounded to 2 decimals like the cleaning pipeline's round_values step.
+    Outliers are replaced with the dataset-wide mean (usage_means), not the mean of this store's rows.
+    """
+    def heavy_user_scores(self, use_level: int = HEAVY_USE_LEVEL, heavy_count: int = HEAVY_USER_MIN_DRUGS,
+                          outlier_threshold: float = OUTLIER_THRESHOLD) -> dict:
+        scores = score_drug_levels(self.drugs, use_level, heavy_count)
+        scores['usage_frequency'] = np.round(replace_outliers(scores['usage_frequency'], outlier_threshold, self.usage_means[use_level]), 2)
+        return scores
+
+    """
+    Returns a pandas DataFrame view of the store with the cleaned column names. Drug, trait and id columns share memory
+    with the store's arrays (no copy); demographics become categoricals over the stored codes. columns limits the
+    output to the named columns, and derived=True adds drug_intensity_position, usage_frequency and heavy_user.
+    """
+    def to_frame(self, columns: list = None, derived: bool = True) -> pd.DataFrame:
+        data = {'id': self.ids}
+        for col in STORE_CODED_COLS:
+            data[col] = pd.Categorical.from_codes(self.codes[col], categories=self.categories[col], validate=False)
+        for index, trait in enumerate(PERSONALITY_TRAITS):
+            data[trait] = self.traits[:, index]
+        for index, drug in enumerate(CLEANED_DRUG_COLS):
+            data[drug] = self.drugs[:, index]
+
+        if derived:
+            data['drug_intensity_position'] = self.drug_intensity_position()
+            scores = self.heavy_user_scores()
+            data['usage_frequency'] = scores['usage_frequency']
+            data['heavy_user'] = scores['heavy_user']
+
+        if columns is not None:
+            data = {col: data[col] for col in columns}
+        return pd.DataFrame(data, copy=False)
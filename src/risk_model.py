@@ -0,0 +1,217 @@
+import json
+import math
+
+import numpy as np
+import pandas as pd
+
+from src.data_cleaning import PERSONALITY_TRAITS
+from src.lazy_import import lazy_import
+from src.scaling import StreamingScaler
+
+# scikit-learn is only needed to fit; scoring a saved model never imports it
+linear_model = lazy_import('sklearn.linear_model')
+sklearn_metrics = lazy_import('sklearn.metrics')
+model_selection = lazy_import('sklearn.model_selection')
+
+# Creates global constants for the risk-scoring model
+RISK_NUMERIC_FEATURES = PERSONALITY_TRAITS + ['age']
+RISK_CATEGORICAL_FEATURES = ['gender', 'education']
+RISK_TARGET = 'heavy_user'
+RISK_THRESHOLD = 0.5
+RISK_TEST_SIZE = 0.2
+RISK_RANDOM_STATE = 42
+RISK_REGULARIZATION = 1.0   # inverse L2 strength (LogisticRegression's C)
+
+
+"""Logistic function computed as 0.5 * (1 + tanh(z / 2)), which does not overflow for large |z|."""
+def _sigmoid(z: np.ndarray) -> np.ndarray:
+    return 0.5 * (1 + np.tanh(0.5 * z))
+
+
+"""
+Position of every value of a column in a list of category names (-1 for values not in it). Categorical columns are
+looked up once per category rather than once per row.
+"""
+def _category_positions(values: pd.Series, categories: list) -> np.ndarray:
+    index = pd.Index(categories)
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        positions = np.append(index.get_indexer(values.cat.categories.astype(str)), -1)
+        return positions[values.cat.codes.to_numpy()]
+    return index.get_indexer(values.astype(str))
+
+
+"""
+Logistic regression risk score: the probability that a respondent is a heavy user (heavy_user from
+flag_heavy_users) given the seven trait scores, age and the one-hot encoded gender and education.
+
+fit() standardizes the numeric features with a StreamingScaler and trains scikit-learn's LogisticRegression, then
+folds the scaling into the coefficients, so the fitted model is a plain linear form: an intercept, one weight per
+numeric feature in original units and one contribution per category value. Scoring needs no scikit-learn objects:
+  - predict_proba() scores a whole DataFrame as one matrix-vector product plus one lookup per categorical column,
+  - score_record() scores one dict with a few dict lookups, for the online path (risk_service.py).
+Missing numeric values take the training mean and unseen categories contribute nothing (the baseline).
+save()/load() persist the model as JSON, with the held-out metrics of the fit.
+"""
+class RiskModel:
+
+    def __init__(self, numeric_features: list = RISK_NUMERIC_FEATURES, categorical_features: list = RISK_CATEGORICAL_FEATURES,
+                 target: str = RISK_TARGET, regularization: float = RISK_REGULARIZATION, random_state: int = RISK_RANDOM_STATE):
+        self.numeric_features = list(numeric_features)
+        self.categorical_features = list(categorical_features)
+        self.target = target
+        self.regularization = regularization
+        self.random_state = random_state
+        self.intercept = None
+        self.coefficients = None   # weight per numeric feature, in original units
+        self.means = None          # training means, used for missing numeric values
+        self.contributions = {}    # {categorical feature: {category: contribution}}
+        self.metrics = {}
+
+    @property
+    def fitted(self) -> bool:
+        return self.intercept is not None
+
+    # Standardized numeric features followed by the one-hot columns, for training
+    def _design_matrix(self, df: pd.DataFrame, scaler: StreamingScaler, categories: dict) -> np.ndarray:
+        numeric = scaler.transform(df[self.numeric_features].to_numpy(dtype=np.float64))
+        numeric = np.where(np.isnan(numeric), 0.0, numeric)
+        blocks = [numeric]
+        for col in self.categorical_features:
+            codes = _category_positions(df[col], categories[col])
+            one_hot = np.zeros((len(df), len(categories[col])))
+            known = codes >= 0
+            one_hot[np.flatnonzero(known), codes[known]] = 1.0
+            blocks.append(one_hot)
+        return np.hstack(blocks)
+
+    """
+    Trains on the cleaned respondents in df, holding out test_size of them (stratified) to record the ROC AUC,
+    accuracy and positive rate in metrics, then refits on every row.
+    """
+    def fit(self, df: pd.DataFrame, test_size: float = RISK_TEST_SIZE) -> 'RiskModel':
+        df = df.dropna(subset=[self.target])
+        target = df[self.target].to_numpy(dtype=bool)
+        train, test = model_selection.train_test_split(np.arange(len(df)), test_size=test_size, random_state=self.random_state, stratify=target)
+        self._fit_rows(df.iloc[train], target[train])
+        scores = self.predict_proba(df.iloc[test])
+        self.metrics = {
+            'roc_auc': float(sklearn_metrics.roc_auc_score(target[test], scores)),
+            'accuracy': float(np.mean((scores >= RISK_THRESHOLD) == target[test])),
+            'positive_rate': float(target.mean()),
+            'train_rows': int(len(df)),
+            'test_rows': int(len(test)),
+        }
+        return self._fit_rows(df, target)
+
+    def _fit_rows(self, df: pd.DataFrame, target: np.ndarray) -> 'RiskModel':
+        scaler = StreamingScaler('standard').partial_fit(df[self.numeric_features])
+        categories = {col: sorted(map(str, pd.unique(df[col].dropna()))) for col in self.categorical_features}
+        model = linear_model.LogisticRegression(C=self.regularization, max_iter=1000)
+        model.fit(self._design_matrix(df, scaler, categories), target)
+
+        # Folds the standardization into the weights: w * (x - mean) / std = (w / std) * x - w * mean / std
+        scale, offset = scaler.parameters()
+        weights = model.coef_[0]
+        numeric_weights = weights[:len(self.numeric_features)]
+        self.coefficients = numeric_weights * scale
+        self.intercept = float(model.intercept_[0] + numeric_weights @ offset)
+        self.means = scaler.mean.copy()
+
+        position = len(self.numeric_features)
+        self.contributions = {}
+        for col in self.categorical_features:
+            self.contributions[col] = dict(zip(categories[col], weights[position:position + len(categories[col])].tolist()))
+            position += len(categories[col])
+        return self
+
+    # Linear score (log-odds) of every row of df, vectorized
+    def decision_function(self, df: pd.DataFrame) -> np.ndarray:
+        if not self.fitted:
+            raise ValueError('RiskModel is not fitted yet, call fit first')
+        numeric = df[self.numeric_features].to_numpy(dtype=np.float64)
+        numeric = np.where(np.isnan(numeric), self.means, numeric)
+        scores = numeric @ self.coefficients + self.intercept
+        for col in self.categorical_features:
+            table = self.contributions[col]
+            # Unseen categories (position -1) pick the trailing 0 contribution
+            lookup = np.append(np.fromiter(table.values(), dtype=np.float64, count=len(table)), 0.0)
+            scores += lookup[_category_positions(df[col], list(table))]
+        return scores
+
+    def predict_proba(self, df: pd.DataFrame) -> np.ndarray:
+        return _sigmoid(self.decision_function(df))
+
+    def predict(self, df: pd.DataFrame, threshold: float = RISK_THRESHOLD) -> np.ndarray:
+        return self.predict_proba(df) >= threshold
+
+    # Scores one respondent given as a dict of feature values (the low-latency path; no DataFrame is built)
+    def score_record(self, record: dict) -> float:
+        score = self.intercept
+        for feature, weight, mean in zip(self.numeric_features, self._weights, self._means):
+            value = record.get(feature)
+            score += weight * (mean if value is None or value != value else float(value))
+        for col in self.categorical_features:
+            score += self.contributions[col].get(str(record.get(col)), 0.0)
+        return 0.5 * (1 + math.tanh(0.5 * score))
+
+    # Plain float copies of the weights and means, so score_record does no numpy scalar arithmetic
+    @property
+    def _weights(self) -> list:
+        if getattr(self, '_weights_list', None) is None:
+            self._weights_list = self.coefficients.tolist()
+        return self._weights_list
+
+    @property
+    def _means(self) -> list:
+        if getattr(self, '_means_list', None) is None:
+            self._means_list = self.means.tolist()
+        return self._means_list
+
+    def to_dict(self) -> dict:
+        return {
+            'numeric_features': self.numeric_features,
+            'categorical_features': self.categorical_features,
+            'target': self.target,
+            'regularization': self.regularization,
+            'random_state': self.random_state,
+            'intercept': self.intercept,
+            'coefficients': dict(zip(self.numeric_features, self.coefficients.tolist())),
+            'means': dict(zip(self.numeric_features, self.means.tolist())),
+            'contributions': self.contributions,
+            'metrics': self.metrics,
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> 'RiskModel':
+        model = cls(state['numeric_features'], state['categorical_features'], state['target'], state['regularization'], state['random_state'])
+        model.intercept = state['intercept']
+        model.coefficients = np.array([state['coefficients'][feature] for feature in model.numeric_features])
+        model.means = np.array([state['means'][feature] for feature in model.numeric_features])
+        model.contributions = state['contributions']
+        model.metrics = state['metrics']
+        return model
+
+    def save(self, filepath: str) -> None:
+        with open(filepath, 'w') as model_file:
+            json.dump(self.to_dict(), model_file, indent=2)
+
+    @classmethod
+    def load(cls, filepath: str) -> 'RiskModel':
+        with open(filepath) as model_file:
+            return cls.from_dict(json.load(model_file))
+
+
+"""
+Scores a cleaned dataset CSV too large to load at once: reads it in chunks of chunksize rows and writes every row's
+id (when the file has one) and risk to output_path. Returns the number of rows scored.
+"""
+def score_csv(model: RiskModel, input_path: str, output_path: str, chunksize: int = 1_000_000) -> int:
+    columns = model.numeric_features + model.categorical_features
+    n_rows = 0
+    with pd.read_csv(input_path, chunksize=chunksize, usecols=lambda col: col in columns or col == 'id') as reader:
+        for position, chunk in enumerate(reader):
+            scored = pd.DataFrame({'id': chunk['id']}) if 'id' in chunk.columns else pd.DataFrame(index=chunk.index)
+            scored['risk'] = model.predict_proba(chunk)
+            scored.to_csv(output_path, mode='w' if position == 0 else 'a', header=position == 0, index=False)
+            n_rows += len(chunk)
+    return n_rows
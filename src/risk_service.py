@@ -0,0 +1,131 @@
+"""
+Serves the heavy-user risk model (src/risk_model.py) over local HTTP for screening tools. The model is loaded once
+and stays resident, so a request only parses its JSON and scores it.
+
+Run from the repository root:
+    python -m src.risk_service --port 8765
+    python -m src.risk_service --model risk_model.json --host 127.0.0.1 --port 8765
+
+Endpoints:
+    GET  /health   model features and held-out metrics
+    POST /score    one respondent as a JSON object -> {"risk": 0.31, "high_risk": false}
+                   a JSON list of respondents      -> {"risk": [...], "high_risk": [...]}
+Respondents carry the cleaned feature values (trait scores 0-1, age in years, gender and education labels);
+missing fields take the training mean or the baseline category.
+"""
+import argparse
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+from src.artifact_cache import ArtifactCache
+from src.risk_model import RISK_THRESHOLD, RiskModel
+
+# Creates global constants for the risk service
+RISK_SERVICE_HOST = '127.0.0.1'
+RISK_SERVICE_PORT = 8765
+RISK_SERVICE_MAX_BODY = 64 * 1024 * 1024   # bytes accepted in one request
+RISK_SERVICE_BATCH_ROWS = 1000             # lists at least this long are scored as a DataFrame, shorter ones record by record
+
+
+"""
+Scores a parsed request body: a single respondent dict, or a list of them. Long lists are scored as one vectorized
+batch; short ones go through score_record, which is faster than building a DataFrame for a few rows.
+"""
+def score_payload(model: RiskModel, payload, threshold: float = RISK_THRESHOLD) -> dict:
+    if isinstance(payload, dict):
+        risk = model.score_record(payload)
+        return {'risk': risk, 'high_risk': risk >= threshold}
+    if isinstance(payload, list) and all(isinstance(record, dict) for record in payload):
+        if len(payload) < RISK_SERVICE_BATCH_ROWS:
+            risk = [model.score_record(record) for record in payload]
+            return {'risk': risk, 'high_risk': [value >= threshold for value in risk]}
+        # The explicit index keeps one row per record, even for records without any of the features (e.g. all empty)
+        records = pd.DataFrame(payload, index=range(len(payload))).reindex(columns=model.numeric_features + model.categorical_features)
+        risk = model.predict_proba(records)
+        return {'risk': risk.tolist(), 'high_risk': (risk >= threshold).tolist()}
+    raise ValueError('Expected a JSON object or a list of JSON objects')
+
+
+class RiskRequestHandler(BaseHTTPRequestHandler):
+    # Keeps connections open between requests, so clients do not reconnect for every score
+    protocol_version = 'HTTP/1.1'
+    # Sends the headers and body without waiting on Nagle's algorithm, which otherwise adds ~40 ms to every response
+    disable_nagle_algorithm = True
+
+    def _send_json(self, status: int, body: dict) -> None:
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self) -> None:
+        if self.path != '/health':
+            return self._send_json(404, {'error': f'Unknown path {self.path}'})
+        model = self.server.model
+        self._send_json(200, {'status': 'ok', 'numeric_features': model.numeric_features,
+                              'categorical_features': model.categorical_features, 'metrics': model.metrics})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get('Content-Length', 0))
+        if length > RISK_SERVICE_MAX_BODY:
+            self.close_connection = True
+            return self._send_json(413, {'error': f'Request body larger than {RISK_SERVICE_MAX_BODY} bytes'})
+        body = self.rfile.read(length)
+        if self.path != '/score':
+            return self._send_json(404, {'error': f'Unknown path {self.path}'})
+        try:
+            result = score_payload(self.server.model, json.loads(body), self.server.threshold)
+        except (ValueError, TypeError) as error:
+            return self._send_json(400, {'error': str(error)})
+        self._send_json(200, result)
+
+    def log_message(self, format: str, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+"""
+Returns a threaded HTTP server scoring with the given model; call serve_forever() on it (port 0 picks a free port,
+see server.server_address).
+"""
+def make_server(model: RiskModel, host: str = RISK_SERVICE_HOST, port: int = RISK_SERVICE_PORT,
+                threshold: float = RISK_THRESHOLD, verbose: bool = False) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), RiskRequestHandler)
+    server.daemon_threads = True
+    server.model = model
+    server.threshold = threshold
+    server.verbose = verbose
+    return server
+
+
+def main(argv: list = None) -> None:
+    parser = argparse.ArgumentParser(description='Serve the heavy-user risk model over local HTTP.')
+    parser.add_argument('--model', help='risk model JSON saved by RiskModel.save; defaults to the model of the cached raw dataset')
+    parser.add_argument('--raw', default='data/raw/Drug_Consumption.csv', help='raw dataset the model is trained on when --model is not given')
+    parser.add_argument('--host', default=RISK_SERVICE_HOST)
+    parser.add_argument('--port', type=int, default=RISK_SERVICE_PORT)
+    parser.add_argument('--threshold', type=float, default=RISK_THRESHOLD, help='risk at or above which a respondent is flagged high_risk')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args(argv)
+
+    if args.model:
+        model = RiskModel.load(args.model)
+    else:
+        model = ArtifactCache().load_risk_model(args.raw)
+
+    server = make_server(model, args.host, args.port, args.threshold, args.verbose)
+    print(f'Serving the risk model on http://{args.host}:{server.server_address[1]} (ROC AUC {model.metrics.get("roc_auc", float("nan")):.3f})')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
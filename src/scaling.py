@@ -0,0 +1,196 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Creates global constant with the supported scaling methods
+SCALING_METHODS = ('minmax', 'standard')
+
+
+"""Replaces near-zero ranges/deviations with 1 so constant columns are not divided by zero (as scikit-learn does)."""
+def _handle_zeros_in_scale(scale: np.ndarray) -> np.ndarray:
+    scale = scale.copy()
+    scale[scale < 10 * np.finfo(scale.dtype).eps] = 1.0
+    return scale
+
+
+"""
+Scaler fitted incrementally over streamed chunks, with the fitted state kept as plain per-column statistics
+(count, min, max, mean and sum of squared deviations) instead of a scikit-learn object.
+
+partial_fit() adds one chunk and merge() combines scalers fitted on different chunks or shards (Chan et al.'s pairwise
+update for the mean and variance), so fitting never needs more than one chunk in memory and a new wave can be folded
+into saved statistics without reading the history. transform() applies the parameters to a whole DataFrame or array
+as one vectorized multiply-add; min-max scaling gives the same values as MinMaxScaler and standard scaling matches
+StandardScaler up to floating point rounding. save()/load() persist the statistics as JSON, so later batches are
+scaled against the same bounds.
+"""
+class StreamingScaler:
+
+    def __init__(self, method: str = 'minmax', feature_range: tuple = (0, 1)):
+        if method not in SCALING_METHODS:
+            raise ValueError(f'method must be one of {SCALING_METHODS}, got {method!r}')
+        self.method = method
+        self.feature_range = tuple(feature_range)
+        self.columns = None
+        self.count = None
+        self.min = None
+        self.max = None
+        self.mean = None
+        self.m2 = None
+
+    @property
+    def fitted(self) -> bool:
+        return self.columns is not None
+
+    # Adds the statistics of one chunk (DataFrame columns or the columns of a 2D array); missing values are ignored
+    def partial_fit(self, data) -> 'StreamingScaler':
+        columns = list(data.columns) if isinstance(data, pd.DataFrame) else list(range(np.shape(data)[1]))
+        values = np.asarray(data, dtype=np.float64)
+        chunk = StreamingScaler(self.method, self.feature_range)
+        chunk.columns = columns
+        chunk.count = np.sum(~np.isnan(values), axis=0).astype(np.int64)
+
+        present = chunk.count > 0
+        chunk.min = np.full(len(columns), np.nan)
+        chunk.max = np.full(len(columns), np.nan)
+        chunk.mean = np.zeros(len(columns))
+        chunk.m2 = np.zeros(len(columns))
+        if present.any():
+            observed = values[:, present]
+            chunk.min[present] = np.nanmin(observed, axis=0)
+            chunk.max[present] = np.nanmax(observed, axis=0)
+            chunk.mean[present] = np.nanmean(observed, axis=0)
+            chunk.m2[present] = np.nansum((observed - chunk.mean[present]) ** 2, axis=0)
+        return self.merge(chunk)
+
+    # Combines the statistics of another scaler over the same columns into this one
+    def merge(self, other: 'StreamingScaler') -> 'StreamingScaler':
+        if not other.fitted:
+            return self
+        if not self.fitted:
+            self.columns = list(other.columns)
+            self.count, self.min, self.max = other.count.copy(), other.min.copy(), other.max.copy()
+            self.mean, self.m2 = other.mean.copy(), other.m2.copy()
+            return self
+        if list(other.columns) != self.columns:
+            raise ValueError(f'Cannot merge statistics of columns {list(other.columns)} into {self.columns}')
+
+        count = self.count + other.count
+        safe_count = np.where(count > 0, count, 1)
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / safe_count
+        self.m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / safe_count
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        self.count = count
+        return self
+
+    # Fits the scaler over an iterable of chunks, e.g. pd.read_csv(..., usecols=cols, chunksize=...)
+    def fit_chunks(self, chunks) -> 'StreamingScaler':
+        for chunk in chunks:
+            self.partial_fit(chunk)
+        return self
+
+    def variance(self) -> np.ndarray:
+        return self.m2 / np.where(self.count > 0, self.count, 1)
+
+    # Returns (scale, offset) so that scaled = values * scale + offset
+    def parameters(self) -> tuple:
+        if not self.fitted:
+            raise ValueError('StreamingScaler is not fitted yet, call partial_fit first')
+        if self.method == 'minmax':
+            low, high = self.feature_range
+            scale = (high - low) / _handle_zeros_in_scale(self.max - self.min)
+            return scale, low - self.min * scale
+        scale = 1 / _handle_zeros_in_scale(np.sqrt(self.variance()))
+        return scale, -self.mean * scale
+
+    # Returns a scaler with the statistics of the given columns only, in that order
+    def select(self, columns: list) -> 'StreamingScaler':
+        positions = [self.columns.index(col) for col in columns]
+        selected = StreamingScaler(self.method, self.feature_range)
+        selected.columns = list(columns)
+        selected.count, selected.min, selected.max = self.count[positions], self.min[positions], self.max[positions]
+        selected.mean, selected.m2 = self.mean[positions], self.m2[positions]
+        return selected
+
+    # Returns the same scaler statistics applied with another method ('minmax' or 'standard')
+    def with_method(self, method: str) -> 'StreamingScaler':
+        return StreamingScaler(method, self.feature_range).merge(self)
+
+    """
+    Scales the fitted columns of a DataFrame (other columns are left alone) or every column of a 2D array,
+    whose columns must be in the fitted order.
+    """
+    def transform(self, data):
+        scale, offset = self.parameters()
+        if isinstance(data, pd.DataFrame):
+            positions = [self.columns.index(col) for col in data.columns if col in self.columns]
+            cols = [self.columns[position] for position in positions]
+            scaled = data.copy()
+            values = data[cols].to_numpy(dtype=np.float64)
+            values *= scale[positions]
+            values += offset[positions]
+            scaled[cols] = values
+            return scaled
+        values = np.array(data, dtype=np.float64)
+        values *= scale
+        values += offset
+        return values
+
+    def inverse_transform(self, data):
+        scale, offset = self.parameters()
+        if isinstance(data, pd.DataFrame):
+            positions = [self.columns.index(col) for col in data.columns if col in self.columns]
+            cols = [self.columns[position] for position in positions]
+            restored = data.copy()
+            restored[cols] = (data[cols].to_numpy(dtype=np.float64) - offset[positions]) / scale[positions]
+            return restored
+        return (np.asarray(data, dtype=np.float64) - offset) / scale
+
+    def to_dict(self) -> dict:
+        state = {'method': self.method, 'feature_range': list(self.feature_range), 'columns': {}}
+        for index, col in enumerate(self.columns or []):
+            state['columns'][str(col)] = {'count': int(self.count[index]), 'min': float(self.min[index]), 'max': float(self.max[index]),
+                                          'mean': float(self.mean[index]), 'm2': float(self.m2[index])}
+        return state
+
+    @classmethod
+    def from_dict(cls, state: dict) -> 'StreamingScaler':
+        scaler = cls(state['method'], tuple(state['feature_range']))
+        if state['columns']:
+            scaler.columns = list(state['columns'])
+            stats = pd.DataFrame.from_dict(state['columns'], orient='index')
+            scaler.count = stats['count'].to_numpy(dtype=np.int64)
+            scaler.min, scaler.max = stats['min'].to_numpy(dtype=np.float64), stats['max'].to_numpy(dtype=np.float64)
+            scaler.mean, scaler.m2 = stats['mean'].to_numpy(dtype=np.float64), stats['m2'].to_numpy(dtype=np.float64)
+        return scaler
+
+    # Writes the fitted statistics as JSON (floats are written with full precision, so a loaded scaler gives identical values)
+    def save(self, filepath: str) -> None:
+        with open(filepath, 'w') as scaler_file:
+            json.dump(self.to_dict(), scaler_file, indent=2)
+
+    @classmethod
+    def load(cls, filepath: str) -> 'StreamingScaler':
+        with open(filepath) as scaler_file:
+            return cls.from_dict(json.load(scaler_file))
+
+
+"""Returns the path the fitted scalers of a cleaned dataset are saved at: <dataset without extension>.scaling.json."""
+def scaling_params_path(data_path: str) -> str:
+    return os.path.splitext(data_path)[0] + '.scaling.json'
+
+
+"""Writes a list of fitted scalers (one per scaling step) to a JSON file."""
+def save_scalers(scalers: list, filepath: str) -> None:
+    with open(filepath, 'w') as scaler_file:
+        json.dump([scaler.to_dict() for scaler in scalers], scaler_file, indent=2)
+
+
+"""Reads the list of scalers written by save_scalers."""
+def load_scalers(filepath: str) -> list:
+    with open(filepath) as scaler_file:
+        return [StreamingScaler.from_dict(state) for state in json.load(scaler_file)]
@@ -0,0 +1,169 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.data_cleaning import RAW_DRUG_COLS, PERSONALITY_TRAIT_NAMES
+from src.decoding import CL_CODES, AGE_BANDS
+
+# Creates global constants with the allowed answers of the raw survey's coded demographic columns
+GENDER_CODES = ['M', 'F']
+EDUCATION_LEVELS = [
+    'Left school before 16 years', 'Left school at 16 years', 'Left school at 17 years', 'Left school at 18 years',
+    'Some college or university, no certificate or degree', 'Professional certificate/ diploma', 'University degree',
+    'Masters degree', 'Doctorate degree'
+]
+COUNTRIES = ['Australia', 'Canada', 'New Zealand', 'Other', 'Republic of Ireland', 'UK', 'USA']
+ETHNICITIES = ['Asian', 'Black', 'Mixed-Black/Asian', 'Mixed-White/Asian', 'Mixed-White/Black', 'Other', 'White']
+TRAIT_SCORE_RANGE = (-3.5, 3.5)   # the survey's quantified trait z-scores lie within about +-3.46
+
+"""
+Creates global constant with the layout of Drug_Consumption.csv, one rule per column. A rule gives the dtype the
+column must parse as ('int64', 'float64' or 'object') and optionally the allowed codes, a min and max, and whether
+missing values are allowed (nullable, False by default).
+"""
+RAW_SCHEMA = {
+    'ID': {'dtype': 'int64', 'min': 0},
+    'Age': {'dtype': 'object', 'codes': AGE_BANDS},
+    'Gender': {'dtype': 'object', 'codes': GENDER_CODES},
+    'Education': {'dtype': 'object', 'codes': EDUCATION_LEVELS},
+    'Country': {'dtype': 'object', 'codes': COUNTRIES},
+    'Ethnicity': {'dtype': 'object', 'codes': ETHNICITIES},
+    **{trait: {'dtype': 'float64', 'min': TRAIT_SCORE_RANGE[0], 'max': TRAIT_SCORE_RANGE[1]} for trait in PERSONALITY_TRAIT_NAMES},
+    **{drug: {'dtype': 'object', 'codes': CL_CODES} for drug in RAW_DRUG_COLS},
+}
+
+# Creates global constants for the row-level error report and the quarantined rows
+ERROR_REPORT_COLS = ['row', 'column', 'value', 'rule']
+QUARANTINE_ERRORS_COL = 'validation_errors'
+RULES = ['missing', 'dtype', 'codes', 'range']   # rule names reported for a broken entry
+MAX_REPORTED_ERRORS = 10   # examples listed in a SchemaValidationError message
+
+
+"""
+Raised when a batch does not match its schema. missing and unexpected list the column differences; errors is the
+row-level report (row, column, value, rule), where rule is 'missing', 'dtype', 'codes' or 'range'.
+"""
+class SchemaValidationError(ValueError):
+
+    def __init__(self, errors: pd.DataFrame = None, missing: list = (), unexpected: list = ()):
+        self.errors = pd.DataFrame(columns=ERROR_REPORT_COLS) if errors is None else errors
+        self.missing = list(missing)
+        self.unexpected = list(unexpected)
+        details = []
+        if self.missing:
+            details.append(f'missing columns {self.missing}')
+        if self.unexpected:
+            details.append(f'unexpected columns {self.unexpected}')
+        if len(self.errors):
+            counts = self.errors.groupby(['column', 'rule'], sort=False).size()
+            details.append(f'{self.errors["row"].nunique()} invalid rows (' + ', '.join(f'{col} {rule}: {count}' for (col, rule), count in counts.items()) + ')')
+            examples = self.errors.head(MAX_REPORTED_ERRORS)
+            details.append('e.g. ' + '; '.join(f'row {row.row} {row.column}={row.value!r} ({row.rule})' for row in examples.itertuples()))
+        super().__init__('Batch does not match the schema: ' + ', '.join(details))
+
+
+"""Raises SchemaValidationError when columns lack a schema column or (strict) hold columns the schema does not know."""
+def check_columns(columns, schema: dict, strict: bool = True) -> None:
+    missing = [col for col in schema if col not in set(columns)]
+    unexpected = [col for col in columns if col not in schema] if strict else []
+    if missing or unexpected:
+        raise SchemaValidationError(missing=missing, unexpected=unexpected)
+
+
+# Groups the columns that share a rule, so each group is checked with one lookup over a 2D array
+def _rule_groups(schema: dict) -> list:
+    groups = {}
+    for col, rule in schema.items():
+        key = (rule['dtype'], tuple(rule.get('codes', ())), rule.get('min'), rule.get('max'), rule.get('nullable', False))
+        groups.setdefault(key, (rule, []))[1].append(col)
+    return list(groups.values())
+
+
+"""
+Checks the columns of one rule group and returns an int8 array of shape rows x columns holding 0 for valid entries
+and the 1-based position of the broken rule in RULES otherwise. Coded columns are factorized, so only their few
+distinct values are looked up in the allowed codes.
+"""
+def _check_group(df: pd.DataFrame, cols: list, rule: dict) -> np.ndarray:
+    problems = np.zeros((len(df), len(cols)), dtype=np.int8)
+
+    if rule['dtype'] in ('int64', 'float64'):
+        if all(pd.api.types.is_numeric_dtype(df[col]) for col in cols):
+            numbers = df[cols].to_numpy(dtype=np.float64)
+            missing = np.isnan(numbers)
+        else:
+            numbers = np.column_stack([pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64) for col in cols])
+            missing = pd.isna(df[cols].to_numpy())
+            problems[np.isnan(numbers) & ~missing] = RULES.index('dtype') + 1
+        if rule['dtype'] == 'int64':
+            problems[~np.isnan(numbers) & (numbers != np.round(numbers))] = RULES.index('dtype') + 1
+        out_of_range = np.zeros(numbers.shape, dtype=bool)
+        if rule.get('min') is not None:
+            out_of_range |= numbers < rule['min']
+        if rule.get('max') is not None:
+            out_of_range |= numbers > rule['max']
+        problems[out_of_range & (problems == 0)] = RULES.index('range') + 1
+
+    elif rule.get('codes'):
+        allowed = pd.Index(rule['codes'])
+        missing = np.empty(problems.shape, dtype=bool)
+        for position, col in enumerate(cols):
+            codes, uniques = pd.factorize(df[col], use_na_sentinel=True)
+            missing[:, position] = codes < 0
+            # Unknown distinct values, plus a trailing False that missing values (code -1) pick
+            unknown = np.append(allowed.get_indexer(uniques) < 0, False)
+            problems[unknown[codes], position] = RULES.index('codes') + 1
+
+    else:
+        missing = pd.isna(df[cols].to_numpy())
+
+    if not rule.get('nullable', False):
+        problems[missing] = RULES.index('missing') + 1
+    return problems
+
+
+"""
+Checks a batch against a schema in one vectorized pass (one lookup or comparison per group of columns sharing a rule)
+and returns (valid, errors): a boolean array marking the rows that pass every rule and the row-level report with the
+columns of ERROR_REPORT_COLS, where row is the batch's index label. Column differences raise SchemaValidationError,
+since no row of such a batch can be read as intended.
+"""
+def validate_chunk(df: pd.DataFrame, schema: dict, strict: bool = True) -> tuple:
+    check_columns(df.columns, schema, strict)
+    valid = np.ones(len(df), dtype=bool)
+    reports = []
+    for rule, cols in _rule_groups(schema):
+        problems = _check_group(df, cols, rule)
+        broken = problems.any(axis=1)
+        if not broken.any():
+            continue
+        valid &= ~broken
+        rows, positions = np.nonzero(problems)
+        reports.append(pd.DataFrame({
+            'row': df.index.to_numpy()[rows],
+            'column': np.asarray(cols, dtype=object)[positions],
+            'value': df[cols].to_numpy()[rows, positions],
+            'rule': np.asarray(RULES, dtype=object)[problems[rows, positions] - 1],
+        }))
+    if not reports:
+        return valid, pd.DataFrame(columns=ERROR_REPORT_COLS)
+    return valid, pd.concat(reports, ignore_index=True).sort_values('row', kind='stable', ignore_index=True)
+
+
+"""Returns the invalid rows of a batch with a validation_errors column listing 'column:rule' for every broken rule."""
+def quarantine_rows(df: pd.DataFrame, valid: np.ndarray, errors: pd.DataFrame) -> pd.DataFrame:
+    rejected = df[~valid].copy()
+    reasons = (errors['column'] + ':' + errors['rule']).groupby(errors['row'], sort=False).agg('; '.join)
+    rejected[QUARANTINE_ERRORS_COL] = reasons.reindex(rejected.index).to_numpy()
+    return rejected
+
+
+"""Returns the path the rows that failed validation are written to: <dataset without extension>.quarantine.csv."""
+def quarantine_path(data_path: str) -> str:
+    return os.path.splitext(data_path)[0] + '.quarantine.csv'
+
+
+"""Returns the path the row-level error report is written to: <dataset without extension>.errors.csv."""
+def error_report_path(data_path: str) -> str:
+    return os.path.splitext(data_path)[0] + '.errors.csv'
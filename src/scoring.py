@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+from src.decoding import CL_LEVELS
+
+# Creates global constants for the default heavy user thresholds
+HEAVY_USE_LEVEL = 5        # a drug counts as heavily used from CL5 (weekly) upwards
+HEAVY_USER_MIN_DRUGS = 5   # a respondent is a heavy user from this many heavily used drugs upwards
+OUTLIER_THRESHOLD = 6      # usage_frequency values above this are replaced with the column mean
+
+
+"""
+Returns a matrix of drug levels as int8 with every missing level (negative or NaN) set to -1, after checking the
+original values: levels above 6 or with a fraction raise ValueError, since they would otherwise wrap around in int8
+or fall out of the histogram unnoticed.
+"""
+def check_drug_levels(levels: np.ndarray) -> np.ndarray:
+    levels = np.asarray(levels)
+    if levels.dtype.kind == 'f':
+        levels = np.where(np.isnan(levels), -1, levels)
+        if (levels != np.floor(levels)).any():
+            raise ValueError(f'Drug levels must be whole numbers, got {levels[levels != np.floor(levels)][0]}')
+    if levels.size:
+        highest = CL_LEVELS[-1]
+        if levels.max() > highest:
+            raise ValueError(f'Drug levels must lie in 0-{highest} (negative or NaN for missing), got {levels.max()}')
+        if levels.min() < -1:
+            levels = np.maximum(levels, -1)
+    return levels.astype(np.int8, copy=False)
+
+
+"""
+Scores a N x drugs matrix of drug levels in one pass and returns a dict with:
+  usage_frequency - int64 count of drugs per row used at use_level or above
+  heavy_user      - bool flag, usage_frequency >= heavy_count
+  histogram       - int64 count of every level 0-6 across the whole matrix (one bincount)
+  usage_frequency_replaced - usage_frequency with values above outlier_threshold set to its mean (only if outlier_threshold is given)
+Missing levels (negative values or NaN) are left out of the counts and the histogram; levels above 6 or with a
+fraction raise ValueError (see check_drug_levels).
+"""
+def score_drug_levels(levels: np.ndarray, use_level: int = HEAVY_USE_LEVEL, heavy_count: int = HEAVY_USER_MIN_DRUGS, outlier_threshold: float = None) -> dict:
+    levels = check_drug_levels(levels)
+
+    usage_frequency = np.count_nonzero(levels >= use_level, axis=1).astype(np.int64)
+    # Shifting by one sends missing levels (-1) to bin 0, which is then dropped
+    histogram = np.bincount(levels.ravel().astype(np.intp) + 1, minlength=len(CL_LEVELS) + 1)[1:len(CL_LEVELS) + 1]
+
+    scores = {
+        'usage_frequency': usage_frequency,
+        'heavy_user': usage_frequency >= heavy_count,
+        'histogram': histogram.astype(np.int64),
+    }
+    if outlier_threshold is not None:
+        scores['usage_frequency_replaced'] = replace_outliers(usage_frequency, outlier_threshold)
+    return scores
+
+
+"""Replaces values above threshold with mean (defaults to the mean of values). Returns values unchanged when nothing is replaced."""
+def replace_outliers(values: np.ndarray, threshold: float = OUTLIER_THRESHOLD, mean: float = None) -> np.ndarray:
+    values = np.asarray(values)
+    outliers = values > threshold
+    if not outliers.any():
+        return values
+    if mean is None:
+        mean = np.nanmean(values)
+    return np.where(outliers, mean, values)
+
+
+"""
+Returns the drug levels of the given columns as an int8 matrix (range-checked in their own dtype before narrowing, see
+check_drug_levels), or as a float matrix with NaN when a column can hold missing values.
+"""
+def drug_level_matrix(df: pd.DataFrame, drug_cols: list) -> np.ndarray:
+    frame = df[drug_cols]
+    if all(isinstance(dtype, np.dtype) and dtype.kind in 'iu' for dtype in frame.dtypes):
+        return check_drug_levels(frame.to_numpy())
+    return frame.to_numpy(dtype=np.float64, na_value=np.nan)
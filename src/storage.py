@@ -0,0 +1,71 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.data_cleaning import CLEANED_DRUG_COLS, DEMOGRAPHIC_COLS, PERSONALITY_TRAITS
+from src.decoding import FREQUENCY_LABELS
+
+# Creates global constants for the columnar copies of the cleaned dataset
+FILEPATH_CLEANED_PARQUET = '../data/cleaned/cleaned_drug_consumption.parquet'
+FILEPATH_CLEANED_ARROW = '../data/cleaned/cleaned_drug_consumption.arrow'
+
+# Creates global constant with the target dtype of every column in the cleaned dataset
+CLEANED_DTYPES = {
+    'id': np.int32,
+    'age': np.float64,
+    **{col: 'category' for col in DEMOGRAPHIC_COLS},
+    **{trait: np.float64 for trait in PERSONALITY_TRAITS},
+    **{drug: np.int8 for drug in CLEANED_DRUG_COLS},
+    'drug_intensity_position': np.int16,
+    'usage_frequency': np.float64,
+    'heavy_user': bool,
+    'usage_frequency_label': pd.CategoricalDtype(FREQUENCY_LABELS, ordered=True),
+}
+
+
+"""Casts the columns of the cleaned DataFrame to CLEANED_DTYPES (int8 drug levels, categorical demographics, boolean flags)."""
+def apply_cleaned_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    dtypes = {col: dtype for col, dtype in CLEANED_DTYPES.items() if col in df.columns}
+    if 'heavy_user' in dtypes and df['heavy_user'].dtype == object:
+        df['heavy_user'] = df['heavy_user'].astype(str) == 'True'
+    return df.astype(dtypes)
+
+
+"""Returns True when the filepath points to an Arrow IPC (Feather) file instead of Parquet."""
+def _is_arrow_file(filepath: str) -> bool:
+    return os.path.splitext(filepath)[1].lower() in ('.arrow', '.feather', '.ipc')
+
+
+"""
+Saves the cleaned DataFrame in a columnar file with its dtypes kept.
+.parquet files are compressed and smallest on disk; .arrow/.feather files are uncompressed so they can be memory-mapped.
+"""
+def save_cleaned_columnar(df: pd.DataFrame, filepath: str) -> None:
+    table = pa.Table.from_pandas(apply_cleaned_dtypes(df), preserve_index=False)
+    if _is_arrow_file(filepath):
+        with pa.OSFile(filepath, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pq.write_table(table, filepath, compression='zstd')
+
+
+"""
+Loads the cleaned dataset from a columnar file, reading only the given columns when columns is set.
+Arrow files are memory-mapped, so numeric columns are backed by the page cache instead of being copied into memory.
+"""
+def load_cleaned_columnar(filepath: str, columns: list = None) -> pd.DataFrame:
+    if _is_arrow_file(filepath):
+        table = pa.ipc.open_file(pa.memory_map(filepath, 'r')).read_all()
+        if columns is not None:
+            table = table.select(columns)
+    else:
+        table = pq.read_table(filepath, columns=columns, memory_map=True)
+    return table.to_pandas(split_blocks=True)
+
+
+"""Converts the cleaned CSV into a columnar file (Parquet or Arrow, chosen by extension)."""
+def convert_cleaned_csv(csv_filepath: str, filepath: str) -> None:
+    save_cleaned_columnar(pd.read_csv(csv_filepath), filepath)
@@ -0,0 +1,272 @@
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+import pandas as pd
+
+# Creates global constants for tracing
+TRACE_ENV_VAR = 'DRUG_CONSUMPTION_TRACE'   # set to a .json path to trace the dashboard (Chrome trace written there)
+TRACE_MAX_EVENTS = 100_000
+
+# The active tracer, None when tracing is disabled (the instrumented code only checks this one global)
+_tracer = None
+
+
+"""Returns the active Tracer of this process, or None when tracing is disabled."""
+def active_tracer():
+    tracer = _tracer
+    if tracer is None or tracer.pid != os.getpid():
+        # Worker processes forked from a traced parent do not record into their copy of the tracer
+        return None
+    return tracer
+
+
+"""Returns (rows, {column: dtype name}) of a DataFrame, or (None, {}) for anything else."""
+def _frame_shape(data) -> tuple:
+    if isinstance(data, pd.DataFrame):
+        return len(data), {str(col): str(dtype) for col, dtype in data.dtypes.items()}
+    return None, {}
+
+
+"""Describes how the columns changed between two {column: dtype} snapshots."""
+def _dtype_changes(before: dict, after: dict) -> dict:
+    changes = {}
+    changed = {col: [before[col], after[col]] for col in before if col in after and before[col] != after[col]}
+    added = [col for col in after if col not in before]
+    removed = [col for col in before if col not in after]
+    if changed:
+        changes['changed'] = changed
+    if added:
+        changes['added'] = added
+    if removed:
+        changes['removed'] = removed
+    return changes
+
+
+"""
+Mutable record of one running stage; the instrumented code hands its output DataFrame to set_output()
+so rows out and dtype changes can be recorded.
+"""
+class StageRecord:
+
+    def __init__(self, name: str, category: str, data=None, args: dict = None):
+        self.name = name
+        self.category = category
+        self.rows_in, self.dtypes_in = _frame_shape(data)
+        self.args = dict(args or {})
+        self.output = None
+        self.discarded = False
+
+    def set_output(self, data) -> None:
+        self.output = data
+
+
+"""
+Opt-in tracer for the cleaning stages and dashboard sections.
+
+Each stage records its wall time, the peak traced memory above the memory in use when it started (with memory=True,
+through tracemalloc; a nested stage resets the tracemalloc peak, so the peak reached so far is kept on a per-thread stack
+and folded back into the enclosing stage's peak when the nested stage ends), rows in and out, and the columns whose dtype changed, were added or were removed. Events are
+kept in memory (the newest max_events) and exported as JSON or as a Chrome trace (chrome://tracing, Perfetto).
+
+Stages are recorded by CleaningPipeline, LazyFrame.collect, ArtifactCache builds and DashboardService sections.
+Those only look up the active tracer once per stage, so with tracing disabled they run unchanged. Memory peaks are
+process-wide, so stages running at the same time in different threads see each other's allocations.
+"""
+class Tracer:
+
+    def __init__(self, memory: bool = True, max_events: int = TRACE_MAX_EVENTS):
+        self.memory = memory
+        self.events = deque(maxlen=max_events)
+        self.pid = os.getpid()
+        self.origin = time.perf_counter_ns()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._started_tracemalloc = False
+
+    def start(self) -> None:
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    def stop(self) -> None:
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    # Highest traced memory reached by each running stage of this thread, outermost first
+    def _peaks(self) -> list:
+        if not hasattr(self._local, 'peaks'):
+            self._local.peaks = []
+        return self._local.peaks
+
+    """Records the stage run inside the with block: `with tracer.stage('flag_heavy_users', df) as record: ...`."""
+    @contextmanager
+    def stage(self, name: str, data=None, category: str = 'cleaning', **args):
+        record = StageRecord(name, category, data, args)
+        memory_before = None
+        if self.memory and tracemalloc.is_tracing():
+            memory_before, peak = tracemalloc.get_traced_memory()
+            peaks = self._peaks()
+            if peaks:
+                peaks[-1] = max(peaks[-1], peak)
+            peaks.append(memory_before)
+            tracemalloc.reset_peak()
+        start = time.perf_counter_ns()
+        error = None
+        try:
+            yield record
+        except BaseException as exception:
+            error = type(exception).__name__
+            raise
+        finally:
+            end = time.perf_counter_ns()
+            peak = None
+            if memory_before is not None:
+                peaks = self._peaks()
+                peak = peaks.pop()
+                if tracemalloc.is_tracing():
+                    peak = max(peak, tracemalloc.get_traced_memory()[1])
+                if peaks:
+                    peaks[-1] = max(peaks[-1], peak)
+            if not record.discarded:
+                self._record(record, start, end, memory_before, peak, error)
+
+    def _record(self, record: StageRecord, start: int, end: int, memory_before: int, peak: int, error: str) -> None:
+        event = {
+            'name': record.name,
+            'category': record.category,
+            'start_us': (start - self.origin) / 1000,
+            'duration_us': (end - start) / 1000,
+            'pid': self.pid,
+            'thread': threading.current_thread().name,
+            'tid': threading.get_ident(),
+            'rows_in': record.rows_in,
+        }
+        if memory_before is not None:
+            event['peak_memory_delta_bytes'] = max(peak - memory_before, 0)
+        if record.output is not None:
+            event['rows_out'], dtypes_out = _frame_shape(record.output)
+            if record.dtypes_in or dtypes_out:
+                event['dtype_changes'] = _dtype_changes(record.dtypes_in, dtypes_out)
+        if error is not None:
+            event['error'] = error
+        event.update(record.args)
+        with self._lock:
+            self.events.append(event)
+
+    # Wraps an iterator of DataFrames (e.g. a chunked CSV reader) so producing each item is recorded as a stage
+    def trace_iterator(self, name: str, iterator, category: str = 'io'):
+        iterator = iter(iterator)
+        while True:
+            with self.stage(name, category=category) as record:
+                item = next(iterator, None)
+                if item is None:
+                    record.discarded = True
+                else:
+                    record.set_output(item)
+            if item is None:
+                return
+            yield item
+
+    # Every recorded event as a DataFrame
+    def to_frame(self) -> pd.DataFrame:
+        with self._lock:
+            return pd.DataFrame(list(self.events))
+
+    """Totals per stage: calls, total and mean wall time (ms), worst peak memory delta (MB) and rows processed."""
+    def summary(self) -> pd.DataFrame:
+        events = self.to_frame()
+        if events.empty:
+            return events
+        events['ms'] = events['duration_us'] / 1000
+        if 'peak_memory_delta_bytes' not in events:
+            events['peak_memory_delta_bytes'] = float('nan')
+        summary = events.groupby(['category', 'name'], sort=False).agg(
+            calls=('ms', 'size'), total_ms=('ms', 'sum'), mean_ms=('ms', 'mean'),
+            max_peak_mb=('peak_memory_delta_bytes', 'max'), rows_in=('rows_in', 'sum'))
+        summary['max_peak_mb'] /= 2 ** 20
+        return summary.sort_values('total_ms', ascending=False).reset_index()
+
+    def save_json(self, filepath: str) -> None:
+        with self._lock:
+            events = list(self.events)
+        with open(filepath, 'w') as trace_file:
+            json.dump({'pid': self.pid, 'events': events}, trace_file, indent=1, default=str)
+
+    # Chrome trace event format: one complete ('X') event per stage with the measurements as args
+    def save_chrome_trace(self, filepath: str) -> None:
+        with self._lock:
+            events = list(self.events)
+        trace_events = []
+        for event in events:
+            args = {key: value for key, value in event.items()
+                    if key not in ('name', 'category', 'start_us', 'duration_us', 'pid', 'tid', 'thread')}
+            trace_events.append({'name': event['name'], 'cat': event['category'], 'ph': 'X', 'ts': event['start_us'],
+                                 'dur': event['duration_us'], 'pid': event['pid'], 'tid': event['tid'], 'args': args})
+        threads = {(event['pid'], event['tid']): event['thread'] for event in events}
+        for (pid, tid), thread_name in threads.items():
+            trace_events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': thread_name}})
+        with open(filepath, 'w') as trace_file:
+            json.dump({'traceEvents': trace_events, 'displayTimeUnit': 'ms'}, trace_file, default=str)
+
+    # Writes the Chrome trace, or the structured event JSON with chrome=False
+    def save(self, filepath: str, chrome: bool = True) -> None:
+        if chrome:
+            self.save_chrome_trace(filepath)
+        else:
+            self.save_json(filepath)
+
+
+"""Turns tracing on for this process and returns the new active Tracer."""
+def enable_tracing(memory: bool = True, max_events: int = TRACE_MAX_EVENTS) -> Tracer:
+    global _tracer
+    disable_tracing()
+    _tracer = Tracer(memory, max_events)
+    _tracer.start()
+    return _tracer
+
+
+"""Turns tracing off and returns the tracer that was active (or None)."""
+def disable_tracing():
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.stop()
+    return tracer
+
+
+"""
+Traces the with block: `with tracing('clean.trace.json') as tracer: pipeline.run(...)`.
+When filepath is given the Chrome trace is written there on exit (and the structured JSON with chrome=False).
+"""
+@contextmanager
+def tracing(filepath: str = None, memory: bool = True, chrome: bool = True):
+    tracer = enable_tracing(memory)
+    try:
+        yield tracer
+    finally:
+        disable_tracing()
+        if filepath is not None:
+            tracer.save(filepath, chrome)
+
+
+"""Enables tracing when the DRUG_CONSUMPTION_TRACE environment variable names an output file; returns (tracer, path)."""
+def tracing_from_env() -> tuple:
+    filepath = os.environ.get(TRACE_ENV_VAR)
+    if not filepath:
+        return None, None
+    tracer = active_tracer() or enable_tracing()
+    return tracer, filepath
+
+
+"""Context manager recording a stage on the active tracer, or doing nothing (yielding None) when tracing is disabled."""
+def traced_stage(name: str, data=None, category: str = 'cleaning', **args):
+    tracer = active_tracer()
+    if tracer is None:
+        return nullcontext()
+    return tracer.stage(name, data, category, **args)
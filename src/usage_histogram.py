@@ -0,0 +1,202 @@
+import numpy as np
+import pandas as pd
+
+from src.cube import CUBE_KEY_COLS, selection_cell_mask
+from src.data_cleaning import PERSONALITY_TRAITS, CLEANED_DRUG_COLS
+from src.decoding import CL_LEVELS, FREQUENCY_LABELS
+from src.scoring import drug_level_matrix
+
+# Creates global constants for the columns of the tidy histogram table (to_frame / from_frame)
+HISTOGRAM_DRUG_COL = 'drug'
+HISTOGRAM_LEVEL_COL = 'level'
+HISTOGRAM_COUNT_COL = 'count'
+TRAIT_SUM_SUFFIX = '_sum'
+
+
+"""Returns the column of the tidy histogram table holding the sums of a trait."""
+def trait_sum_col(trait: str) -> str:
+    return f'{trait}{TRAIT_SUM_SUFFIX}'
+
+
+"""
+Histogram table of drug use levels: for every demographic cell (gender, age, education by default), drug and level
+0-6 it stores the respondent count and the sum of every personality trait. The frequency charts only need these
+totals (level counts per drug, mean level per drug, mean trait per level of a drug, the usage level summary), so
+they are drawn from the table in time independent of the number of respondents.
+
+update() tallies a batch of respondent rows in one vectorized pass (one bincount for the counts and one per trait)
+and adds it to the table, so it is kept up to date chunk by chunk or wave by wave; demographic values not seen
+before add new cells. merge() adds up tables built separately. Missing drug levels (NaN or negative) are left out.
+
+A selection is a dict {key column: allowed values}, as for AggregateCube.
+"""
+class UsageHistogram:
+
+    def __init__(self, key_cols: list = CUBE_KEY_COLS, drug_cols: list = CLEANED_DRUG_COLS, trait_cols: list = PERSONALITY_TRAITS):
+        self.key_cols = list(key_cols)
+        self.drug_cols = list(drug_cols)
+        self.trait_cols = list(trait_cols)
+        self.levels = {col: pd.Index([]) for col in self.key_cols}
+        self.shape = tuple(0 for _ in self.key_cols)
+        n_cells, n_drugs, n_levels = int(np.prod(self.shape)), len(self.drug_cols), len(CL_LEVELS)
+        self.counts = np.zeros((n_cells, n_drugs, n_levels), dtype=np.int64)
+        self.trait_sums = np.zeros((n_cells, n_drugs, n_levels, len(self.trait_cols)))
+
+    @classmethod
+    def from_data(cls, df: pd.DataFrame, key_cols: list = CUBE_KEY_COLS, drug_cols: list = CLEANED_DRUG_COLS,
+                  trait_cols: list = PERSONALITY_TRAITS) -> 'UsageHistogram':
+        return cls(key_cols, drug_cols, trait_cols).update(df)
+
+    # Grows the cell arrays along the axis of a key column that gained new values
+    def _add_key_values(self, col: str, values) -> None:
+        axis = self.key_cols.index(col)
+        added = len(values)
+        known = self.levels[col]
+        self.levels[col] = pd.Index(values) if known.empty else known.append(pd.Index(values))
+        old_shape = self.shape
+        self.shape = tuple(size + added if position == axis else size for position, size in enumerate(old_shape))
+
+        def grow(array: np.ndarray) -> np.ndarray:
+            cells = array.reshape(old_shape + array.shape[1:])
+            padding = [(0, added if position == axis else 0) for position in range(cells.ndim)]
+            return np.pad(cells, padding).reshape((int(np.prod(self.shape)),) + array.shape[1:])
+
+        self.counts = grow(self.counts)
+        self.trait_sums = grow(self.trait_sums)
+
+    # Flat cell index of every row, adding the demographic values not seen before
+    def _cells(self, df: pd.DataFrame) -> np.ndarray:
+        codes = []
+        for col in self.key_cols:
+            values = df[col].to_numpy()
+            code = self.levels[col].get_indexer(values)
+            if (code < 0).any():
+                self._add_key_values(col, pd.unique(values[code < 0]))
+                code = self.levels[col].get_indexer(values)
+            codes.append(code)
+        if not codes:
+            return np.zeros(len(df), dtype=np.intp)
+        return np.ravel_multi_index(codes, self.shape)
+
+    # Adds the respondent rows of df (with the key, drug and trait columns) to the table
+    def update(self, df: pd.DataFrame) -> 'UsageHistogram':
+        cells = self._cells(df)
+        n_drugs, n_levels = len(self.drug_cols), len(CL_LEVELS)
+        size = self.counts.size
+
+        levels = drug_level_matrix(df, self.drug_cols)
+        if levels.dtype.kind == 'f':
+            levels = np.where(np.isnan(levels), -1, levels)
+        index = levels.astype(np.intp)
+        present = (index >= 0) & (index < n_levels)
+        complete = present.all()
+        # Flat (cell, drug, level) position of every answer, built in place in the level matrix
+        index += (cells[:, None] * n_drugs + np.arange(n_drugs)) * n_levels
+        index = index.ravel() if complete else index[present]
+
+        self.counts += np.bincount(index, minlength=size).reshape(self.counts.shape)
+        if self.trait_cols:
+            traits = df[self.trait_cols].to_numpy(dtype=np.float64)
+            rows = np.repeat(np.arange(len(df)), n_drugs) if complete else np.broadcast_to(np.arange(len(df))[:, None], present.shape)[present]
+            for position in range(len(self.trait_cols)):
+                self.trait_sums[..., position] += np.bincount(index, weights=traits[rows, position], minlength=size).reshape(self.counts.shape)
+        return self
+
+    # Adds another table over the same drug and trait columns to this one
+    def merge(self, other: 'UsageHistogram') -> 'UsageHistogram':
+        if (other.key_cols, other.drug_cols, other.trait_cols) != (self.key_cols, self.drug_cols, self.trait_cols):
+            raise ValueError('Cannot merge usage histograms over different key, drug or trait columns')
+        return self.update_from_frame(other.to_frame())
+
+    def _cell_mask(self, selection: dict = None) -> np.ndarray:
+        return selection_cell_mask(self.levels, self.key_cols, selection)
+
+    # Respondent counts per drug (rows) and level 0-6 (columns), what df[drug_cols].apply(pd.Series.value_counts).T counts
+    def level_counts(self, selection: dict = None) -> pd.DataFrame:
+        counts = self.counts[self._cell_mask(selection)].sum(axis=0)
+        return pd.DataFrame(counts, index=self.drug_cols, columns=CL_LEVELS.tolist())
+
+    # Mean use level of every drug, what df[drug_cols].mean() returns
+    def drug_means(self, selection: dict = None) -> pd.Series:
+        counts = self.level_counts(selection)
+        return (counts * CL_LEVELS).sum(axis=1) / counts.sum(axis=1)
+
+    """
+    Mean of a trait among the respondents at each use level of a drug (levels nobody reported are left out),
+    as a DataFrame with the columns [drug, trait], the bars sns.barplot(x=drug, y=trait, data=df) draws.
+    """
+    def trait_means(self, trait: str, drug: str, selection: dict = None) -> pd.DataFrame:
+        mask = self._cell_mask(selection)
+        drug_index, trait_index = self.drug_cols.index(drug), self.trait_cols.index(trait)
+        counts = self.counts[mask, drug_index].sum(axis=0)
+        sums = self.trait_sums[mask, drug_index, :, trait_index].sum(axis=0)
+        present = counts > 0
+        return pd.DataFrame({drug: CL_LEVELS[present].astype(np.int64), trait: sums[present] / counts[present]})
+
+    # Count of every use level across all drugs, the summary flag_heavy_users returns ('Usage Frequency', 'heavy_user')
+    def usage_summary(self, selection: dict = None) -> pd.DataFrame:
+        return pd.DataFrame({
+            'Usage Frequency': FREQUENCY_LABELS,
+            'heavy_user': self.level_counts(selection).sum(axis=0).to_numpy(),
+        })
+
+    """
+    Returns the non-empty entries as a tidy DataFrame: the key columns, drug, level, count and one <trait>_sum column
+    per trait. This is the form the table is stored in (Parquet) and passed to the plotting functions.
+    """
+    def to_frame(self) -> pd.DataFrame:
+        cells, drugs, levels = np.nonzero(self.counts)
+        frame = {}
+        if self.key_cols:
+            for col, codes in zip(self.key_cols, np.unravel_index(cells, self.shape)):
+                frame[col] = self.levels[col].take(codes)
+        frame[HISTOGRAM_DRUG_COL] = np.asarray(self.drug_cols, dtype=object)[drugs]
+        frame[HISTOGRAM_LEVEL_COL] = levels.astype(np.int8)
+        frame[HISTOGRAM_COUNT_COL] = self.counts[cells, drugs, levels]
+        for position, trait in enumerate(self.trait_cols):
+            frame[trait_sum_col(trait)] = self.trait_sums[cells, drugs, levels, position]
+        return pd.DataFrame(frame)
+
+    # Adds the entries of a tidy table written by to_frame()
+    def update_from_frame(self, frame: pd.DataFrame) -> 'UsageHistogram':
+        cells = self._cells(frame)
+        n_drugs, n_levels = len(self.drug_cols), len(CL_LEVELS)
+        drugs = pd.Index(self.drug_cols).get_indexer(frame[HISTOGRAM_DRUG_COL])
+        index = (cells * n_drugs + drugs) * n_levels + frame[HISTOGRAM_LEVEL_COL].to_numpy(dtype=np.intp)
+        size = self.counts.size
+
+        counts = frame[HISTOGRAM_COUNT_COL].to_numpy(dtype=np.float64)
+        self.counts += np.bincount(index, weights=counts, minlength=size).astype(np.int64).reshape(self.counts.shape)
+        for position, trait in enumerate(self.trait_cols):
+            sums = frame[trait_sum_col(trait)].to_numpy(dtype=np.float64)
+            self.trait_sums[..., position] += np.bincount(index, weights=sums, minlength=size).reshape(self.counts.shape)
+        return self
+
+    # Rebuilds a table from the tidy form; the key, drug and trait columns are read from the frame
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame) -> 'UsageHistogram':
+        drug_cols = list(pd.unique(frame[HISTOGRAM_DRUG_COL]))
+        trait_cols = [col[:-len(TRAIT_SUM_SUFFIX)] for col in frame.columns if col.endswith(TRAIT_SUM_SUFFIX)]
+        key_cols = [col for col in frame.columns if col not in (HISTOGRAM_DRUG_COL, HISTOGRAM_LEVEL_COL, HISTOGRAM_COUNT_COL)
+                    and not col.endswith(TRAIT_SUM_SUFFIX)]
+        return cls(key_cols, drug_cols, trait_cols).update_from_frame(frame)
+
+
+"""Returns True when df is the tidy table of a UsageHistogram rather than respondent rows."""
+def is_histogram_frame(df: pd.DataFrame) -> bool:
+    return {HISTOGRAM_DRUG_COL, HISTOGRAM_LEVEL_COL, HISTOGRAM_COUNT_COL}.issubset(df.columns)
+
+
+"""
+Returns data as a UsageHistogram: the table itself, the table rebuilt from its tidy form, or the respondent rows of a
+DataFrame tallied over the given drug, trait and key columns (by default the cube key columns the frame has; pass
+key_cols=[] when no selection will be made, which saves mapping the demographic values).
+"""
+def usage_histogram(data, drug_cols: list = CLEANED_DRUG_COLS, trait_cols: list = PERSONALITY_TRAITS, key_cols: list = None) -> UsageHistogram:
+    if isinstance(data, UsageHistogram):
+        return data
+    if is_histogram_frame(data):
+        return UsageHistogram.from_frame(data)
+    if key_cols is None:
+        key_cols = [col for col in CUBE_KEY_COLS if col in data.columns]
+    return UsageHistogram.from_data(data, key_cols, drug_cols, trait_cols)
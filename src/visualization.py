@@ -1,7 +1,14 @@
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
 import numpy as np
+from src.lazy_import import lazy_import
+from src.correlation import correlation_block
+from src.usage_histogram import usage_histogram
+from src.bootstrap import trait_drug_intervals
+from src.large_data import HEXBIN_GRIDSIZE, SAMPLE_SIZE, SAMPLE_SEED, is_large, grouped_boxplot_stats, stratified_sample
+
+# seaborn and matplotlib are imported when the first chart is drawn
+sns = lazy_import('seaborn')
+plt = lazy_import('matplotlib.pyplot')
 
 # *Creates Counterplot graph for demographics of age distribution
 def plot_age_distribution(df: pd.DataFrame, age_col: str) -> None:
@@ -24,12 +31,12 @@ def plot_gender_distribution(df: pd.DataFrame, gender_col: str) -> None:
     plt.show()
 
 
-# *Creates Stacked Bar Graph for Most Frequently used Drugs
+# *Creates Stacked Bar Graph for Most Frequently used Drugs (df can also be a UsageHistogram or its tidy table)
 
 def plot_drug_usage_frequency(df: pd.DataFrame, drug_columns: list) -> None:
     
-    plt.figure(figsize=(16,12))
-    df[drug_columns].apply(pd.Series.value_counts).T.plot(kind='bar', stacked=True)
+    level_counts = usage_histogram(df, drug_columns, [], key_cols=[]).level_counts().loc[drug_columns]
+    level_counts.loc[:, level_counts.sum() > 0].plot(kind='bar', stacked=True)
     plt.title('Drug Usage Levels Across Substances')
     plt.xlabel('Substances')
     plt.ylabel('Count')
@@ -93,18 +100,17 @@ def combine_and_plot_heavy_users(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-# *Creates Correlation Heatmap for personality traits and drug use
+# *Creates Correlation Heatmap for personality traits and drug use (method='spearman' treats the drug levels as ordinal)
 
-def plot_personality_drug_correlation_heatmap(df: pd.DataFrame, drug_cols: list) -> None:
+def plot_personality_drug_correlation_heatmap(df: pd.DataFrame, drug_cols: list, method: str = 'pearson') -> None:
     traits = ['neuroticism_nscore', 'extraversion_escore', 'openness_oscore', 'agreeableness_ascore', 'conscientiousness_cscore', 'impulsivity_impulsive', 'sensation_seeking_ss']
     
-    combined_cols = traits + drug_cols
-    corr = df[combined_cols].corr()
+    corr = correlation_block(df, traits, drug_cols, method)
 
     plt.figure(figsize=(len(drug_cols) * 0.7, len(traits) * 0.7))
 
     ax = sns.heatmap(
-        corr.loc[traits, drug_cols],
+        corr,
         annot=True,
         cmap='coolwarm',
         cbar_kws={'shrink': 0.7},  
@@ -121,10 +127,10 @@ def plot_personality_drug_correlation_heatmap(df: pd.DataFrame, drug_cols: list)
 
 # *Creates correlation heatmap for personality traits
 
-def plot_personality_trait_correlation(df: pd.DataFrame) -> None:
+def plot_personality_trait_correlation(df: pd.DataFrame, method: str = 'pearson') -> None:
     plt.figure(figsize=(10,8))
     traits = ['neuroticism_nscore', 'extraversion_escore', 'openness_oscore', 'agreeableness_ascore', 'conscientiousness_cscore', 'impulsivity_impulsive', 'sensation_seeking_ss']
-    correlation_matrix = df[traits].corr()
+    correlation_matrix = correlation_block(df, traits, method=method)
     sns.heatmap(correlation_matrix, annot=True, cmap='coolwarm')
     plt.title('Correlation Between Personality Traits')
     plt.tight_layout()
@@ -173,11 +179,13 @@ def plot_personality_drug_intensity_stacked(df: pd.DataFrame) -> None:
 
 
 # Creates barplots to explore how impulsivity affects use of drugs like cannabis, cocaine, and LSD.
+# The bars are the trait means per use level from the histogram table (df can also be a UsageHistogram or its tidy table);
+# with intervals (a bootstrap_trait_means table) every bar gets its bootstrap confidence interval
 
-def plot_trait_drug_barplots(df: pd.DataFrame, traits: list, drugs: list) -> None:
+def plot_trait_drug_barplots(df: pd.DataFrame, traits: list, drugs: list, intervals: pd.DataFrame = None) -> None:
 
     sns.set_theme(style="whitegrid", palette="muted", font_scale=1.1)
-    plt.figure(figsize=(16, 12))
+    histogram = usage_histogram(df, drugs, traits, key_cols=[])
 
     for trait in traits:
         for drug in drugs:
@@ -186,11 +194,13 @@ def plot_trait_drug_barplots(df: pd.DataFrame, traits: list, drugs: list) -> Non
                 x=drug,
                 y=trait,
                 hue=drug, 
-                data=df,
+                data=histogram.trait_means(trait, drug),
                 errorbar=None, 
                 palette="coolwarm",
                 legend=False
             )
+            if intervals is not None:
+                plot_interval_bars(plt.gca(), trait_drug_intervals(intervals, trait, drug))
             plt.title(f"{trait} vs. {drug} Usage Level", fontsize=14, fontweight='bold')
             plt.xlabel(f"{drug} Use (0–6)", fontsize=12)
             plt.ylabel(f"Average {trait} Score", fontsize=12)
@@ -199,11 +209,23 @@ def plot_trait_drug_barplots(df: pd.DataFrame, traits: list, drugs: list) -> Non
 
 
 # Creates a boxplot to compare drug use intensity across age, gender, and education levels.
+# Above the large-data threshold the boxes are drawn from histogram sketches instead of sorting every group.
 
-def plot_drug_intensity_by_demographics(df: pd.DataFrame) -> None:
+def plot_drug_intensity_by_demographics(df: pd.DataFrame, large_n_threshold: int = None) -> None:
 
     sns.set_theme(style="whitegrid", palette="muted", font_scale=1.1)
-    plt.figure(figsize=(16, 12))
+
+    if is_large(len(df), large_n_threshold):
+        for by, palette, title, xlabel, rotation in [('age', 'Blues', 'Drug Use Intensity by Age Group', 'Age Group', 45),
+                                                      ('gender', 'Set2', 'Drug Use Intensity by Gender', 'Gender', 0),
+                                                      ('education', 'viridis', 'Drug Use Intensity by Education Level', 'Education Level', 45)]:
+            fig, ax = plt.subplots(figsize=(8, 5))
+            plot_boxplot_from_stats(ax, grouped_boxplot_stats(df, 'drug_intensity_position', by), palette, title, xlabel, 'Drug Intensity Index')
+            ax.title.set(fontsize=14, fontweight='bold')
+            ax.tick_params(axis='x', labelrotation=rotation)
+            fig.tight_layout()
+            plt.show()
+        return None
 
     plt.figure(figsize=(8, 5))
     sns.boxplot(x='age', y='drug_intensity_position', hue='age', data=df, palette='Blues', legend=False)
@@ -236,11 +258,20 @@ def plot_drug_intensity_by_demographics(df: pd.DataFrame) -> None:
 
 
 # Creates a pairplot to find patterns between different drug types and user groups.
+# Above the large-data threshold the pairs are drawn as hexbin densities and the diagonal as histograms of every row.
 
-def plot_drug_pairplot(df: pd.DataFrame, drug_columns: list) -> None:
+def plot_drug_pairplot(df: pd.DataFrame, drug_columns: list, large_n_threshold: int = None) -> None:
 
     sns.set_theme(style="whitegrid", font_scale=1.1)
 
+    if is_large(len(df), large_n_threshold):
+        grid = sns.PairGrid(df[drug_columns], corner=True)
+        grid.map_lower(_hexbin_density)
+        grid.map_diag(sns.histplot, discrete=True, color="steelblue")
+        grid.figure.suptitle("Pairwise Relationships Among Selected Drug Types", fontsize=14, fontweight="bold", y=1.02)
+        plt.show()
+        return None
+
     pairplot = sns.pairplot(
         df[drug_columns],
         corner=True,
@@ -260,14 +291,14 @@ def plot_drug_pairplot(df: pd.DataFrame, drug_columns: list) -> None:
     plt.show()
 
 
-# Creates a bar chart of the top 5 most commonly used substances for quick insight.
+# Creates a bar chart of the top 5 most commonly used substances for quick insight (df can also be a UsageHistogram or its tidy table).
 
 def plot_top_five_drugs(df: pd.DataFrame, drug_columns: list) -> None:
 
     sns.set_theme(style="whitegrid", font_scale=1.1)
     plt.figure(figsize=(8, 5))
 
-    avg_usage = df[drug_columns].mean().sort_values(ascending=False).head(5)
+    avg_usage = usage_histogram(df, drug_columns, [], key_cols=[]).drug_means().loc[drug_columns].sort_values(ascending=False).head(5)
 
     sns.barplot(x=avg_usage.index, y=avg_usage.values, palette="coolwarm", hue=avg_usage.index, legend=False)
 
@@ -275,4 +306,45 @@ def plot_top_five_drugs(df: pd.DataFrame, drug_columns: list) -> None:
     plt.xlabel("Substance")
     plt.ylabel("Average Usage Level (0–6)")
     plt.tight_layout()
-    plt.show()
\ No newline at end of file
+    plt.show()
+
+
+# Draws confidence intervals (rows with mean, ci_low and ci_high in bar order) as error bars over the bars of a barplot
+
+def plot_interval_bars(ax, intervals: pd.DataFrame) -> None:
+    means = intervals['mean'].to_numpy()
+    errors = [means - intervals['ci_low'].to_numpy(), intervals['ci_high'].to_numpy() - means]
+    ax.errorbar(np.arange(len(intervals)), means, yerr=errors, fmt='none', ecolor='black', elinewidth=1.2, capsize=4)
+
+
+# Draws the density of a pair of columns as hexagons shaded by (log) respondent count, for PairGrid.map_lower
+
+def _hexbin_density(x, y, ax=None, gridsize: int = HEXBIN_GRIDSIZE, **kwargs) -> None:
+    ax = ax or plt.gca()
+    ax.hexbin(x, y, gridsize=gridsize, mincnt=1, bins='log', cmap='Blues')
+
+
+# Creates a scatterplot on the given axes; above the large-data threshold every row is drawn as a hexbin density and
+# a stratified sample (by hue, fixed seed) is overlaid in the hue colours
+
+def plot_density_scatter(ax, df: pd.DataFrame, x: str, y: str, hue: str = None, palette: str = 'Set2',
+                         large_n_threshold: int = None, sample_size: int = SAMPLE_SIZE, seed: int = SAMPLE_SEED) -> None:
+    if not is_large(len(df), large_n_threshold):
+        sns.scatterplot(data=df, x=x, y=y, hue=hue, palette=palette if hue else None, ax=ax)
+        return None
+    ax.hexbin(df[x], df[y], gridsize=HEXBIN_GRIDSIZE, mincnt=1, bins='log', cmap='Greys')
+    sample = stratified_sample(df, hue, sample_size, seed)
+    sns.scatterplot(data=sample, x=x, y=y, hue=hue, palette=palette if hue else None, s=6, alpha=0.5, linewidth=0, ax=ax)
+    ax.text(0.99, 0.01, f'density of {len(df):,} rows, {len(sample):,} sampled points', transform=ax.transAxes,
+            ha='right', va='bottom', fontsize=8, color='dimgray')
+
+
+# Creates a boxplot on the given axes from precomputed boxplot statistics (see AggregateCube.boxplot_stats) instead of raw rows
+
+def plot_boxplot_from_stats(ax, stats: list, palette: str, title: str, xlabel: str, ylabel: str = 'drug_intensity_position') -> None:
+    boxes = ax.bxp(stats, patch_artist=True, showfliers=True)
+    for patch, color in zip(boxes['boxes'], sns.color_palette(palette, len(stats))):
+        patch.set_facecolor(color)
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
@@ -0,0 +1,360 @@
+import hashlib
+import importlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.artifact_cache import CLEANING_MODULES, cleaning_parameters, _describe_pipeline, _source
+from src.pipeline import CleaningPipeline, build_default_pipeline, step_columns
+from src.scaling import StreamingScaler
+from src.storage import apply_cleaned_dtypes, load_cleaned_columnar
+from src.usage_histogram import UsageHistogram
+
+# Creates global constants for the survey wave registry (kept next to the raw and cleaned data)
+WAVE_REGISTRY_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'waves')
+WAVE_REGISTRY_FORMAT = 1   # bump when the layout of the registry changes
+REGISTRY_FILE = 'registry.json'
+WAVE_NAME_PATTERN = re.compile(r'[\w.-]+')
+
+# Creates global constants with the files of one wave partition
+STAGE_FILE = 'stage.parquet'                    # immutable: rows after validation and the row-local steps
+CLEANED_FILE = 'cleaned.parquet'                # derived: rows after every step, rewritten when a global statistic it uses changes
+SUMMARY_FILE = 'usage_summary.parquet'
+HISTOGRAM_FILE = 'usage_histogram.parquet'
+REJECTED_BASENAME = 'raw.csv'                   # quarantined rows go to raw.quarantine.csv and raw.errors.csv
+
+
+def _digest(*parts) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(json.dumps(part, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def _file_sha256(filepath: str) -> str:
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as raw_file:
+        for block in iter(lambda: raw_file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Chunk statistics of CleaningPipeline._partial_stats as JSON, and back
+def _dump_partial(partial: dict) -> dict:
+    if 'scaler' in partial:
+        return {'count': int(partial['count']), 'scaler': partial['scaler'].to_dict()}
+    return {'count': int(partial['count']), 'sum': float(partial['sum']), 'max': None if partial['max'] is None else float(partial['max'])}
+
+
+def _load_partial(partial: dict) -> dict:
+    if 'scaler' in partial:
+        return {'count': partial['count'], 'scaler': StreamingScaler.from_dict(partial['scaler'])}
+    return dict(partial)
+
+
+# Fitted state a global step transforms with (scale and offset, or the outlier mean), as recorded in the keys of what depends on it
+def _step_state(step: dict):
+    if step['kind'] == 'min_max':
+        scale, offset = step['scaler'].parameters()
+        return [step['scaler'].columns, scale.tolist(), offset.tolist()]
+    return [float(step['mean']), bool(step['has_outliers'])]
+
+
+"""
+Registry of survey waves, each stored as an immutable partition, that keeps the cleaned dataset of all waves up to
+date without re-running the pipeline over the whole history when a wave arrives.
+
+The pipeline's steps are split where its first global step (min-max scaling, outlier mean) starts. append() runs a
+new raw file through the steps before it once and stores the result as the wave's stage.parquet, which never changes
+afterwards. The global statistics are kept per wave as the chunk statistics the pipeline reduces (min/max per trait,
+sum/count/max of usage_frequency), so after an append only the new wave's stage is read to fit them; a wave's
+statistics for a step are recomputed only when an earlier global step whose output that step reads changed its fitted
+state (the outlier mean does not read the scaled traits, so new trait bounds do not refit it). Each wave's
+cleaned.parquet (and its usage summary and histogram) is rewritten only when a statistic it depends on changed: the
+trait bounds, or the outlier mean for waves that have values above the threshold. The result equals running the
+pipeline on the concatenated raw files.
+
+Analyses read any selection of waves (load, usage_summary, usage_histogram) from the stored partitions only; traits
+are scaled with the bounds over every registered wave, so waves stay comparable. The registry.json manifest records
+the waves, their statistics and a key of the pipeline; when the cleaning code changes, the stages are rebuilt from
+the recorded raw files (which must still be unchanged) or the derived files are recomputed from the stages.
+"""
+class WaveRegistry:
+
+    def __init__(self, registry_dir: str = WAVE_REGISTRY_DIR, pipeline: CleaningPipeline = None):
+        self.registry_dir = registry_dir
+        self.pipeline = pipeline or build_default_pipeline()
+        fit_indices = self.pipeline._fit_indices()
+        self.stage_end = fit_indices[0] if fit_indices else len(self.pipeline.steps)
+        self.last_refresh = {'refit': [], 'refinalized': []}
+
+        self.manifest = self._read_manifest()
+        stage_key, pipeline_key = self._keys()
+        if self.manifest['waves'] and self.manifest['stage_key'] != stage_key:
+            self.manifest['stage_key'] = stage_key
+            for wave in self.manifest['waves']:
+                self._restage(wave)
+        if self.manifest['pipeline_key'] != pipeline_key:
+            for wave in self.manifest['waves']:
+                wave['stats'], wave['finalized_key'] = {}, None
+        self.manifest['stage_key'], self.manifest['pipeline_key'] = stage_key, pipeline_key
+        # An empty registry leaves no files behind; the directory is created by the first append
+        if self.manifest['waves']:
+            self._refresh()
+
+    """
+    Keys of the stage (the source of every module in CLEANING_MODULES, the cleaning parameters and the steps before the
+    first global step) and of the whole pipeline. Saved scalers are part of the keys, since _describe_pipeline leaves
+    fitted state out.
+    """
+    def _keys(self) -> tuple:
+        description = _describe_pipeline(self.pipeline)
+        frozen = [step['scaler'].to_dict() if step.get('frozen') else None for step in self.pipeline.steps]
+        modules = [_source(importlib.import_module(module_name)) for module_name in CLEANING_MODULES]
+        stage_key = _digest(WAVE_REGISTRY_FORMAT, cleaning_parameters(), modules, description[:self.stage_end], frozen[:self.stage_end])
+        return stage_key, _digest(stage_key, description[self.stage_end:], frozen[self.stage_end:])
+
+    def _read_manifest(self) -> dict:
+        try:
+            with open(os.path.join(self.registry_dir, REGISTRY_FILE)) as manifest_file:
+                return json.load(manifest_file)
+        except FileNotFoundError:
+            return {'format': WAVE_REGISTRY_FORMAT, 'stage_key': None, 'pipeline_key': None, 'waves': []}
+
+    def _write_manifest(self) -> None:
+        handle, tmp_path = tempfile.mkstemp(dir=self.registry_dir, prefix='.tmp-')
+        with os.fdopen(handle, 'w') as manifest_file:
+            json.dump(self.manifest, manifest_file, indent=2)
+        os.replace(tmp_path, os.path.join(self.registry_dir, REGISTRY_FILE))
+
+    def _wave_dir(self, name: str) -> str:
+        return os.path.join(self.registry_dir, 'waves', name)
+
+    # Runs the raw file through the steps before the first global step into stage_dir; returns (rows, quarantined rows)
+    def _write_stage(self, raw_path: str, stage_dir: str) -> tuple:
+        pipeline, rows, writer = self.pipeline, 0, None
+        rejected_path = os.path.join(stage_dir, REJECTED_BASENAME)
+        pipeline._reset_rejected(rejected_path)
+        try:
+            for chunk in pipeline._read_chunks(raw_path):
+                chunk = pipeline._apply(chunk, pipeline.steps[:self.stage_end], collect_summary=True)
+                table = pa.Table.from_pandas(chunk, schema=writer.schema if writer else None, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(os.path.join(stage_dir, STAGE_FILE), table.schema, compression='zstd')
+                writer.write_table(table)
+                pipeline._write_rejected(rejected_path)
+                rows += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+        return rows, pipeline.quarantined_rows
+
+    # Rebuilds the stage of a wave from its raw file, which must be the file it was appended from
+    def _restage(self, wave: dict) -> None:
+        raw_path = wave['raw_path']
+        if not os.path.exists(raw_path) or _file_sha256(raw_path) != wave['raw_sha256']:
+            raise ValueError(f'The cleaning steps changed and wave {wave["name"]!r} must be staged again, '
+                             f'but its raw file {raw_path} is missing or was modified')
+        tmp_dir = tempfile.mkdtemp(dir=self.registry_dir, prefix='.tmp-')
+        try:
+            wave['rows'], wave['quarantined_rows'] = self._write_stage(raw_path, tmp_dir)
+            shutil.rmtree(self._wave_dir(wave['name']), ignore_errors=True)
+            os.replace(tmp_dir, self._wave_dir(wave['name']))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        wave['stats'], wave['finalized_key'] = {}, None
+
+    # Stage rows of a wave in chunks of the pipeline's chunksize (one empty chunk for a wave whose rows were all quarantined)
+    def _stage_chunks(self, wave: dict):
+        stage = pq.ParquetFile(os.path.join(self._wave_dir(wave['name']), STAGE_FILE))
+        if stage.metadata.num_rows == 0:
+            yield stage.schema_arrow.empty_table().to_pandas()
+            return
+        for batch in stage.iter_batches(batch_size=self.pipeline.chunksize):
+            yield batch.to_pandas()
+
+    """
+    Fits the global steps from the per-wave statistics, recomputing them only for the waves whose statistics were
+    taken under different fitted states of the earlier global steps, then rewrites the cleaned files of the waves whose
+    finalize key changed. Records the waves it touched in last_refresh.
+    """
+    def _refresh(self) -> None:
+        pipeline, waves = self.pipeline, self.manifest['waves']
+        refit, states = [], {}
+        for index in pipeline._fit_indices():
+            state_key = _digest([[position, states[position]] for position in self._dependencies(index)])
+            partials = []
+            for wave in waves:
+                stats = wave['stats'].get(str(index))
+                if stats is None or stats['state_key'] != state_key:
+                    chunk_stats = [pipeline._partial_stats(chunk, index, self.stage_end) for chunk in self._stage_chunks(wave)]
+                    stats = {'state_key': state_key, 'partials': [_dump_partial(partial) for partial in chunk_stats]}
+                    wave['stats'][str(index)] = stats
+                    refit.append(wave['name'])
+                partials += [_load_partial(partial) for partial in stats['partials']]
+            pipeline._reduce_stats(index, partials)
+            states[index] = _step_state(pipeline.steps[index])
+        pipeline.fitted = True
+
+        refinalized = []
+        for wave in waves:
+            finalized_key = self._finalized_key(wave)
+            if wave['finalized_key'] != finalized_key or not os.path.exists(os.path.join(self._wave_dir(wave['name']), CLEANED_FILE)):
+                self._finalize(wave)
+                wave['finalized_key'] = finalized_key
+                refinalized.append(wave['name'])
+
+        self.last_refresh = {'refit': list(dict.fromkeys(refit)), 'refinalized': refinalized}
+        self._write_manifest()
+
+    """
+    Positions of the earlier global steps whose output reaches the columns the global step at index reads, traced
+    back through the columns every step in between reads and writes (see step_columns). A step that may read any
+    column makes every global step before it a dependency.
+    """
+    def _dependencies(self, index: int) -> list:
+        fit_indices = self.pipeline._fit_indices()
+        needed, dependencies = set(step_columns(self.pipeline.steps[index])[0]), []
+        for position in range(index - 1, self.stage_end - 1, -1):
+            reads, writes = step_columns(self.pipeline.steps[position])
+            if writes is not None and needed.isdisjoint(writes):
+                continue
+            if reads is None:
+                return sorted(dependencies + [fit for fit in fit_indices if self.stage_end <= fit <= position])
+            if position in fit_indices:
+                dependencies.append(position)
+            needed.update(reads)
+        return sorted(dependencies)
+
+    """
+    Key of the global state a wave's cleaned rows depend on: the scaling of every min-max step, and the outlier mean
+    only when the wave has values above the threshold (the others are left unchanged by the replacement).
+    """
+    def _finalized_key(self, wave: dict) -> str:
+        states = []
+        for index, step in enumerate(self.pipeline.steps):
+            if step['kind'] == 'min_max':
+                states.append(_step_state(step))
+            elif step['kind'] == 'outlier_mean':
+                maxima = [partial['max'] for partial in wave['stats'][str(index)]['partials'] if partial['count']]
+                replaced = step['has_outliers'] and bool(maxima) and max(maxima) > step['threshold']
+                states.append(_step_state(step) if replaced else None)
+        return _digest(self.manifest['pipeline_key'], states)
+
+    # Runs the stage of a wave through the remaining steps into its cleaned, usage summary and histogram files
+    def _finalize(self, wave: dict) -> None:
+        pipeline, wave_dir = self.pipeline, self._wave_dir(wave['name'])
+        tmp_dir = tempfile.mkdtemp(dir=self.registry_dir, prefix='.tmp-')
+        try:
+            pipeline.summary, histogram, writer = None, UsageHistogram(), None
+            try:
+                for chunk in self._stage_chunks(wave):
+                    chunk = pipeline._apply(chunk, pipeline.steps[self.stage_end:], collect_summary=True)
+                    histogram.update(chunk)
+                    table = pa.Table.from_pandas(apply_cleaned_dtypes(chunk), schema=writer.schema if writer else None, preserve_index=False)
+                    if writer is None:
+                        writer = pq.ParquetWriter(os.path.join(tmp_dir, CLEANED_FILE), table.schema, compression='zstd')
+                    writer.write_table(table)
+            finally:
+                if writer is not None:
+                    writer.close()
+            pipeline.summary.to_parquet(os.path.join(tmp_dir, SUMMARY_FILE), index=False)
+            histogram.to_frame().to_parquet(os.path.join(tmp_dir, HISTOGRAM_FILE), index=False)
+            for filename in (CLEANED_FILE, SUMMARY_FILE, HISTOGRAM_FILE):
+                os.replace(os.path.join(tmp_dir, filename), os.path.join(wave_dir, filename))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    """
+    Adds a raw survey file as a new wave (named after the file unless name is given) and updates the global statistics
+    and the cleaned files that depend on them. Returns the wave's entry with the waves whose statistics were recomputed
+    (refit) and whose cleaned files were rewritten (refinalized). A file already registered raises ValueError.
+    """
+    def append(self, raw_path: str, name: str = None) -> dict:
+        name = name or os.path.splitext(os.path.basename(raw_path))[0]
+        if not WAVE_NAME_PATTERN.fullmatch(name):
+            raise ValueError(f'Wave names may only hold letters, digits, "_", "." and "-", got {name!r}')
+        if name in self.names():
+            raise ValueError(f'A wave named {name!r} is already registered')
+        raw_sha256 = _file_sha256(raw_path)
+        for wave in self.manifest['waves']:
+            if wave['raw_sha256'] == raw_sha256:
+                raise ValueError(f'{raw_path} is already registered as wave {wave["name"]!r}')
+
+        os.makedirs(os.path.join(self.registry_dir, 'waves'), exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=self.registry_dir, prefix='.tmp-')
+        try:
+            rows, quarantined_rows = self._write_stage(raw_path, tmp_dir)
+            os.replace(tmp_dir, self._wave_dir(name))
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        wave = {'name': name, 'raw_path': os.path.abspath(raw_path), 'raw_sha256': raw_sha256, 'rows': rows,
+                'quarantined_rows': quarantined_rows, 'appended': time.strftime('%Y-%m-%dT%H:%M:%S'), 'stats': {}, 'finalized_key': None}
+        self.manifest['waves'].append(wave)
+        self._refresh()
+        return {'name': name, 'rows': rows, 'quarantined_rows': quarantined_rows, **self.last_refresh}
+
+    def names(self) -> list:
+        return [wave['name'] for wave in self.manifest['waves']]
+
+    # The registered waves in append order (name, rows, quarantined rows, append time and raw file)
+    def waves(self) -> pd.DataFrame:
+        return pd.DataFrame([{field: wave[field] for field in ('name', 'rows', 'quarantined_rows', 'appended', 'raw_path')}
+                             for wave in self.manifest['waves']], columns=['name', 'rows', 'quarantined_rows', 'appended', 'raw_path'])
+
+    # Fitted scalers of the min-max steps over every registered wave, in step order
+    def scalers(self) -> list:
+        return self.pipeline.scalers()
+
+    def _selected(self, waves: list = None) -> list:
+        if waves is None:
+            return self.names()
+        unknown = [name for name in waves if name not in self.names()]
+        if unknown:
+            raise KeyError(f'Unknown waves {unknown}, registered: {self.names()}')
+        return list(waves)
+
+    # Paths of the cleaned Parquet partitions of the selected waves (all by default), for readers that scan them directly
+    def cleaned_paths(self, waves: list = None) -> list:
+        return [os.path.join(self._wave_dir(name), CLEANED_FILE) for name in self._selected(waves)]
+
+    """
+    Loads the cleaned rows of the selected waves (all by default), reading only their partitions and the given columns.
+    With wave_col set, a categorical column of that name tells the waves apart.
+    """
+    def load(self, waves: list = None, columns: list = None, wave_col: str = None) -> pd.DataFrame:
+        names = self._selected(waves)
+        frames = [load_cleaned_columnar(path, columns) for path in self.cleaned_paths(names)]
+        if wave_col is not None:
+            frames = [frame.assign(**{wave_col: name}) for frame, name in zip(frames, names)]
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        df = apply_cleaned_dtypes(pd.concat(frames, ignore_index=True))
+        if wave_col is not None:
+            df[wave_col] = pd.Categorical(df[wave_col], categories=names)
+        return df
+
+    # Usage level summary of the selected waves ('Usage Frequency', 'heavy_user'), the sum of their stored summaries
+    def usage_summary(self, waves: list = None) -> pd.DataFrame:
+        summaries = [pd.read_parquet(os.path.join(self._wave_dir(name), SUMMARY_FILE)) for name in self._selected(waves)]
+        if not summaries:
+            return UsageHistogram().usage_summary()
+        summary = summaries[0]
+        for other in summaries[1:]:
+            summary['heavy_user'] += other['heavy_user']
+        return summary
+
+    # UsageHistogram of the selected waves, merged from their stored tables
+    def usage_histogram(self, waves: list = None) -> UsageHistogram:
+        histogram = UsageHistogram()
+        for name in self._selected(waves):
+            histogram.update_from_frame(pd.read_parquet(os.path.join(self._wave_dir(name), HISTOGRAM_FILE)))
+        return histogram
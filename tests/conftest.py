@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src.pipeline import build_default_pipeline
+
+# Creates global constants with the committed raw and cleaned datasets the tests compare against
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+RAW_PATH = os.path.join(DATA_DIR, 'raw', 'Drug_Consumption.csv')
+CLEANED_CSV_PATH = os.path.join(DATA_DIR, 'cleaned', 'cleaned_drug_consumption.csv')
+
+
+@pytest.fixture(scope='session')
+def raw_path() -> str:
+    return RAW_PATH
+
+
+@pytest.fixture(scope='session')
+def cleaned() -> pd.DataFrame:
+    return pd.read_csv(CLEANED_CSV_PATH)
+
+
+# The default cleaning pipeline run once over the raw file, read back like the committed cleaned CSV
+@pytest.fixture(scope='session')
+def pipeline_output(tmp_path_factory) -> pd.DataFrame:
+    output_path = str(tmp_path_factory.mktemp('pipeline') / 'cleaned.csv')
+    build_default_pipeline().run(RAW_PATH, output_path)
+    return pd.read_csv(output_path)
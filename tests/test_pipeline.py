@@ -0,0 +1,13 @@
+import pandas as pd
+
+from src import lazy
+
+
+def test_pipeline_matches_committed_cleaned_csv(pipeline_output, cleaned):
+    pd.testing.assert_frame_equal(pipeline_output, cleaned)
+
+
+# The lazy plan keeps the in-memory dtypes (int8 levels, categorical labels) that the CSV round trip drops
+def test_lazy_cleaning_plan_matches_pipeline(raw_path, pipeline_output):
+    collected = lazy.cleaning_plan(raw_path).collect()
+    pd.testing.assert_frame_equal(collected, pipeline_output, check_dtype=False, check_categorical=False)
@@ -0,0 +1,14 @@
+import numpy as np
+import pandas as pd
+
+from src.respondent_store import RespondentStore
+
+
+def test_take_to_frame_matches_cleaned_rows(cleaned):
+    store = RespondentStore.from_frame(cleaned)
+    # Every heavy user plus every respondent whose usage_frequency was replaced by the dataset-wide mean
+    positions = np.flatnonzero(cleaned['heavy_user'].to_numpy() | (cleaned['usage_frequency'] % 1 != 0).to_numpy())
+
+    frame = store.take(positions).to_frame()
+    expected = cleaned.iloc[positions].reset_index(drop=True)[frame.columns]
+    pd.testing.assert_frame_equal(frame, expected, check_dtype=False, check_categorical=False)
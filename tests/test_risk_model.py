@@ -0,0 +1,11 @@
+import numpy as np
+
+from src.risk_model import RiskModel
+
+
+def test_score_record_matches_predict_proba(cleaned):
+    model = RiskModel().fit(cleaned)
+    features = cleaned[model.numeric_features + model.categorical_features].head(200)
+
+    scores = [model.score_record(record) for record in features.to_dict('records')]
+    np.testing.assert_allclose(scores, model.predict_proba(features), rtol=1e-9)
@@ -0,0 +1,19 @@
+import pandas as pd
+
+from src.pipeline import build_default_pipeline
+from src.storage import apply_cleaned_dtypes
+from src.wave_registry import WaveRegistry
+
+
+def test_two_waves_match_single_file_run(raw_path, tmp_path):
+    raw = pd.read_csv(raw_path)
+    middle = len(raw) // 2
+    registry = WaveRegistry(str(tmp_path / 'registry'))
+    for name, part in [('wave0', raw.iloc[:middle]), ('wave1', raw.iloc[middle:])]:
+        part.to_csv(tmp_path / f'{name}.csv', index=False)
+        registry.append(str(tmp_path / f'{name}.csv'))
+
+    single_path = str(tmp_path / 'single.csv')
+    summary = build_default_pipeline().run(raw_path, single_path)
+    pd.testing.assert_frame_equal(registry.load(), apply_cleaned_dtypes(pd.read_csv(single_path)), check_categorical=False)
+    pd.testing.assert_frame_equal(registry.usage_summary(), summary)